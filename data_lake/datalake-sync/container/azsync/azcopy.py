@@ -1,13 +1,19 @@
 #!/usr/bin/env python3
 # -*- coding: utf8 -*-
+import collections
+import json
 import logging
 import os
 import re
 import subprocess
+import tempfile
+import threading
+import urllib.parse
 
 from pathlib import Path
 
 from .fileutils import PartialStats
+from .utilities import urljoin, urlquote
 
 
 EXECUTABLE = "azure-storage-azcopy"
@@ -20,6 +26,9 @@ NOT_AUTHENTICATED = "__NotAuthenticated__"
 
 AZCOPY_LOG_LEVELS = ("NONE", "DEBUG", "INFO", "WARNING", "ERROR", "PANIC", "FATAL")
 
+# Maximum number of (non-response) lines of azcopy output kept for logging
+MAX_LOG_LINES = 1000
+
 
 def _require_login(func):
     def _inner(self, *args, **kwargs):
@@ -69,6 +78,13 @@ _AZCOPY_ERRORS = {
 
 
 class AZCopy:
+    # azcopy does not report the hashes it calculates while uploading files
+    hashes_uploads = False
+    # azcopy does not report the MD5 acknowledged by Azure for uploads
+    verifies_uploads = False
+    # Each lookup runs azcopy, so larger sets of paths are looked up via a listing
+    max_md5_lookups = 16
+
     def __init__(self, tenant_id, app_id, secret):
         self._log = logging.getLogger(__name__)
 
@@ -84,6 +100,9 @@ class AZCopy:
         self._app_id = app_id.strip()
         self._secret = secret.strip()
         self._log_level = None
+        self._cap_mbps = None
+        # Serializes logins/logouts when the client is shared between threads
+        self._login_lock = threading.RLock()
 
         self.exec = EXECUTABLE
 
@@ -93,6 +112,24 @@ class AZCopy:
 
         self._log_level = log_level
 
+    def set_bandwidth_cap(self, cap_mbps):
+        """Limits the bandwidth used by each azcopy job to 'cap_mbps' megabits per
+        second; None or 0 disables the limit. 'cap_mbps' may also be a function
+        returning the current cap, which is called as each job is started.
+        """
+        if not callable(cap_mbps):
+            _check_bandwidth_cap(cap_mbps)
+
+        self._cap_mbps = cap_mbps or None
+
+    def bandwidth_cap(self):
+        """Returns the current bandwidth cap in megabits per second, or None."""
+        cap_mbps = self._cap_mbps
+        if callable(cap_mbps):
+            cap_mbps = _check_bandwidth_cap(cap_mbps())
+
+        return cap_mbps or None
+
     def is_logged_in(self):
         """Returns true if login() was successfully called."""
         return self._logged_in
@@ -102,6 +139,10 @@ class AZCopy:
         false otherwise. This operation will be run regardless of the number of the
         number of remaining tries.
         """
+        with self._login_lock:
+            return self._login()
+
+    def _login(self):
         log = logging.getLogger("azcopy.login")
         if self._logged_in:
             log.debug("skipping login; already logged in")
@@ -136,13 +177,14 @@ class AZCopy:
         the client was already logged out, false otherwise.
         """
         log = logging.getLogger("azcopy.logout")
-        if not self._logged_in:
-            log.debug("skipping logout; already logged out")
-            return True
+        with self._login_lock:
+            if not self._logged_in:
+                log.debug("skipping logout; already logged out")
+                return True
 
-        log.info("logging out of azure client")
-        self._run_command(command=[self.exec, "logout"], log=log)
-        self._logged_in = False
+            log.info("logging out of azure client")
+            self._run_command(command=[self.exec, "logout"], log=log)
+            self._logged_in = False
 
     @_require_login
     def copy(self, src_file, dst_url):
@@ -157,6 +199,62 @@ class AZCopy:
             log=log,
         )
 
+    @_require_login
+    def copy_many(self, file_map, dst_url):
+        """Attempts to copy multiple local files to 'dst_url' using a single azcopy
+        job, where 'file_map' is a dict of {destination path: local file}. Destination
+        paths must be relative to 'dst_url'. Returns the set of keys in 'file_map'
+        that failed to upload, if the job reported per-file failures. Raises an
+        AZError if the job failed without a per-file summary.
+        """
+        log = logging.getLogger("azcopy.copy_many")
+        log.info("copying %i files to %r", len(file_map), dst_url)
+
+        keys = _validate_destinations(file_map)
+        with tempfile.TemporaryDirectory(prefix="azsync_") as staging_dir:
+            # Files are staged as symlinks, allowing arbitrary destination paths
+            for key, src_file in file_map.items():
+                log.debug("staging '%s' as '%s'", src_file, key)
+                link = Path(staging_dir) / key
+                link.parent.mkdir(parents=True, exist_ok=True)
+                link.symlink_to(Path(src_file).absolute())
+
+            # Job output is requested as JSON, in order to get per-file results
+            messages = []
+            try:
+                self._run_command(
+                    command=self._command(
+                        "copy",
+                        "--put-md5",
+                        "--recursive",
+                        "--follow-symlinks",
+                        "--output-type",
+                        "json",
+                        os.path.join(staging_dir, "*"),
+                        dst_url,
+                    ),
+                    log=log,
+                    response_prefix="{",
+                    responses=messages,
+                )
+            except AZError:
+                summary = _parse_job_summary(log, messages)
+                if not (summary and summary.get("FailedTransfers")):
+                    raise
+            else:
+                summary = _parse_job_summary(log, messages)
+
+        failed = set()
+        for transfer in (summary or {}).get("FailedTransfers") or ():
+            key = _failed_transfer_key(transfer, keys, staging_dir, dst_url)
+            if key is None:
+                raise AZError(f"unexpected failed transfer {transfer!r}")
+
+            log.warning("failed to copy '%s' to %r", file_map[key], dst_url)
+            failed.add(key)
+
+        return failed
+
     @_require_login
     def remove(self, dst_url):
         """Attempts to remove remote file at 'dst_url'; returns true on success and
@@ -192,18 +290,36 @@ class AZCopy:
         )
 
     @_require_login
-    def list_md5s(self, dst_url):
+    def list_md5s(self, dst_url, paths=None):
+        """Returns a dict of {relative path: PartialStats} for files in 'dst_url'. If
+        'paths' is set, only stats for those (relative) paths are returned, and only
+        those are looked up if there are no more than 'max_md5_lookups' of them.
+        """
+        if paths is not None and len(paths) <= self.max_md5_lookups:
+            return _lookup_md5s(self, dst_url, paths)
+
+        return {
+            key: value
+            for key, value in self.iter_md5s(dst_url)
+            if paths is None or key in paths
+        }
+
+    @_require_login
+    def iter_md5s(self, dst_url):
+        """Yields (relative path, PartialStats) for files in 'dst_url' as they are
+        listed by azcopy. Errors are raised once the listing has been consumed.
+        """
         log = logging.getLogger("azcopy.sync")
         log.info("listing MD5 hashes for %r", dst_url)
 
-        return self._md5s(log, [self.exec, "list_md5s", dst_url])
+        return self._iter_md5s(log, [self.exec, "list_md5s", dst_url])
 
     @_require_login
     def get_md5(self, dst_url):
         log = logging.getLogger("azcopy.sync")
         log.info("getting MD5 hash for %r", dst_url)
 
-        md5_hashes = self._md5s(log, [self.exec, "get_md5", dst_url])
+        md5_hashes = dict(self._iter_md5s(log, [self.exec, "get_md5", dst_url]))
         if len(md5_hashes) != 1:
             raise AZError(f"get_md5 returned {md5_hashes!r}")
 
@@ -211,49 +327,70 @@ class AZCopy:
 
         return value
 
-    def _md5s(self, log, command):
-        """Retrieves a list of filenames, sizes, and MD5 hashes at 'dst_url', and
-        returns a dict of {filename: (size, hash)}.
+    def _iter_md5s(self, log, command):
+        """Runs a command listing filenames, sizes, and MD5 hashes, and yields each
+        (filename, PartialStats) as it is written by azcopy.
         """
-        result = {}
-        for line in self._run_command(command, log=log, response_prefix="MD5: "):
+        for line in self._iter_command(command, log=log, response_prefix="MD5: "):
             line = line[5:]
             # Note that MD5 may be an empty string here, which is treated differently
             # from None (i.e. not a wildcard). See PartialStats.__eq__.
             md5, size, filename = (value.strip() for value in line.split("\t", 2))
 
             # Path normalizes server (posix) and client (posix or Windows) paths
-            result[Path(filename)] = PartialStats(size=int(size), hash=md5.upper())
+            yield Path(filename), PartialStats(size=int(size), hash=md5.upper())
+
+    @classmethod
+    def _run_command(cls, command, log, response_prefix=None, responses=None, **kwargs):
+        """Runs an azcopy command and returns lines starting with 'response_prefix'.
+        If 'responses' is a list, these lines are also added to that list, allowing
+        them to be inspected if the command fails.
+        """
+        lines = [] if responses is None else responses
+        for line in cls._iter_command(command, log, response_prefix, **kwargs):
+            lines.append(line)
 
-        return result
+        return lines
 
     @classmethod
-    def _run_command(cls, command, log, response_prefix=None, **kwargs):
+    def _iter_command(cls, command, log, response_prefix=None, **kwargs):
+        """Runs an azcopy command and yields lines starting with 'response_prefix'
+        as they are written. Other lines are logged once the command has finished,
+        but only the last MAX_LOG_LINES lines are kept. Errors are raised once all
+        output has been read; the command is killed if the generator is closed.
+        """
         log.debug("running command %r", command)
         proc = _popen(command, **kwargs)
 
-        lines = []
-        log_lines = []
+        log_lines = collections.deque(maxlen=MAX_LOG_LINES)
+        num_log_lines = 0
         error = None
 
-        for line in proc.stdout:
-            # Progress updates stars with a carriage return; these are excluded to
-            # avoid bloating the file/memory log with a large amount of noise
-            if line.startswith(b"\r"):
-                continue
-
-            error_code = _ERROR_CODE_RE.search(line)
-            if error_code:
-                (error,) = error_code.groups()
-                error = error.decode("utf-8")
-            elif _NOT_AUTHENTICATED in line:
-                error = NOT_AUTHENTICATED
-
-            line = line.decode("utf-8").strip()
-            if response_prefix and line.startswith(response_prefix):
-                lines.append(line)
-            else:
-                log_lines.append(line)
+        try:
+            for line in proc.stdout:
+                # Progress updates stars with a carriage return; these are excluded to
+                # avoid bloating the file/memory log with a large amount of noise
+                if line.startswith(b"\r"):
+                    continue
+
+                error_code = _ERROR_CODE_RE.search(line)
+                if error_code:
+                    (error,) = error_code.groups()
+                    error = error.decode("utf-8")
+                elif _NOT_AUTHENTICATED in line:
+                    error = NOT_AUTHENTICATED
+
+                line = line.decode("utf-8").strip()
+                if response_prefix and line.startswith(response_prefix):
+                    yield line
+                else:
+                    log_lines.append(line)
+                    num_log_lines += 1
+        except GeneratorExit:
+            log.debug("terminating command %r", command)
+            proc.kill()
+            proc.wait()
+            raise
 
         proc.wait()
 
@@ -265,6 +402,10 @@ class AZCopy:
         log.log(loglevel, "command returned %i", proc.wait())
 
         shelllog = logging.getLogger(log.name + ".shell")
+        if num_log_lines > len(log_lines):
+            skipped = num_log_lines - len(log_lines)
+            shelllog.log(loglevel, "[%i earlier lines not logged]", skipped)
+
         for line in log_lines:
             line = line.rstrip()
             if line:
@@ -276,14 +417,17 @@ class AZCopy:
 
             raise _AZCOPY_ERRORS.get(error, AZError)(error)
 
-        return lines
-
     def _command(self, subcommand, *args):
         call = [self.exec, subcommand]
         if self._log_level is not None:
             call.append("--log-level")
             call.append(self._log_level)
 
+        cap_mbps = self.bandwidth_cap()
+        if cap_mbps is not None:
+            call.append("--cap-mbps")
+            call.append(str(cap_mbps))
+
         call.extend(args)
 
         return call
@@ -296,6 +440,76 @@ class AZCopy:
             self.logout()
 
 
+def _check_bandwidth_cap(cap_mbps):
+    if cap_mbps is not None and not (
+        isinstance(cap_mbps, (int, float)) and cap_mbps >= 0
+    ):
+        raise ValueError(f"cap_mbps must be >= 0, not {cap_mbps!r}")
+
+    return cap_mbps
+
+
+def _validate_destinations(file_map):
+    """Checks that keys in a copy_many 'file_map' are valid and non-overlapping
+    relative paths; returns a dict of {Path(key): key}.
+    """
+    keys = {}
+    for key in file_map:
+        path = Path(key)
+        if path.is_absolute() or ".." in path.parts or not path.parts:
+            raise ValueError(f"invalid destination path {str(path)!r}")
+        elif path in keys:
+            raise ValueError(f"duplicate destination path {str(path)!r}")
+
+        keys[path] = key
+
+    for path in keys:
+        for parent in path.parents:
+            if parent in keys:
+                raise ValueError(f"destination path {str(path)!r} is inside file")
+
+    return keys
+
+
+def _failed_transfer_key(transfer, keys, staging_dir, dst_url):
+    """Returns the copy_many key for a failed transfer, based on the staged source
+    path, or on the destination URL; returns None if neither matched a key.
+    """
+    src = transfer.get("Src") or ""
+    if src.startswith(os.path.join(staging_dir, "")):
+        key = keys.get(Path(os.path.relpath(src, staging_dir)))
+        if key is not None:
+            return key
+
+    dst = (transfer.get("Dst") or "").partition("?")[0]
+    dst_prefix = dst_url.partition("?")[0].rstrip("/") + "/"
+    if dst.startswith(dst_prefix):
+        return keys.get(Path(urllib.parse.unquote(dst[len(dst_prefix) :])))
+
+    return None
+
+
+def _parse_job_summary(log, messages):
+    """Logs azcopy JSON output messages and returns the end-of-job summary, if any."""
+    summary = None
+    for line in messages:
+        try:
+            message = json.loads(line)
+            message_type = message.get("MessageType")
+            content = message.get("MessageContent", "")
+
+            if message_type == "EndOfJob":
+                summary = json.loads(content)
+            elif message_type == "Error":
+                log.warning("%s", content.strip())
+            elif message_type in ("Info", "Init"):
+                log.debug("%s", content.strip())
+        except (AttributeError, ValueError):
+            log.debug("%s", line)
+
+    return summary
+
+
 def _popen(command, env=None):
     return subprocess.Popen(
         command,
@@ -310,3 +524,17 @@ _ERROR_CODE_RE = re.compile(rb"X-Ms-Error-Code: \[(\w+)\]")
 _NOT_AUTHENTICATED = (
     b"no SAS token or OAuth token is present and the resource is not public"
 )
+
+
+def _lookup_md5s(client, dst_url, paths):
+    """Looks up stats for each of 'paths' in 'dst_url' using 'client.get_md5'; paths
+    not found on Azure are not included in the returned dict.
+    """
+    result = {}
+    for path in sorted(paths):
+        try:
+            result[path] = client.get_md5(urljoin(dst_url, urlquote(path)))
+        except AZFileNotFoundError:
+            pass
+
+    return result
@@ -0,0 +1,165 @@
+import fcntl
+import json
+import logging
+import os
+import time
+import uuid
+
+from datetime import datetime
+from pathlib import Path
+
+# Relative share of the bandwidth cap used by processes of each priority class
+PRIORITY_CLASSES = {"low": 1, "normal": 2, "high": 4}
+
+
+def parse_hours(value):
+    """Parses a range of hours of the form 'HH:MM-HH:MM', returning a tuple of
+    (start, end) in minutes since midnight. The range may wrap around midnight.
+    """
+    try:
+        start, end = value.split("-")
+        result = []
+        for timestamp in (start, end):
+            hours, _, minutes = timestamp.strip().partition(":")
+            hours = int(hours)
+            minutes = int(minutes or 0)
+            if not (0 <= hours <= 24 and 0 <= minutes < 60):
+                raise ValueError(timestamp)
+
+            result.append((hours * 60 + minutes) % (24 * 60))
+    except ValueError:
+        raise ValueError(f"invalid range of hours {value!r}; expected HH:MM-HH:MM")
+
+    return tuple(result)
+
+
+class BandwidthProfile:
+    """Bandwidth caps in megabits per second for day and night; a cap of None or 0
+    means no limit. The day cap applies at all times if 'night_mbps' is None.
+    """
+
+    def __init__(self, day_mbps, night_mbps=None, night_hours=(22 * 60, 6 * 60)):
+        for name, value in (("day_mbps", day_mbps), ("night_mbps", night_mbps)):
+            if value is not None and not (
+                isinstance(value, (int, float)) and value >= 0
+            ):
+                raise ValueError(f"{name} must be >= 0, not {value!r}")
+
+        self.day_mbps = day_mbps or None
+        self.night_mbps = self.day_mbps if night_mbps is None else night_mbps or None
+        self.night_hours = tuple(night_hours)
+
+    def is_night(self, when=None):
+        when = datetime.now() if when is None else when
+        start, end = self.night_hours
+        minutes = when.hour * 60 + when.minute
+        if start <= end:
+            return start <= minutes < end
+
+        return minutes >= start or minutes < end
+
+    def cap_mbps(self, when=None):
+        """Returns the cap at the local time 'when' (default now), or None."""
+        return self.night_mbps if self.is_night(when) else self.day_mbps
+
+
+class BandwidthBudget:
+    """Divides the cap of a BandwidthProfile between concurrent azsync processes,
+    weighted by their priority class. Each process holds a lease in the shared
+    folder 'root', which is locked for as long as the process is running, so that
+    leases of processes that were killed can be recognized and removed. Without a
+    folder the full cap is used by this process.
+
+    The current share is re-calculated at most every 'refresh' seconds.
+    """
+
+    def __init__(self, profile, priority="normal", root=None, refresh=30.0):
+        if priority not in PRIORITY_CLASSES:
+            raise ValueError(f"unknown priority class {priority!r}")
+
+        self.profile = profile
+        self.priority = priority
+        self.root = None if root is None else Path(root)
+        self._refresh = refresh
+        self._lease = None
+        self._handle = None
+        self._share = 1.0
+        self._next_refresh = 0.0
+
+        if self.root is not None:
+            self._acquire_lease()
+
+    def cap_mbps(self, workers=1):
+        """Returns the current cap for this process divided by 'workers', or None if
+        there is no limit.
+        """
+        cap_mbps = self.profile.cap_mbps()
+        if not cap_mbps:
+            return None
+
+        return cap_mbps * self.share() / workers
+
+    def share(self):
+        """Returns the fraction of the cap available to this process."""
+        if self.root is not None and time.monotonic() >= self._next_refresh:
+            weights = self._read_weights()
+            self._share = PRIORITY_CLASSES[self.priority] / max(1, sum(weights))
+            self._next_refresh = time.monotonic() + self._refresh
+
+        return self._share
+
+    def close(self):
+        if self._handle is not None:
+            try:
+                self._lease.unlink()
+            except FileNotFoundError:
+                pass
+
+            self._handle.close()
+            self._handle = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def _acquire_lease(self):
+        log = logging.getLogger(__name__)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+        # The lease is locked before it is made visible to other processes
+        name = uuid.uuid4().hex
+        filepath = self.root / f"{name}.tmp"
+        self._handle = filepath.open("w", encoding="utf-8")
+        fcntl.flock(self._handle, fcntl.LOCK_EX)
+        json.dump({"priority": self.priority, "pid": os.getpid()}, self._handle)
+        self._handle.flush()
+
+        self._lease = filepath.rename(self.root / f"{name}.lease")
+        log.info("sharing bandwidth cap with %s priority", self.priority)
+
+    def _read_weights(self):
+        """Returns the weights of live leases, including that of this process."""
+        log = logging.getLogger(__name__)
+        weights = [PRIORITY_CLASSES[self.priority]]
+        for filepath in self.root.glob("*.lease"):
+            if filepath == self._lease:
+                continue
+
+            try:
+                with filepath.open("r", encoding="utf-8") as handle:
+                    try:
+                        fcntl.flock(handle, fcntl.LOCK_SH | fcntl.LOCK_NB)
+                    except BlockingIOError:
+                        # The lease is held by a running process
+                        data = json.load(handle)
+                        weights.append(PRIORITY_CLASSES.get(data.get("priority"), 1))
+                    else:
+                        log.debug("removing stale bandwidth lease '%s'", filepath)
+                        filepath.unlink()
+            except (FileNotFoundError, ValueError):
+                # Removed by another process or not a valid lease
+                continue
+
+        return weights
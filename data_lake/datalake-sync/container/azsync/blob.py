@@ -0,0 +1,624 @@
+#!/usr/bin/env python3
+# -*- coding: utf8 -*-
+"""Native Azure Blob Storage backend implementing the AZCopy client API.
+
+Requires the optional 'azure-identity' and 'azure-storage-blob' packages.
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+import urllib.parse
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from .azcopy import (
+    AZCopy,
+    AZError,
+    AZFileNotFoundError,
+    AZLoginError,
+    AZUnknownError,
+    BLOB_NOT_FOUND,
+    _lookup_md5s,
+    _require_login,
+)
+from .fileutils import FastHasher, PartialStats, collect_files
+from .utilities import urljoin, urlquote
+
+
+class AZBlobClient:
+    """Client with the same API as AZCopy, but which performs copy, remove, and MD5
+    lookups in-process using one keep-alive connection pool per storage account.
+    Logins are performed using azcopy, as is folder synchronization unless a hash
+    cache or upload checkpoints have been set using set_hash_cache/set_checkpoints.
+    """
+
+    # Blobs are listed 5000 at a time, so lookups are only used for small sets of paths
+    max_md5_lookups = 64
+    # Size of blocks used for resumable uploads; smaller files are uploaded as is
+    block_size = 8 * 1024 * 1024
+
+    def __init__(
+        self,
+        tenant_id,
+        app_id,
+        secret,
+        max_connections=4,
+        max_uploads=1,
+        max_upload_bytes=None,
+    ):
+        if not (isinstance(max_connections, int) and max_connections > 0):
+            raise ValueError(f"max_connections must be > 0, not {max_connections!r}")
+        elif not (isinstance(max_uploads, int) and max_uploads > 0):
+            raise ValueError(f"max_uploads must be > 0, not {max_uploads!r}")
+        elif max_upload_bytes is not None and not (
+            isinstance(max_upload_bytes, int) and max_upload_bytes > 0
+        ):
+            raise ValueError(
+                f"max_upload_bytes must be None or > 0, not {max_upload_bytes!r}"
+            )
+
+        # Validates credentials and is used for logins and for 'sync'
+        self._azcopy = AZCopy(tenant_id=tenant_id, app_id=app_id, secret=secret)
+        self._tenant_id = tenant_id.strip()
+        self._app_id = app_id.strip()
+        self._secret = secret.strip()
+        self._max_connections = max_connections
+        self._max_uploads = max_uploads
+        self._max_upload_bytes = max_upload_bytes
+        self._lazy_verification = False
+        self._hash_cache = None
+        self._checkpoints = None
+        self._credential = None
+        self._services = {}
+        # Guards the credential and the per-account services when shared by threads
+        self._lock = threading.RLock()
+
+    def set_log_level(self, log_level):
+        self._azcopy.set_log_level(log_level)
+
+    def set_bandwidth_cap(self, cap_mbps):
+        """Limits the bandwidth used by each upload, and by each azcopy job (i.e.
+        'sync'), to 'cap_mbps' megabits per second; None or 0 disables the limit.
+        'cap_mbps' may also be a function returning the current cap, which is called
+        as each upload is started.
+        """
+        self._azcopy.set_bandwidth_cap(cap_mbps)
+
+    def bandwidth_cap(self):
+        """Returns the current bandwidth cap in megabits per second, or None."""
+        return self._azcopy.bandwidth_cap()
+
+    @property
+    def hashes_uploads(self):
+        """True if hashes calculated while uploading files are added to the hash
+        cache, allowing tasks to skip hashing files before uploading them.
+        """
+        return self._hash_cache is not None
+
+    @property
+    def verifies_uploads(self):
+        """True if the stats returned by 'copy' and 'write' may be trusted as proof
+        that the blob matches the local data, without looking up its MD5 afterwards.
+        """
+        return self._lazy_verification
+
+    def set_lazy_verification(self, enabled):
+        """Lets tasks accept the MD5 of an upload as verification, if 'enabled'. Each
+        request of an upload is validated by Azure using its MD5, and the MD5 of the
+        whole file is calculated from the data sent, so a blob can only differ from
+        the file if the file was modified during the upload, which 'copy' detects.
+        """
+        self._lazy_verification = bool(enabled)
+
+    def set_hash_cache(self, hash_cache):
+        """Records MD5 hashes calculated while uploading files in 'hash_cache', so
+        that uploaded files need not be read again in order to verify the upload.
+        Folders are then synchronized using the native client instead of azcopy.
+        """
+        self._hash_cache = hash_cache
+
+    def set_checkpoints(self, state):
+        """Uploads files larger than 'block_size' one block at a time, recording the
+        blocks staged on Azure in 'state' (a PersistentState). Interrupted uploads are
+        then resumed from the staged blocks, rather than restarted. Folders are then
+        synchronized using the native client instead of azcopy.
+        """
+        self._checkpoints = state
+
+    def is_logged_in(self):
+        """Returns true if login() was successfully called."""
+        return self._credential is not None
+
+    def login(self):
+        """Logs in using azcopy and creates credentials for the native client; returns
+        true on success. Raises AZLoginError on failure.
+        """
+        with self._lock:
+            if self._credential is not None:
+                return True
+
+            from azure.identity import ClientSecretCredential
+
+            self._azcopy.login()
+            self._credential = ClientSecretCredential(
+                tenant_id=self._tenant_id,
+                client_id=self._app_id,
+                client_secret=self._secret,
+            )
+
+            return True
+
+    def logout(self):
+        """Closes open connections and logs out of azcopy."""
+        with self._lock:
+            for service in self._services.values():
+                service.close()
+            self._services.clear()
+
+            if self._credential is not None:
+                self._credential.close()
+                self._credential = None
+
+            return self._azcopy.logout()
+
+    @_require_login
+    def copy(self, src_file, dst_url):
+        """Attempts to copy local 'src_file' to 'dst_url', setting the Content-MD5
+        property of the blob. The MD5 is calculated while the file is uploaded, so
+        that the file is only read once, and each request is validated by Azure.
+
+        Returns the PartialStats of the uploaded file, or None if the file was
+        modified during the upload. Raises an AZError on failure.
+        """
+        return self._copy(src_file, dst_url, self.bandwidth_cap())
+
+    def _copy(self, src_file, dst_url, cap_mbps):
+        log = logging.getLogger("azblob.copy")
+        log.info("copying '%s' to %r", src_file, dst_url)
+
+        from azure.storage.blob import ContentSettings
+
+        # The fast digest is recorded alongside the MD5, so that it is not lost
+        fast_hasher = None
+        if self._hash_cache is not None and self._hash_cache.fast_digests:
+            fast_hasher = FastHasher()
+        hashers = () if fast_hasher is None else (fast_hasher,)
+
+        blob_client = self._blob_client(dst_url)
+        with _AzureErrors(log), open(src_file, "rb") as handle:
+            before = os.fstat(handle.fileno())
+            if self._checkpoints is not None and before.st_size > self.block_size:
+                md5 = self._upload_blocks(
+                    log, blob_client, handle, dst_url, before, cap_mbps, hashers
+                )
+            else:
+                stream = _UploadStream(handle, cap_mbps=cap_mbps, hashers=hashers)
+                blob_client.upload_blob(
+                    stream,
+                    length=before.st_size,
+                    overwrite=True,
+                    validate_content=True,
+                    max_concurrency=self._max_connections,
+                )
+                md5 = stream.md5
+
+            md5 = bytearray(md5.digest())
+            blob_client.set_http_headers(
+                content_settings=ContentSettings(content_md5=md5)
+            )
+
+        after = os.stat(src_file)
+        if (before.st_size, before.st_mtime) != (after.st_size, after.st_mtime):
+            log.warning("'%s' was modified while being uploaded", src_file)
+            return None
+
+        stats = PartialStats(
+            hash=md5.hex().upper(), size=before.st_size, mtime=before.st_mtime
+        )
+
+        if self._hash_cache is not None:
+            digest = None if fast_hasher is None else fast_hasher.hexdigest()
+            self._hash_cache.set(src_file, stats, digest=digest)
+            self._hash_cache.commit()
+
+        return stats
+
+    @_require_login
+    def write(self, data, dst_url):
+        """Writes 'data' (bytes) to 'dst_url' using a single request that sets the
+        Content-MD5 of the blob. Returns the PartialStats of the blob, or None if the
+        MD5 acknowledged by Azure did not match the data. Raises an AZError on failure.
+        """
+        log = logging.getLogger("azblob.write")
+        log.info("writing %i bytes to %r", len(data), dst_url)
+
+        from azure.storage.blob import ContentSettings
+
+        md5 = hashlib.md5(data).digest()
+        with _AzureErrors(log):
+            response = self._blob_client(dst_url).upload_blob(
+                data,
+                length=len(data),
+                overwrite=True,
+                validate_content=True,
+                content_settings=ContentSettings(content_md5=bytearray(md5)),
+            )
+
+        # Azure returns the MD5 of the content it received for single-request uploads
+        acknowledged = (response or {}).get("content_md5")
+        if acknowledged and bytes(acknowledged) != md5:
+            log.warning("MD5 mismatch for %r: %s", dst_url, bytes(acknowledged).hex())
+            return None
+
+        return PartialStats(hash=md5.hex().upper(), size=len(data))
+
+    @_require_login
+    def copy_many(self, file_map, dst_url):
+        """Attempts to copy multiple local files to 'dst_url', where 'file_map' is a
+        dict of {destination path: local file}. Returns the set of keys that failed
+        due to errors reported by Azure for that file. Other errors, which are
+        likely to affect every file, are raised as AZErrors, and no further uploads
+        are started.
+
+        Up to 'max_uploads' files are uploaded concurrently, with at most
+        'max_upload_bytes' of files being uploaded at once; larger files are uploaded
+        on their own. The bandwidth cap is divided between concurrent uploads.
+        """
+        log = logging.getLogger("azblob.copy_many")
+
+        keys = sorted(file_map, key=Path)
+        workers = max(1, min(self._max_uploads, len(keys)))
+        budget = _ByteBudget(self._max_upload_bytes)
+        aborted = threading.Event()
+
+        def _upload(key, size):
+            try:
+                if not aborted.is_set():
+                    dst_file_url = urljoin(dst_url, urlquote(Path(key)))
+                    cap_mbps = self.bandwidth_cap()
+                    if cap_mbps is not None:
+                        cap_mbps /= workers
+
+                    self._copy(file_map[key], dst_file_url, cap_mbps)
+            except (AZLoginError, AZUnknownError):
+                aborted.set()
+                raise
+            finally:
+                budget.release(size)
+
+        uploads = []
+        with ThreadPoolExecutor(workers, thread_name_prefix="upload") as executor:
+            for key in keys:
+                size = _file_size(file_map[key])
+                budget.acquire(size)
+                if aborted.is_set():
+                    budget.release(size)
+                    break
+
+                uploads.append((key, executor.submit(_upload, key, size)))
+
+        failed = set()
+        for key, future in uploads:
+            try:
+                future.result()
+            except (AZLoginError, AZUnknownError):
+                raise
+            except AZError as error:
+                log.warning("failed to copy '%s': %s", file_map[key], error)
+                failed.add(key)
+
+        return failed
+
+    @_require_login
+    def remove(self, dst_url):
+        """Attempts to remove remote file at 'dst_url'; raises an AZError on failure."""
+        log = logging.getLogger("azblob.remove")
+        log.info("removing %r", dst_url)
+
+        with _AzureErrors(log):
+            self._blob_client(dst_url).delete_blob()
+
+    @_require_login
+    def sync(self, src_dir, dst_url, rm_dst=False):
+        """Synchronizes local folder 'src_dir' to 'dst_url'. If a hash cache has been
+        set, files are uploaded using the native client, and are hashed while being
+        uploaded. Otherwise the folder is synchronized using azcopy.
+
+        Like azcopy, files are uploaded if missing on Azure, if the size differs, or
+        if the local file is newer than the blob. If 'rm_dst' is true, files found
+        only at the destination will be removed.
+        """
+        if self._hash_cache is None and self._checkpoints is None:
+            return self._azcopy.sync(src_dir, dst_url, rm_dst=rm_dst)
+
+        log = logging.getLogger("azblob.sync")
+        log.info("syncing %r to %r", src_dir, dst_url)
+
+        src_dir = Path(src_dir)
+        remote_blobs = self._list_blobs(log, dst_url)
+        for filepath, stats in sorted(collect_files(src_dir).items()):
+            key = filepath.relative_to(src_dir)
+            blob = remote_blobs.pop(key, None)
+
+            if (
+                blob is None
+                or blob.size != stats.size
+                or blob.last_modified.timestamp() < stats.mtime
+            ):
+                self.copy(filepath, urljoin(dst_url, urlquote(key)))
+
+        if rm_dst:
+            for key in sorted(remote_blobs):
+                self.remove(urljoin(dst_url, urlquote(key)))
+
+    @_require_login
+    def list_md5s(self, dst_url, paths=None):
+        """Returns a dict of {relative path: PartialStats} for files in 'dst_url'. If
+        'paths' is set, only stats for those (relative) paths are returned, and only
+        those are looked up if there are no more than 'max_md5_lookups' of them.
+        """
+        if paths is not None and len(paths) <= self.max_md5_lookups:
+            return _lookup_md5s(self, dst_url, paths)
+
+        return {
+            key: value
+            for key, value in self.iter_md5s(dst_url)
+            if paths is None or key in paths
+        }
+
+    @_require_login
+    def iter_md5s(self, dst_url):
+        """Yields (relative path, PartialStats) for files in 'dst_url' as each page
+        of blobs is listed.
+        """
+        log = logging.getLogger("azblob.list_md5s")
+        log.info("listing MD5 hashes for %r", dst_url)
+
+        return (
+            (key, _blob_stats(blob)) for key, blob in self._iter_blobs(log, dst_url)
+        )
+
+    @_require_login
+    def get_md5(self, dst_url):
+        log = logging.getLogger("azblob.get_md5")
+        log.info("getting MD5 hash for %r", dst_url)
+
+        with _AzureErrors(log):
+            return _blob_stats(self._blob_client(dst_url).get_blob_properties())
+
+    def _upload_blocks(
+        self, log, blob_client, handle, dst_url, filestat, cap_mbps, hashers=()
+    ):
+        """Uploads 'handle' as a list of blocks, skipping blocks staged by previous
+        attempts; returns the MD5 hash object for the file. Block IDs include the
+        MD5 of the block, so that a staged block is only used if it matches the file.
+        Every block is also passed to the (optional) 'hashers'.
+        """
+        from azure.core.exceptions import ResourceNotFoundError
+        from azure.storage.blob import BlobBlock
+
+        stats = PartialStats(size=filestat.st_size, mtime=filestat.st_mtime)
+        staged = self._checkpoints.get_staged_blocks(dst_url, stats)
+        if staged:
+            # Azure discards uncommitted blocks after a week, or when a blob is written
+            try:
+                _, uncommitted = blob_client.get_block_list("uncommitted")
+            except ResourceNotFoundError:
+                uncommitted = ()
+
+            staged &= {block.id for block in uncommitted}
+            log.info("resuming upload; %i blocks already staged", len(staged))
+
+        md5 = hashlib.md5()
+        throttle = _Throttle(cap_mbps)
+        block_ids = []
+        while True:
+            data = handle.read(self.block_size)
+            if not data:
+                break
+
+            md5.update(data)
+            for hasher in hashers:
+                hasher.update(data)
+
+            block_id = _block_id(len(block_ids), data)
+            block_ids.append(block_id)
+
+            if block_id not in staged:
+                throttle.begin()
+                # Each block is verified by Azure using its MD5 before it is staged
+                blob_client.stage_block(block_id, data, validate_content=True)
+                throttle.wait(len(data))
+
+                self._checkpoints.add_staged_block(dst_url, stats, block_id)
+
+        blob_client.commit_block_list([BlobBlock(block_id=key) for key in block_ids])
+        self._checkpoints.clear_staged_blocks(dst_url)
+
+        return md5
+
+    def _list_blobs(self, log, dst_url):
+        """Returns a dict of {relative path: blob properties} for blobs in 'dst_url'."""
+        return dict(self._iter_blobs(log, dst_url))
+
+    def _iter_blobs(self, log, dst_url):
+        """Yields (relative path, blob properties) for blobs in 'dst_url'."""
+        account_url, container, prefix = _split_url(dst_url)
+        # Trailing slash required to match azcopy behavior for folders
+        prefix = prefix.rstrip("/") + "/" if prefix.strip("/") else ""
+
+        client = self._service(account_url).get_container_client(container)
+
+        with _AzureErrors(log):
+            for blob in client.list_blobs(name_starts_with=prefix):
+                yield Path(blob.name[len(prefix) :]), blob
+
+    def _blob_client(self, dst_url):
+        account_url, container, blob = _split_url(dst_url)
+
+        return self._service(account_url).get_blob_client(container, blob)
+
+    def _service(self, account_url):
+        with self._lock:
+            service = self._services.get(account_url)
+            if service is None:
+                service = self._new_service(account_url)
+                self._services[account_url] = service
+
+            return service
+
+    def _new_service(self, account_url):
+        from azure.storage.blob import BlobServiceClient
+
+        # The service keeps a single HTTP session, allowing connections to be re-used
+        return BlobServiceClient(account_url=account_url, credential=self._credential)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if not isinstance(exc_value, AZLoginError):
+            self.logout()
+
+
+class _AzureErrors:
+    """Context manager translating Azure SDK exceptions into AZErrors."""
+
+    def __init__(self, log):
+        self._log = log
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_value is None:
+            return False
+
+        from azure.core.exceptions import AzureError, ResourceNotFoundError
+
+        if isinstance(exc_value, ResourceNotFoundError):
+            raise AZFileNotFoundError(BLOB_NOT_FOUND) from exc_value
+        elif isinstance(exc_value, AzureError):
+            self._log.warning("azure request failed: %s", exc_value)
+
+            error_code = getattr(exc_value, "error_code", None)
+            if error_code is None:
+                raise AZUnknownError() from exc_value
+
+            raise AZError(str(error_code)) from exc_value
+
+        return False
+
+
+class _UploadStream:
+    """Read-only file wrapper that calculates the MD5 hash of the data read, and
+    that limits the rate at which data is read to 'cap_mbps' megabits per second, if
+    set. The wrapper is not seekable, so that the SDK reads the file sequentially
+    regardless of the number of connections. Data read is also passed to the
+    (optional) 'hashers'.
+    """
+
+    def __init__(self, handle, cap_mbps=None, hashers=()):
+        self.name = handle.name
+        self.md5 = hashlib.md5()
+        self._hashers = tuple(hashers)
+        self._handle = handle
+        self._throttle = _Throttle(cap_mbps)
+
+    def read(self, size=-1):
+        self._throttle.begin()
+
+        data = self._handle.read(size)
+        self.md5.update(data)
+        for hasher in self._hashers:
+            hasher.update(data)
+        self._throttle.wait(len(data))
+
+        return data
+
+
+class _Throttle:
+    """Limits the transfer rate to 'cap_mbps' megabits per second, if set, by
+    sleeping after each transfer until the average rate is within the limit.
+    """
+
+    def __init__(self, cap_mbps=None):
+        self._bytes_per_second = cap_mbps * 1e6 / 8 if cap_mbps else None
+        self._bytes_sent = 0
+        self._started = None
+
+    def begin(self):
+        if self._started is None:
+            self._started = time.monotonic()
+
+    def wait(self, nbytes):
+        self._bytes_sent += nbytes
+
+        if self._bytes_per_second is not None:
+            elapsed = time.monotonic() - self._started
+            delay = self._bytes_sent / self._bytes_per_second - elapsed
+            if delay > 0:
+                time.sleep(delay)
+
+
+class _ByteBudget:
+    """Limits the combined size of files being uploaded at once to 'max_bytes', if
+    set. A file larger than 'max_bytes' is admitted once no other files are being
+    uploaded, so that every file can eventually be uploaded.
+    """
+
+    def __init__(self, max_bytes=None):
+        self._max_bytes = max_bytes
+        self._in_flight = 0
+        self._condition = threading.Condition()
+
+    def acquire(self, nbytes):
+        with self._condition:
+            if self._max_bytes is not None:
+                self._condition.wait_for(
+                    lambda: not self._in_flight
+                    or self._in_flight + nbytes <= self._max_bytes
+                )
+
+            self._in_flight += nbytes
+
+    def release(self, nbytes):
+        with self._condition:
+            self._in_flight -= nbytes
+            self._condition.notify_all()
+
+
+def _file_size(filepath):
+    try:
+        return os.path.getsize(filepath)
+    except OSError:
+        # Errors are reported when the file is uploaded
+        return 0
+
+
+def _split_url(url):
+    """Splits a blob URL into account URL, container name, and (unquoted) blob."""
+    parsed = urllib.parse.urlsplit(url)
+    container, _, blob = parsed.path.lstrip("/").partition("/")
+
+    account_url = f"{parsed.scheme}://{parsed.netloc}"
+
+    return account_url, urllib.parse.unquote(container), urllib.parse.unquote(blob)
+
+
+def _block_id(index, data):
+    """Returns a block ID identifying both the position and the content of a block;
+    all IDs have the same length, as required by Azure.
+    """
+    return f"{index:06d}-{hashlib.md5(data).hexdigest()}"
+
+
+def _blob_stats(blob):
+    md5 = blob.content_settings.content_md5
+    # Missing MD5s are represented by an empty string, similar to AZCopy.list_md5s
+    md5 = bytes(md5).hex().upper() if md5 else ""
+
+    return PartialStats(size=blob.size, hash=md5)
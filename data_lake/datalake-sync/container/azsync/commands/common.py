@@ -1,8 +1,34 @@
+from argparse import ArgumentTypeError
 from pathlib import Path
 
 from configargparse import ArgumentDefaultsHelpFormatter
 
-from azsync.azcopy import AZCOPY_LOG_LEVELS
+from azsync.azcopy import AZCOPY_LOG_LEVELS, AZCopy
+from azsync.bandwidth import (
+    PRIORITY_CLASSES,
+    BandwidthBudget,
+    BandwidthProfile,
+    parse_hours,
+)
+from azsync.metrics import MetricsReport
+from azsync.watcher import WATCH_BACKENDS, RunWatcher
+
+AZURE_BACKENDS = ("azcopy", "native")
+
+
+def at_least(cast, minimum):
+    """Returns an argparse type that converts values using 'cast' and that rejects
+    values less than 'minimum'.
+    """
+
+    def _convert(value):
+        value = cast(value)
+        if value < minimum:
+            raise ArgumentTypeError(f"must be at least {minimum}, not {value}")
+
+        return value
+
+    return _convert
 
 
 def new_subparser(subparsers, command, cfgname=None):
@@ -29,6 +55,47 @@ def new_subparser(subparsers, command, cfgname=None):
         type=float,
         default=5 * 60,
     )
+    parser.add_argument(
+        "--hash-workers",
+        help="Number of processes used to hash local files in parallel",
+        type=at_least(int, 1),
+        default=1,
+    )
+    parser.add_argument(
+        "--cap-mbps",
+        help="Max bandwidth in megabits per second used for uploads; 0 means no "
+        "limit. Applies during the day if --night-cap-mbps is set",
+        type=at_least(float, 0),
+        default=0,
+    )
+    parser.add_argument(
+        "--night-cap-mbps",
+        help="Max bandwidth in megabits per second used for uploads during "
+        "--night-hours; 0 means no limit. Defaults to --cap-mbps",
+        type=at_least(float, 0),
+    )
+    parser.add_argument(
+        "--night-hours",
+        help="Local time range (HH:MM-HH:MM) during which --night-cap-mbps applies",
+        type=parse_hours,
+        default="22:00-06:00",
+    )
+    parser.add_argument(
+        "--priority",
+        help="Priority class used when sharing the bandwidth cap with other "
+        "processes via --bandwidth-dir; 'high' processes get twice the bandwidth "
+        "of 'normal' processes, which get twice that of 'low' processes",
+        default="normal",
+        choices=tuple(PRIORITY_CLASSES),
+    )
+    parser.add_argument(
+        "--bandwidth-dir",
+        help="Folder shared by concurrently running azsync processes, between which "
+        "the bandwidth cap is divided according to their --priority. The cap "
+        "applies to each process on its own if not set. All processes sharing a "
+        "folder should use the same --cap-mbps and --night-cap-mbps",
+        type=Path,
+    )
     parser.add_argument(
         "--pid-file",
         help="Path to pid file",
@@ -41,6 +108,19 @@ def new_subparser(subparsers, command, cfgname=None):
         type=Path,
         default=Path(f"~/.azsync/{cfgname or command}.db").expanduser(),
     )
+    parser.add_argument(
+        "--hash-cache",
+        help="Path to file storing hashes of local files between runs; defaults to "
+        "--state-file with the extension '.hashes'",
+        type=Path,
+    )
+    parser.add_argument(
+        "--fast-digests",
+        help="Store a fast digest of files in --hash-cache, so that files that were "
+        "touched but not modified are not re-hashed with MD5; uses XXH3 if the "
+        "'xxhash' module is installed and BLAKE2b otherwise",
+        action="store_true",
+    )
 
     group = parser.add_argument_group("logging")
     group.add_argument(
@@ -55,6 +135,13 @@ def new_subparser(subparsers, command, cfgname=None):
         choices=("DEBUG", "INFO", "WARNING", "ERROR"),
         type=str.upper,
     )
+    group.add_argument(
+        "--log-memory-records",
+        help="Number of recent log messages kept in memory for error emails; older "
+        "messages below WARNING are compressed and spilled to a temporary file",
+        default=10000,
+        type=at_least(int, 1),
+    )
     group.add_argument("--azcopy-logs", help="Location of azcopy log files", type=Path)
     group.add_argument(
         "--azcopy-log-level",
@@ -63,6 +150,18 @@ def new_subparser(subparsers, command, cfgname=None):
         choices=AZCOPY_LOG_LEVELS,
         type=str.upper,
     )
+    group.add_argument(
+        "--metrics-json",
+        help="Write a JSON summary of the time spent, the amount of data hashed and "
+        "uploaded, and the retries used by each task to this file",
+        type=Path,
+    )
+    group.add_argument(
+        "--metrics-prom",
+        help="Write per-task metrics summed by task type to this file in the "
+        "Prometheus text format, e.g. for the textfile collector of node_exporter",
+        type=Path,
+    )
 
     group = parser.add_argument_group("email notification")
     group.add_argument(
@@ -71,6 +170,13 @@ def new_subparser(subparsers, command, cfgname=None):
         help="Email the log to this email address on errors",
         nargs="+",
     )
+    group.add_argument(
+        "--log-email-max-mb",
+        help="Max size in MB of the log included in emails; the oldest messages "
+        "below ERROR are omitted from larger logs. 0 means no limit",
+        default=10,
+        type=at_least(int, 0),
+    )
     group.add_argument("--smtp-host", help="Hostname of SMTP server")
     group.add_argument("--smtp-port", help="Port of SMTP server", type=int, default=0)
     group.add_argument("--smtp-user", help="Username for SMTP server")
@@ -88,5 +194,187 @@ def new_subparser(subparsers, command, cfgname=None):
         default=Path("credentials.txt"),
         type=Path,
     )
+    group.add_argument(
+        "--azure-backend",
+        help="Backend used to copy, remove, and list files on Azure; 'azcopy' runs "
+        "azcopy for every operation, while 'native' uses the Azure Python SDK with a "
+        "pool of persistent connections. Folders are synced using azcopy, unless "
+        "--stream-hashes or --resume-uploads is set",
+        default="azcopy",
+        choices=AZURE_BACKENDS,
+        type=str.lower,
+    )
+    group.add_argument(
+        "--stream-hashes",
+        help="Hash files while uploading them, instead of reading files again in "
+        "order to verify uploads. Folders are then synced using the Azure Python SDK. "
+        "Requires '--azure-backend native'",
+        default=False,
+        action="store_true",
+    )
+    group.add_argument(
+        "--resume-uploads",
+        help="Upload large files in blocks, recording staged blocks in --state-file, "
+        "so that interrupted uploads are resumed rather than restarted. Folders are "
+        "then synced using the Azure Python SDK. Requires '--azure-backend native'",
+        default=False,
+        action="store_true",
+    )
+    group.add_argument(
+        "--lazy-verify",
+        help="Accept the MD5 hashes of uploads, which are validated by Azure, as "
+        "verification of individual files, instead of looking up the MD5 of each "
+        "blob after uploading it; flag files are then written using a single "
+        "request. Requires '--azure-backend native'",
+        default=False,
+        action="store_true",
+    )
+    group.add_argument(
+        "--azure-connections",
+        help="Max number of concurrent connections per upload for the 'native' backend",
+        default=4,
+        type=int,
+    )
+    group.add_argument(
+        "--upload-workers",
+        help="Max number of files uploaded concurrently when copying multiple files "
+        "using the 'native' backend; the --cap-mbps budget is divided between them. "
+        "Files are uploaded one at a time by default",
+        default=1,
+        type=at_least(int, 1),
+    )
+    group.add_argument(
+        "--upload-max-mb",
+        help="Max combined size in MB of files uploaded concurrently when copying "
+        "multiple files using the 'native' backend; larger files are uploaded on "
+        "their own. 0 means no limit",
+        default=1024,
+        type=at_least(int, 0),
+    )
 
     return parser
+
+
+def add_watch_arguments(parser, flag_help):
+    """Adds options for running a command as a daemon that watches --main-folder."""
+    group = parser.add_argument_group("daemon")
+    group.add_argument(
+        "--watch",
+        help="Keep running and watch --main-folder, synchronizing folders as soon as "
+        f"{flag_help}, instead of exiting after one pass. Every folder is also "
+        "checked at startup and every --watch-rescan seconds",
+        default=False,
+        action="store_true",
+    )
+    group.add_argument(
+        "--watch-backend",
+        help="Method used to detect changes; 'auto' uses inotify except for network "
+        "file-systems such as SMB/CIFS mounts, for which polling is used",
+        default="auto",
+        choices=WATCH_BACKENDS,
+        type=str.lower,
+    )
+    group.add_argument(
+        "--watch-interval",
+        help="Seconds between checks for changes when polling",
+        default=60.0,
+        type=at_least(float, 1),
+    )
+    group.add_argument(
+        "--watch-debounce",
+        help="Wait until no changes have been observed in a folder for this many "
+        "seconds before synchronizing it",
+        default=60.0,
+        type=at_least(float, 0),
+    )
+    group.add_argument(
+        "--watch-rescan",
+        help="Seconds between full scans of --main-folder, catching folders missed "
+        "while watching and retrying folders that failed to synchronize",
+        default=15 * 60.0,
+        type=at_least(float, 1),
+    )
+
+
+def new_watcher(args, flag=None):
+    """Returns a RunWatcher for --main-folder using the --watch-* options."""
+    return RunWatcher(
+        root=args.main_folder,
+        flag=flag,
+        interval=args.watch_interval,
+        backend=args.watch_backend,
+    )
+
+
+def new_bandwidth_budget(args):
+    """Returns a BandwidthBudget for the --cap-mbps/--night-cap-mbps profile, shared
+    with other processes using --bandwidth-dir, if set.
+    """
+    profile = BandwidthProfile(
+        day_mbps=args.cap_mbps,
+        night_mbps=args.night_cap_mbps,
+        night_hours=args.night_hours,
+    )
+
+    return BandwidthBudget(
+        profile=profile,
+        priority=args.priority,
+        root=args.bandwidth_dir,
+    )
+
+
+def new_client(args):
+    """Returns a client for the Azure backend selected using --azure-backend."""
+    if args.stream_hashes and args.azure_backend != "native":
+        raise ValueError("--stream-hashes requires '--azure-backend native'")
+    elif args.resume_uploads and args.azure_backend != "native":
+        raise ValueError("--resume-uploads requires '--azure-backend native'")
+    elif args.lazy_verify and args.azure_backend != "native":
+        raise ValueError("--lazy-verify requires '--azure-backend native'")
+
+    if args.azure_backend == "native":
+        from azsync.blob import AZBlobClient
+
+        client = AZBlobClient(
+            tenant_id=args.tenant_id,
+            app_id=args.app_id,
+            secret=args.secret,
+            max_connections=args.azure_connections,
+            max_uploads=args.upload_workers,
+            max_upload_bytes=args.upload_max_mb * 1024 * 1024 or None,
+        )
+        client.set_lazy_verification(args.lazy_verify)
+    else:
+        client = AZCopy(
+            tenant_id=args.tenant_id, app_id=args.app_id, secret=args.secret
+        )
+
+    client.set_log_level(args.azcopy_log_level)
+    client.set_bandwidth_cap(args.bandwidth.cap_mbps)
+
+    return client
+
+
+def enable_stream_hashes(args, client, hash_cache):
+    """Lets the client add hashes calculated while uploading files to 'hash_cache',
+    if requested using --stream-hashes.
+    """
+    if args.stream_hashes:
+        client.set_hash_cache(hash_cache)
+
+
+def enable_resumable_uploads(args, client, state):
+    """Lets the client record staged blocks in 'state', allowing interrupted uploads
+    to be resumed, if requested using --resume-uploads.
+    """
+    if args.resume_uploads:
+        client.set_checkpoints(state)
+
+
+def new_metrics_report(args):
+    """Returns a report that writes task metrics to --metrics-json/--metrics-prom."""
+    return MetricsReport(
+        command=args.parser,
+        json_file=args.metrics_json,
+        prometheus_file=args.metrics_prom,
+    )
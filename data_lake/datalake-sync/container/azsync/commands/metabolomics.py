@@ -9,9 +9,15 @@ from pathlib import Path
 import azsync.logging
 import azsync.sync
 
-from azsync.azcopy import AZCopy
-from azsync.commands.common import new_subparser
+from azsync.commands.common import (
+    enable_resumable_uploads,
+    enable_stream_hashes,
+    new_client,
+    new_metrics_report,
+    new_subparser,
+)
 from azsync.fileutils import PartialStats
+from azsync.hashcache import HashCache
 from azsync.state import PersistentState
 from azsync.utilities import urljoin, urlquote
 
@@ -55,15 +61,19 @@ def _main(args):
         urlquote(args.destination),
     )
 
-    client = AZCopy(tenant_id=args.tenant_id, app_id=args.app_id, secret=args.secret)
-    client.set_log_level(args.azcopy_log_level)
+    client = new_client(args)
 
     tries = azsync.sync.TRIES
 
     with client:
         log.info("finding metabolomics datasets in '%s'", args.main_folder)
 
-        with PersistentState(args.state_file) as state:
+        with PersistentState(args.state_file) as state, HashCache(
+            args.hash_cache, fast_digests=args.fast_digests
+        ) as hash_cache, new_metrics_report(args) as report:
+            enable_stream_hashes(args, client, hash_cache)
+            enable_resumable_uploads(args, client, state)
+
             datasets = _collect_runs_and_methods(state=state, root=args.main_folder)
 
             log.info("uploading runs and methods")
@@ -87,10 +97,13 @@ def _main(args):
                             dst_url=urljoin(
                                 root_url, urlquote(name), urlquote(runpath.name)
                             ),
+                            hash_workers=args.hash_workers,
+                            hash_cache=hash_cache,
                         )
 
                         log.info("running task %r", task)
                         tries = task.execute(client, tries)
+                        report.add(task.metrics)
                         if tries <= 0:
                             log.error("failed to run task %r", task)
                             return
@@ -98,6 +111,8 @@ def _main(args):
                         for key, value in task.filestats.items():
                             state.set_file_stats(key, value)
 
+            hash_cache.evict_missing(args.main_folder)
+
 
 def _collect_runs_and_methods(state, root):
     log = logging.getLogger(_LOGGER)
@@ -1,19 +1,32 @@
 #!/usr/bin/env python3
 # -*- coding: utf8 -*-
+import functools
 import logging
 import logging.handlers
 import time
 
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
 from pathlib import Path
 
 import azsync.logging
 import azsync.sync
 
-from azsync.azcopy import AZCopy
-from azsync.commands.common import new_subparser
+from azsync.commands.common import (
+    add_watch_arguments,
+    at_least,
+    enable_resumable_uploads,
+    enable_stream_hashes,
+    new_client,
+    new_metrics_report,
+    new_subparser,
+    new_watcher,
+)
+from azsync.hashcache import HashCache
+from azsync.snapshot import TreeSnapshot
 from azsync.state import PersistentState
 from azsync.utilities import urljoin, urlquote
+from azsync.watcher import run_daemon
 
 
 def add_argparser(subparsers, command="ngs"):
@@ -62,6 +75,23 @@ def add_argparser(subparsers, command="ngs"):
         action="store_true",
     )
 
+    parser.add_argument(
+        "--tree-snapshot",
+        help="Path to file storing the contents of run folders between runs, allowing "
+        "unchanged folders in completed runs to be skipped when scanning for files; "
+        "defaults to --state-file with the extension '.tree'",
+        type=Path,
+    )
+    parser.add_argument(
+        "--run-workers",
+        help="Max number of run folders synchronized concurrently; the --cap-mbps "
+        "budget is divided evenly between concurrently synchronized runs",
+        default=1,
+        type=at_least(int, 1),
+    )
+
+    add_watch_arguments(parser, "the --completion-flag is created in a run")
+
     return parser
 
 
@@ -72,60 +102,170 @@ def _main(args):
     if args.samplesheet_folder is not None:
         args.samplesheet_folder = args.samplesheet_folder.absolute()
 
-    client = AZCopy(tenant_id=args.tenant_id, app_id=args.app_id, secret=args.secret)
-    client.set_log_level(args.azcopy_log_level)
+    if args.tree_snapshot is None:
+        args.tree_snapshot = args.state_file.with_suffix(".tree")
+
+    client = new_client(args)
+    snapshot = TreeSnapshot(args.tree_snapshot)
+
+    with PersistentState(args.state_file) as state, HashCache(
+        args.hash_cache, fast_digests=args.fast_digests
+    ) as hash_cache, new_metrics_report(args) as report:
+        enable_stream_hashes(args, client, hash_cache)
+        enable_resumable_uploads(args, client, state)
 
-    with PersistentState(args.state_file) as state:
         with client:
-            for name in _collect_runs(args):
-                runstate = state.get_ngs_run(name)
-                if runstate.is_synced:
-                    log.info("skipping already synced run %r", name)
-                    continue
-
-                log.info("processing run %r", name)
-
-                dst_url = urljoin(
-                    f"https://{args.storage_account}.blob.core.windows.net",
-                    urlquote(args.container_name),
-                    urlquote(args.destination),
-                    urlquote(name),
-                )
+            if args.watch:
+                _watch_runs(args, client, state, hash_cache, snapshot, report)
+            else:
+                runs = _collect_unsynced_runs(args, state)
+                _sync_runs(args, client, state, runs, hash_cache, snapshot, report)
+                _evict_runs(args, hash_cache, runs)
 
-                _sync_folder(
-                    args=args,
-                    client=client,
-                    src_dir=args.main_folder / name,
-                    dst_url=dst_url,
-                    runstate=runstate,
-                )
+        _warn_about_stale_runs(state)
+
+
+def _collect_unsynced_runs(args, state):
+    log = logging.getLogger(__name__)
+
+    runs = []
+    for name in _collect_runs(args):
+        runstate = state.get_ngs_run(name)
+        if runstate.is_synced:
+            log.info("skipping already synced run %r", name)
+            continue
+
+        runs.append((name, runstate))
+
+    return runs
+
+
+def _evict_runs(args, hash_cache, runs):
+    # Only runs scanned in this invocation, since synced runs are never re-hashed
+    for name, _ in runs:
+        hash_cache.evict_missing(args.main_folder / name)
+
+
+def _watch_runs(args, client, state, hash_cache, snapshot, report):
+    """Synchronizes runs as their completion flags are created, until stopped."""
+
+    def _collect():
+        return [name for name, _ in _collect_unsynced_runs(args, state)]
 
-        unsynced_runs = []
-        for name, runstate in state.get_ngs_runs():
-            if not runstate.is_synced:
-                unsynced_runs.append((name, runstate))
+    def _sync(names):
+        runs = [(name, state.get_ngs_run(name)) for name in names]
+        runs = [(name, runstate) for name, runstate in runs if not runstate.is_synced]
 
-        if unsynced_runs:
-            currenttime = datetime.utcnow()
-            log.info("Checking %i incomplete runs for stale runs", len(unsynced_runs))
+        _sync_runs(args, client, state, runs, hash_cache, snapshot, report)
+        _evict_runs(args, hash_cache, runs)
+        _warn_about_stale_runs(state)
 
-            for name, runstate in sorted(unsynced_runs):
-                warned = runstate.warned or runstate.observed
-                if warned is not None and (currenttime - warned <= timedelta(hours=48)):
-                    log.debug("Warning for %r skipped due to recent warning", name)
-                    continue
+        return [name for name in names if state.get_ngs_run(name).is_synced]
 
-                if not runstate.is_data_synced:
-                    log.error("Data was never synced for old NGS run %r", name)
-                if not runstate.is_sheet_synced:
-                    log.error("Samplesheet was never synced for old NGS run %r", name)
+    def _after_sync():
+        state.save()
+        report.flush()
+        args.report_errors()
 
-                if (
-                    runstate.is_data_synced and runstate.is_sheet_synced
-                ) and not runstate.is_flag_synced:
-                    log.error("NGS run %r has not been flagged as complete", name)
+    with new_watcher(args, flag=args.completion_flag) as watcher:
+        run_daemon(
+            watcher=watcher,
+            collect=_collect,
+            sync=_sync,
+            # Runs are skipped until the --completion-delay has passed
+            debounce=max(args.watch_debounce, args.completion_delay),
+            rescan=args.watch_rescan,
+            after_sync=_after_sync,
+        )
+
+
+def _warn_about_stale_runs(state):
+    log = logging.getLogger(__name__)
+
+    unsynced_runs = []
+    for name, runstate in state.get_ngs_runs():
+        if not runstate.is_synced:
+            unsynced_runs.append((name, runstate))
+
+    if unsynced_runs:
+        currenttime = datetime.utcnow()
+        log.info("Checking %i incomplete runs for stale runs", len(unsynced_runs))
 
-                runstate.set_warned()
+        for name, runstate in sorted(unsynced_runs):
+            warned = runstate.warned or runstate.observed
+            if warned is not None and (currenttime - warned <= timedelta(hours=48)):
+                log.debug("Warning for %r skipped due to recent warning", name)
+                continue
+
+            if not runstate.is_data_synced:
+                log.error("Data was never synced for old NGS run %r", name)
+            if not runstate.is_sheet_synced:
+                log.error("Samplesheet was never synced for old NGS run %r", name)
+
+            if (
+                runstate.is_data_synced and runstate.is_sheet_synced
+            ) and not runstate.is_flag_synced:
+                log.error("NGS run %r has not been flagged as complete", name)
+
+            runstate.set_warned()
+
+
+def _sync_runs(
+    args, client, state, runs, hash_cache=None, snapshot=None, report=None
+):
+    """Synchronizes a list of (name, runstate) using up to --run-workers threads. The
+    state is saved as each run finishes, so that progress is kept if the process is
+    killed while other runs are still being synchronized.
+    """
+    workers = min(args.run_workers, len(runs))
+    if not workers:
+        return
+
+    # The bandwidth available to this process is divided between runs
+    cap_mbps = functools.partial(args.bandwidth.cap_mbps, workers=workers)
+    client.set_bandwidth_cap(cap_mbps)
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="run") as executor:
+        futures = [
+            executor.submit(
+                _sync_run, args, client, name, runstate, hash_cache, snapshot, report
+            )
+            for name, runstate in runs
+        ]
+
+        try:
+            for future in as_completed(futures):
+                future.result()
+                state.save()
+        finally:
+            # Runs not yet started are skipped if a run raised an exception
+            for future in futures:
+                future.cancel()
+
+
+def _sync_run(
+    args, client, name, runstate, hash_cache=None, snapshot=None, report=None
+):
+    log = logging.getLogger(__name__)
+    log.info("processing run %r", name)
+
+    dst_url = urljoin(
+        f"https://{args.storage_account}.blob.core.windows.net",
+        urlquote(args.container_name),
+        urlquote(args.destination),
+        urlquote(name),
+    )
+
+    _sync_folder(
+        args=args,
+        client=client,
+        src_dir=args.main_folder / name,
+        dst_url=dst_url,
+        runstate=runstate,
+        hash_cache=hash_cache,
+        snapshot=snapshot,
+        report=report,
+    )
 
 
 def _collect_runs(args):
@@ -155,7 +295,16 @@ def _collect_runs(args):
     return sorted(runs)
 
 
-def _sync_folder(args, client, src_dir, dst_url, runstate):
+def _sync_folder(
+    args,
+    client,
+    src_dir,
+    dst_url,
+    runstate,
+    hash_cache=None,
+    snapshot=None,
+    report=None,
+):
     tasks = []
     has_data = runstate.is_data_synced
     #has_samplesheet = runstate.is_sheet_synced
@@ -166,7 +315,9 @@ def _sync_folder(args, client, src_dir, dst_url, runstate):
     #    )
 
     if not has_data:
-        has_data = _schedule_data_sync(args, src_dir, dst_url, tasks)
+        has_data = _schedule_data_sync(
+            args, src_dir, dst_url, tasks, hash_cache, snapshot
+        )
 
     # Create *.sync file on Azure to indicate that sync was completed
     if has_data:
@@ -177,7 +328,7 @@ def _sync_folder(args, client, src_dir, dst_url, runstate):
     if has_data and args.remove_source:
         tasks.append(azsync.sync.RemoveLocal(src_dir))
 
-    if azsync.sync.execute(client=client, tasks=tasks):
+    if azsync.sync.execute(client=client, tasks=tasks, report=report):
         if has_data:
             runstate.set_data_synced()
 
@@ -212,7 +363,9 @@ def _schedule_samplesheet_sync(args, src_dir, dst_url, tasks, has_data):
     return True
 
 
-def _schedule_data_sync(args, src_dir, dst_url, tasks):
+def _schedule_data_sync(
+    args, src_dir, dst_url, tasks, hash_cache=None, snapshot=None
+):
     log = logging.getLogger(__name__)
     flag_file = src_dir / args.completion_flag
     if not flag_file.exists():
@@ -221,10 +374,27 @@ def _schedule_data_sync(args, src_dir, dst_url, tasks):
         return False
 
     youngest_allowed = time.time() - args.completion_delay
-    for filepath in src_dir.iterdir():
-        if filepath.stat().st_mtime > youngest_allowed:
+    if snapshot is None:
+        for filepath in src_dir.iterdir():
+            if filepath.stat().st_mtime > youngest_allowed:
+                log.info("data folder is recently completed; skipping")
+                return False
+    else:
+        # Any change to the run, not just to top-level entries, delays the sync
+        scan = snapshot.scan(src_dir)
+        log.info("scanned data folder: %r", scan)
+        if scan.newest_mtime > youngest_allowed:
             log.info("data folder is recently completed; skipping")
             return False
 
-    tasks.append(azsync.sync.CheckedSync(src_dir, dst_url, timeout=args.timeout))
+    tasks.append(
+        azsync.sync.CheckedSync(
+            src_dir,
+            dst_url,
+            timeout=args.timeout,
+            hash_workers=args.hash_workers,
+            hash_cache=hash_cache,
+            snapshot=snapshot,
+        )
+    )
     return True
@@ -10,11 +10,20 @@ from pathlib import Path
 import azsync.logging
 import azsync.sync
 
-from azsync.azcopy import AZCopy
-from azsync.commands.common import new_subparser
+from azsync.commands.common import (
+    add_watch_arguments,
+    enable_resumable_uploads,
+    enable_stream_hashes,
+    new_client,
+    new_metrics_report,
+    new_subparser,
+    new_watcher,
+)
 from azsync.fileutils import PartialStats, iglob_folder
+from azsync.hashcache import HashCache
 from azsync.state import PersistentState
 from azsync.utilities import urljoin, urlquote
+from azsync.watcher import run_daemon
 
 import os
 import re
@@ -60,30 +69,92 @@ def add_argparser(subparsers):
         type=int,
     )
 
+    add_watch_arguments(parser, "files in a project folder are old enough")
+
 
 def _main(args):
     log = logging.getLogger(__name__)
-    client = AZCopy(tenant_id=args.tenant_id, app_id=args.app_id, secret=args.secret)
-    client.set_log_level(args.azcopy_log_level)
+    client = new_client(args)
 
     with client:
         log.info("synchronizing *.raw files in '%s' to azure", args.main_folder)
 
-        with PersistentState(args.state_file) as state:
-            for src_dir in iglob_folder(args.main_folder, args.project_glob):
-                if not src_dir.is_dir():
-                    log.info("skipping non-project folder %r", src_dir)
-                    continue
+        with PersistentState(args.state_file) as state, HashCache(
+            args.hash_cache, fast_digests=args.fast_digests
+        ) as hash_cache, new_metrics_report(args) as report:
+            enable_stream_hashes(args, client, hash_cache)
+            enable_resumable_uploads(args, client, state)
+
+            if args.watch:
+                _watch_folders(args, client, state, hash_cache, report)
+            else:
+                for src_dir in _collect_project_folders(args):
+                    _synchronize_folder(
+                        args=args,
+                        client=client,
+                        state=state,
+                        src_dir=src_dir,
+                        hash_cache=hash_cache,
+                        report=report,
+                    )
+
+            hash_cache.evict_missing(args.main_folder)
+
+
+def _collect_project_folders(args):
+    log = logging.getLogger(__name__)
+
+    folders = []
+    for src_dir in iglob_folder(args.main_folder, args.project_glob):
+        if not src_dir.is_dir():
+            log.info("skipping non-project folder %r", src_dir)
+            continue
+
+        folders.append(src_dir)
+
+    return folders
 
+
+def _watch_folders(args, client, state, hash_cache, report):
+    """Synchronizes project folders as files are added to them, until stopped."""
+
+    def _collect():
+        return [src_dir.name for src_dir in _collect_project_folders(args)]
+
+    def _sync(names):
+        for name in names:
+            src_dir = args.main_folder / name
+            if fnmatch.fnmatch(name.lower(), args.project_glob) and src_dir.is_dir():
                 _synchronize_folder(
                     args=args,
                     client=client,
                     state=state,
                     src_dir=src_dir,
+                    hash_cache=hash_cache,
+                    report=report,
                 )
 
+        # Projects may receive new files at any time
+        return ()
+
+    def _after_sync():
+        state.save()
+        report.flush()
+        args.report_errors()
+
+    with new_watcher(args) as watcher:
+        run_daemon(
+            watcher=watcher,
+            collect=_collect,
+            sync=_sync,
+            # Files are skipped until they are at least --min-file-age seconds old
+            debounce=max(args.watch_debounce, args.min_file_age),
+            rescan=args.watch_rescan,
+            after_sync=_after_sync,
+        )
+
 
-def _synchronize_folder(args, client, state, src_dir):
+def _synchronize_folder(args, client, state, src_dir, hash_cache=None, report=None):
     log = logging.getLogger(__name__)
     root_url = urljoin(
         f"https://{args.storage_account}.blob.core.windows.net",
@@ -112,8 +183,15 @@ def _synchronize_folder(args, client, state, src_dir):
     for idx, filename in enumerate(sorted(updated_files), start=1):
         log.info("  %i. %s", idx, filename)
 
-    task = azsync.sync.CheckedMultiCopy(updated_files, root_url)
+    task = azsync.sync.CheckedMultiCopy(
+        updated_files,
+        root_url,
+        hash_workers=args.hash_workers,
+        hash_cache=hash_cache,
+    )
     tries = task.execute(client, azsync.sync.TRIES)
+    if report is not None:
+        report.add(task.metrics)
     if tries <= 0:
         log.error("failed to run task %r", task)
         return
@@ -158,7 +236,10 @@ def _synchronize_folder(args, client, state, src_dir):
             data=datetime.datetime.now().isoformat(),
         )
 
-        if task.execute(client, tries) <= 0:
+        tries = task.execute(client, tries)
+        if report is not None:
+            report.add(task.metrics)
+        if tries <= 0:
             log.error("failed to run task %r", task)
             return
 
@@ -1,8 +1,11 @@
 import errno
 import fnmatch
+import functools
 import hashlib
+import mmap
 import multiprocessing
 import os
+import queue
 import signal
 import time
 
@@ -95,8 +98,12 @@ def iglob_folder(dirpath, pattern):
     return filepaths
 
 
-def collect_files(root):
-    """Recursively returns PartialStats (mtime and size) for all files in a folder."""
+def collect_files(root, snapshot=None):
+    """Recursively returns PartialStats (mtime and size) for all files in a folder.
+    If a TreeSnapshot is given, then unchanged folders are not listed again.
+    """
+    if snapshot is not None:
+        return snapshot.scan(root).files
 
     result = {}
     root = Path(root)
@@ -117,18 +124,122 @@ def collect_files(root):
     return result
 
 
-def md5_hash(filename, block_size=256 * 1024):
+# Default number of bytes hashed per read; larger blocks reduce per-call overhead
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def md5_hash(filename, block_size=HASH_BLOCK_SIZE, use_mmap=True):
     """Returns base16 encoded MD5 hash for file"""
+    hasher = hashlib.new("md5")
+    hash_file(filename, (hasher,), block_size=block_size, use_mmap=use_mmap)
+
+    return hasher.hexdigest().upper()
+
+
+def fast_digest(filename, block_size=HASH_BLOCK_SIZE, use_mmap=True):
+    """Returns a fast (non-cryptographic) digest of a file, prefixed by the name of
+    the algorithm; used to detect changes to files, but not to verify uploads.
+    """
+    hasher = FastHasher()
+    hash_file(filename, (hasher,), block_size=block_size, use_mmap=use_mmap)
+
+    return hasher.hexdigest()
+
+
+def md5_hash_and_digest(filename, block_size=HASH_BLOCK_SIZE, use_mmap=True):
+    """Returns the MD5 hash and the fast digest of a file, reading it only once."""
+    md5_hasher = hashlib.new("md5")
+    fast_hasher = FastHasher()
+    hash_file(
+        filename, (md5_hasher, fast_hasher), block_size=block_size, use_mmap=use_mmap
+    )
+
+    return md5_hasher.hexdigest().upper(), fast_hasher.hexdigest()
+
+
+def hash_file(filename, hashers, block_size=HASH_BLOCK_SIZE, use_mmap=True):
+    """Updates each hasher in 'hashers' with the contents of a file; returns the
+    number of bytes read. Files larger than 'block_size' are memory mapped if
+    'use_mmap' is set, and are otherwise read into a single, re-used buffer. The
+    kernel is told that the file is read sequentially, to increase read-ahead.
+    """
+    if block_size < 1:
+        raise ValueError(f"block_size must be at least 1, not {block_size!r}")
+
     with open(filename, "rb") as handle:
-        size = 0
-        hasher = hashlib.new("md5")
-        block = handle.read(block_size)
-        while block:
-            hasher.update(block)
-            size += len(block)
-            block = handle.read(block_size)
+        fileno = handle.fileno()
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(fileno, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+
+        if use_mmap and os.fstat(fileno).st_size > block_size:
+            try:
+                mapping = mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError):
+                # Some file-systems and special files do not support mmap
+                pass
+            else:
+                with mapping:
+                    return _hash_mmap(mapping, hashers, block_size)
 
-        return hasher.hexdigest().upper()
+        return _hash_readinto(handle, hashers, block_size)
+
+
+def _hash_mmap(mapping, hashers, block_size):
+    if hasattr(mapping, "madvise"):
+        mapping.madvise(mmap.MADV_SEQUENTIAL)
+
+    # The view must be released before the mapping can be closed
+    with memoryview(mapping) as view:
+        for offset in range(0, len(view), block_size):
+            with view[offset : offset + block_size] as block:
+                for hasher in hashers:
+                    hasher.update(block)
+
+        return len(view)
+
+
+def _hash_readinto(handle, hashers, block_size):
+    size = 0
+    buf = bytearray(block_size)
+    with memoryview(buf) as view:
+        nbytes = handle.readinto(view)
+        while nbytes:
+            with view[:nbytes] as block:
+                for hasher in hashers:
+                    hasher.update(block)
+
+            size += nbytes
+            nbytes = handle.readinto(view)
+
+    return size
+
+
+class FastHasher:
+    """Incremental fast digest of data; 'hexdigest' returns the digest in the format
+    returned by fast_digest, so that files hashed while being read elsewhere (e.g.
+    while being uploaded) can be compared with digests calculated by this module.
+    """
+
+    def __init__(self):
+        self.name, self._hasher = _new_fast_hasher()
+
+    def update(self, data):
+        self._hasher.update(data)
+
+    def hexdigest(self):
+        return f"{self.name}:{self._hasher.hexdigest()}"
+
+
+def _new_fast_hasher():
+    """Returns (name, hasher) for XXH3 if the 'xxhash' module is installed, and for
+    BLAKE2b otherwise; both are several times faster than MD5.
+    """
+    try:
+        import xxhash
+
+        return "xxh3_128", xxhash.xxh3_128()
+    except ModuleNotFoundError:
+        return "blake2b", hashlib.blake2b(digest_size=16)
 
 
 def try_makedirs(path):
@@ -144,77 +255,218 @@ def try_makedirs(path):
         raise
 
 
-def collect_md5_hashes(root, cache=None, timeout=10 * 60):
-    pool = multiprocessing.Pool(1, init_worker_process)
+def collect_md5_hashes(
+    root,
+    cache=None,
+    timeout=10 * 60,
+    workers=1,
+    hash_cache=None,
+    snapshot=None,
+    metrics=None,
+):
+    pool = multiprocessing.Pool(workers, init_worker_process)
     cache = cache or {}
 
     try:
-        async_result = pool.apply_async(collect_files, (root,))
+        async_result = pool.apply_async(collect_files, (root, snapshot))
 
         try:
             filestats = async_result.get(timeout)
         except multiprocessing.TimeoutError:
             raise multiprocessing.TimeoutError("timeout while collecting files")
 
-        result = {}
-        for filepath, stats in filestats.items():
-            stats.hash = _calcualate_md5_hash(
-                pool=pool,
-                filepath=filepath,
-                stats=stats,
-                cache=cache,
-                timeout=timeout,
-            )
-
-            result[filepath] = stats
-
-        return result
+        return _calculate_md5_hashes(
+            pool=pool,
+            filestats=filestats,
+            cache=cache,
+            timeout=timeout,
+            workers=workers,
+            hash_cache=hash_cache,
+            metrics=metrics,
+        )
     finally:
         pool.terminate()
 
 
-def calculate_md5_hashes(filepaths, cache=None, timeout=10 * 60):
-    pool = multiprocessing.Pool(1, init_worker_process)
+def calculate_md5_hashes(
+    filepaths, cache=None, timeout=10 * 60, workers=1, hash_cache=None, metrics=None
+):
+    pool = multiprocessing.Pool(workers, init_worker_process)
     cache = cache or {}
 
     try:
-        result = {}
+        filestats = {}
         for filepath in filepaths:
             async_result = pool.apply_async(PartialStats.from_filepath, (filepath,))
 
             try:
-                stats = async_result.get(timeout)
+                filestats[filepath] = async_result.get(timeout)
             except multiprocessing.TimeoutError:
                 raise multiprocessing.TimeoutError(f"stats timed out for {filepath}")
 
-            stats.hash = _calcualate_md5_hash(
-                pool=pool,
-                filepath=filepath,
-                stats=stats,
-                cache=cache,
-                timeout=timeout,
+        return _calculate_md5_hashes(
+            pool=pool,
+            filestats=filestats,
+            cache=cache,
+            timeout=timeout,
+            workers=workers,
+            hash_cache=hash_cache,
+            metrics=metrics,
+        )
+    finally:
+        pool.terminate()
+
+
+def _calculate_md5_hashes(
+    pool, filestats, cache, timeout, workers, hash_cache=None, metrics=None
+):
+    """Sets the hash of each PartialStats in 'filestats', either using cached values
+    or by hashing files using up to 'workers' processes in 'pool'. Files are hashed
+    largest first, and each file must be hashed within 'timeout' seconds of being
+    submitted to the pool. Newly calculated hashes are added to 'hash_cache', if set,
+    and the number of files/bytes hashed are recorded in 'metrics', if set.
+
+    If 'hash_cache' records fast digests, files with a changed mtime but the same
+    size and digest as when last hashed re-use the cached MD5 hash.
+    """
+    pending = []
+    for filepath, stats in filestats.items():
+        stats.hash = _get_cached_hash(filepath, stats, (cache, hash_cache))
+        if stats.hash is None:
+            pending.append((stats.size, filepath))
+
+    fast_digests = hash_cache is not None and hash_cache.fast_digests
+
+    try:
+        if fast_digests:
+            pending = _check_fast_digests(
+                pool, filestats, pending, timeout, workers, hash_cache
             )
 
-            result[filepath] = stats
+        # Sorted smallest first, since files are popped from the end of the list
+        pending.sort()
+        hashed = [filepath for _, filepath in pending]
+
+        _hash_files(
+            pool=pool,
+            func=md5_hash_and_digest if fast_digests else md5_hash,
+            pending=pending,
+            timeout=timeout,
+            workers=workers,
+            callback=functools.partial(
+                _set_md5_hash, filestats, hash_cache, fast_digests
+            ),
+        )
 
-        return result
+        if metrics is not None:
+            metrics.add_hashed(filestats, hashed)
     finally:
-        pool.terminate()
+        if hash_cache is not None:
+            hash_cache.commit()
+
+    return filestats
 
 
-def _calcualate_md5_hash(pool, filepath, stats, cache, timeout):
-    cached_stats = cache.get(filepath)
-    # Compares based on size and mtime, since hash is not set for 'stats'
-    if cached_stats is not None and cached_stats.match(stats, optional_hash=True):
-        if cached_stats.hash:
-            return cached_stats.hash
+def _check_fast_digests(pool, filestats, pending, timeout, workers, hash_cache):
+    """Calculates fast digests for files in 'pending' with a cached digest and size
+    matching the file; returns the list of files for which no cached MD5 could be
+    re-used.
+    """
+    remaining = []
+    candidates = {}
+    for size, filepath in pending:
+        cached = hash_cache.get_digest(filepath)
+        if cached is not None and cached[0].size == size:
+            candidates[filepath] = cached
+        else:
+            remaining.append((size, filepath))
+
+    _hash_files(
+        pool=pool,
+        func=fast_digest,
+        pending=[it for it in sorted(pending) if it[1] in candidates],
+        timeout=timeout,
+        workers=workers,
+        callback=functools.partial(
+            _check_fast_digest, filestats, hash_cache, candidates, remaining
+        ),
+    )
+
+    return remaining
+
+
+def _check_fast_digest(filestats, hash_cache, candidates, remaining, filepath, value):
+    stats = filestats[filepath]
+    cached_stats, cached_digest = candidates[filepath]
+    if value == cached_digest:
+        stats.hash = cached_stats.hash
+        hash_cache.set(filepath, stats, digest=value)
+    else:
+        remaining.append((stats.size, filepath))
+
+
+def _set_md5_hash(filestats, hash_cache, fast_digests, filepath, value):
+    digest = None
+    if fast_digests:
+        value, digest = value
+
+    filestats[filepath].hash = value
+    if hash_cache is not None:
+        hash_cache.set(filepath, filestats[filepath], digest=digest)
+
+
+def _hash_files(pool, func, pending, timeout, workers, callback):
+    """Runs 'func' on the (size, filepath) in 'pending' using up to 'workers'
+    processes, and calls 'callback(filepath, result)' as each task finishes.
+    """
+    results = queue.Queue()
+    running = {}
+    while pending or running:
+        while pending and len(running) < workers:
+            _, filepath = pending.pop()
+
+            pool.apply_async(
+                func,
+                (filepath,),
+                callback=functools.partial(_put_result, results, filepath, True),
+                error_callback=functools.partial(_put_result, results, filepath, False),
+            )
+
+            running[filepath] = time.monotonic() + timeout
 
-    async_result = pool.apply_async(md5_hash, (filepath,))
+        # Wait for the task with the nearest deadline, which is the oldest task
+        filepath, deadline = min(running.items(), key=lambda it: it[1])
 
-    try:
-        return async_result.get(timeout)
-    except multiprocessing.TimeoutError:
-        raise multiprocessing.TimeoutError(f"timeout while hashing '{filepath}'")
+        try:
+            filepath, success, value = results.get(
+                timeout=max(0, deadline - time.monotonic())
+            )
+        except queue.Empty:
+            raise multiprocessing.TimeoutError(f"timeout while hashing '{filepath}'")
+
+        running.pop(filepath)
+        if not success:
+            raise value
+
+        callback(filepath, value)
+
+
+def _get_cached_hash(filepath, stats, caches):
+    for cache in caches:
+        if cache is not None:
+            cached_stats = cache.get(filepath)
+            # Compares based on size and mtime, since hash is not set for 'stats'
+            if cached_stats is not None and cached_stats.match(
+                stats, optional_hash=True
+            ):
+                if cached_stats.hash:
+                    return cached_stats.hash
+
+    return None
+
+
+def _put_result(results, filepath, success, value):
+    results.put((filepath, success, value))
 
 
 def init_worker_process():
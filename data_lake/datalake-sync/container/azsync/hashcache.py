@@ -0,0 +1,161 @@
+import collections
+import logging
+import os
+import sqlite3
+import threading
+
+from pathlib import Path
+
+from azsync.fileutils import PartialStats
+
+
+class HashCache:
+    """Persistent cache of MD5 hashes keyed on file path, size, and mtime. Hashes are
+    only returned if the size and mtime of a file match the cached values. The cache
+    may be shared between threads; access to the database is serialized.
+
+    If 'fast_digests' is set, a fast digest (see fileutils.fast_digest) is stored
+    alongside each hash, allowing cached hashes of files with a changed mtime to be
+    re-used if the contents of the files are unchanged.
+    """
+
+    def __init__(self, filepath, fast_digests=False):
+        log = logging.getLogger(__name__)
+        log.debug("reading hash cache from %r", filepath)
+
+        self._filepath = Path(filepath)
+        self.fast_digests = bool(fast_digests)
+        self._filepath.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.RLock()
+
+        try:
+            self._conn = sqlite3.connect(
+                str(self._filepath), check_same_thread=False
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS hashes ("
+                "  path TEXT PRIMARY KEY,"
+                "  size INTEGER NOT NULL,"
+                "  mtime REAL NOT NULL,"
+                "  hash TEXT NOT NULL,"
+                "  digest TEXT"
+                ")"
+            )
+
+            # Caches created before fast digests were supported
+            columns = self._conn.execute("PRAGMA table_info(hashes)").fetchall()
+            if "digest" not in {column[1] for column in columns}:
+                log.info("adding digest column to hash cache")
+                self._conn.execute("ALTER TABLE hashes ADD COLUMN digest TEXT")
+
+            self._conn.commit()
+        except sqlite3.Error as error:
+            log.error("error while opening hash cache: %r", error)
+            raise
+
+    def get(self, filepath):
+        """Returns the cached PartialStats for 'filepath' or None if not cached."""
+        if not isinstance(filepath, (Path, str)):
+            raise ValueError(f"expected Path or str, not {filepath!r}")
+
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT hash, size, mtime FROM hashes WHERE path = ?", (str(filepath),)
+            ).fetchone()
+        if row is None:
+            return None
+
+        md5, size, mtime = row
+
+        return PartialStats(hash=md5, size=size, mtime=mtime)
+
+    def get_digest(self, filepath):
+        """Returns the cached (PartialStats, digest) for 'filepath' or None if the
+        file is not cached or if no digest was recorded for it.
+        """
+        if not isinstance(filepath, (Path, str)):
+            raise ValueError(f"expected Path or str, not {filepath!r}")
+
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT hash, size, mtime, digest FROM hashes WHERE path = ?",
+                (str(filepath),),
+            ).fetchone()
+        if row is None or row[3] is None:
+            return None
+
+        md5, size, mtime, digest = row
+
+        return PartialStats(hash=md5, size=size, mtime=mtime), digest
+
+    def set(self, filepath, value, digest=None):
+        """Caches 'value' and optionally the fast 'digest' of the file for
+        'filepath'; changes are written by commit().
+        """
+        if not isinstance(filepath, (Path, str)):
+            raise ValueError(f"expected Path or str, not {filepath!r}")
+        elif not isinstance(value, PartialStats):
+            raise ValueError(f"expected PartialStats, not {value!r}")
+        elif value.hash is None or value.size is None or value.mtime is None:
+            raise ValueError(f"hash, size, and mtime required, not {value!r}")
+        elif not (digest is None or isinstance(digest, str)):
+            raise ValueError(f"expected str or None, not {digest!r}")
+
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO hashes (path, size, mtime, hash, digest) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (str(filepath), value.size, value.mtime, value.hash, digest),
+            )
+
+    def commit(self):
+        with self._lock:
+            self._conn.commit()
+
+    def evict_missing(self, root):
+        """Removes cached hashes for files in 'root' that no longer exist; returns the
+        number of entries removed. Each folder is listed once, instead of checking
+        every cached file individually.
+        """
+        log = logging.getLogger(__name__)
+        prefix = os.path.join(str(root), "")
+
+        with self._lock:
+            filepaths = self._conn.execute(
+                "SELECT path FROM hashes WHERE substr(path, 1, ?) = ?",
+                (len(prefix), prefix),
+            ).fetchall()
+
+        folders = collections.defaultdict(list)
+        for (filepath,) in filepaths:
+            folders[os.path.dirname(filepath)].append(filepath)
+
+        missing = []
+        for dirpath, filepaths in folders.items():
+            try:
+                filenames = frozenset(os.listdir(dirpath))
+            except (FileNotFoundError, NotADirectoryError):
+                filenames = frozenset()
+
+            for filepath in filepaths:
+                if os.path.basename(filepath) not in filenames:
+                    missing.append((filepath,))
+
+        if missing:
+            log.info("evicting %i missing files from hash cache", len(missing))
+            with self._lock:
+                self._conn.executemany("DELETE FROM hashes WHERE path = ?", missing)
+                self._conn.commit()
+
+        return len(missing)
+
+    def close(self):
+        with self._lock:
+            self._conn.commit()
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args, **kwargs):
+        self.close()
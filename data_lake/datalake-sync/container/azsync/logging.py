@@ -1,7 +1,14 @@
+import collections
+import heapq
 import html
+import itertools
+import json
 import logging
+import os
 import smtplib
+import tempfile
 import time
+import zlib
 
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
@@ -16,50 +23,173 @@ _FORMATTER = logging.Formatter(_FORMAT, datefmt="%H:%M:%S")
 
 
 class MemoryHandler(logging.Handler):
-    """Implements logging using an in-memory stream."""
+    """Records log messages for emailing the log on errors. The last 'max_records'
+    messages and all WARNING or higher messages are kept in memory, while older
+    messages are compressed and spilled to a temporary file, so that memory use is
+    bounded regardless of the log-level and the number of messages.
+    """
 
     _format_date = logging.Formatter("%(asctime)s").format
     _format_name = logging.Formatter("%(name)s").format
     _format_level = logging.Formatter("%(levelname)s").format
     _format_msg = logging.Formatter("%(message)s").format
 
-    def __init__(self):
-        self._records = []
-        self._max_level = logging.NOTSET
+    # Number of spilled messages compressed together
+    _spill_chunk_size = 1000
+
+    def __init__(self, max_records=10000):
+        if not (isinstance(max_records, int) and max_records > 0):
+            raise ValueError(f"max_records must be > 0, not {max_records!r}")
+
         logging.Handler.__init__(self)
+        self._max_records = max_records
+        self._reset()
 
     def emit(self, record):
         # Track the highest level log event observed
         self._max_level = max(self._max_level, record.levelno)
 
-        self._records.append(record)
+        self._recent.append((next(self._counter), record))
+        if len(self._recent) > self._max_records:
+            seq, record = self._recent.popleft()
+            if record.levelno >= logging.WARNING:
+                self._warnings.append((seq, record))
+            else:
+                self._spill(seq, record)
 
     def max_level(self):
         """Returns the highest log level observed by the stream."""
         return self._max_level
 
-    def log_content(self):
-        def _fmt(record, formatter):
-            return (html.escape(formatter(record)),)
+    def log_content(self, max_size=None):
+        return "\n".join(self.iter_log_content(max_size))
 
-        lines = []
-        lines.extend(self._HEADER)
+    def iter_log_content(self, max_size=None):
+        """Yields the lines of the HTML log; spilled messages are read back one
+        compressed chunk at a time. If 'max_size' is set, then the oldest messages
+        below ERROR are omitted until the rows of the log are at most that many
+        characters long (or only errors remain), and a note is added in their place.
+        """
+        yield from self._HEADER
 
-        _append = lines.append
-        for record in self._records:
-            _append("        <tr class='%s'>" % (record.levelname.lower(),))
-            _append("          <td>%s</td>" % _fmt(record, self._format_date))
-            _append("          <td>%s</td>" % _fmt(record, self._format_name))
-            _append("          <td>%s</td>" % _fmt(record, self._format_level))
-            _append("          <td>%s</td>" % _fmt(record, self._format_msg))
-            _append("        </tr>")
+        omit = 0
+        if max_size is not None:
+            # The first pass only measures the rows, keeping memory use bounded
+            total_size = sum(_row_size(row) for row in self._iter_rows())
+            omit = max(0, total_size - max_size)
 
-        lines.extend(self._TAIL)
+        omitted = 0
+        for row in self._iter_rows():
+            if omit > 0 and row[1] not in ("error", "critical"):
+                omit -= _row_size(row)
+                omitted += 1
+                continue
+            elif omitted:
+                yield from _render_row(self._omitted_note(omitted))
+                omitted = 0
 
-        return "\n".join(lines)
+            yield from _render_row(row)
+
+        if omitted:
+            yield from _render_row(self._omitted_note(omitted))
+
+        yield from self._TAIL
 
     def log_records(self):
-        return list(self._records)
+        """Returns the records kept in memory, i.e. excluding spilled messages."""
+        with self.lock:
+            records = list(self._warnings) + list(self._recent)
+
+        return [record for _, record in sorted(records, key=_get_seq)]
+
+    def clear(self):
+        """Discards recorded messages, e.g. after they have been emailed."""
+        with self.lock:
+            self._close_spill_file()
+            self._reset()
+
+    def close(self):
+        with self.lock:
+            self._close_spill_file()
+
+        logging.Handler.close(self)
+
+    def _reset(self):
+        self._max_level = logging.NOTSET
+        self._counter = itertools.count()
+        self._recent = collections.deque()
+        self._warnings = []
+        # Rows waiting to be compressed and (offset, size) of compressed chunks
+        self._spill_rows = []
+        self._spill_chunks = []
+        self._spill_size = 0
+        self._spill_file = None
+
+    def _spill(self, seq, record):
+        self._spill_rows.append(self._row(seq, record))
+        if len(self._spill_rows) >= self._spill_chunk_size:
+            if self._spill_file is None:
+                self._spill_file = tempfile.TemporaryFile(prefix="azsync_log_")
+
+            data = zlib.compress(json.dumps(self._spill_rows).encode("utf-8"))
+            self._spill_file.write(data)
+            self._spill_file.flush()
+
+            self._spill_chunks.append((self._spill_size, len(data)))
+            self._spill_size += len(data)
+            self._spill_rows = []
+
+    def _iter_rows(self):
+        """Yields (seq, css, date, name, level, message) for every message in the
+        order they were logged. The state is copied, so that messages logged while
+        iterating do not affect the output.
+        """
+        with self.lock:
+            spill_file = self._spill_file
+            spill_chunks = list(self._spill_chunks)
+            spill_rows = list(self._spill_rows)
+            warnings = list(self._warnings)
+            recent = list(self._recent)
+
+        def _spilled():
+            for offset, size in spill_chunks:
+                data = os.pread(spill_file.fileno(), size, offset)
+                yield from json.loads(zlib.decompress(data))
+
+            yield from spill_rows
+
+        def _kept(records):
+            for seq, record in records:
+                yield self._row(seq, record)
+
+        return heapq.merge(_spilled(), _kept(warnings), _kept(recent), key=_get_seq)
+
+    def _row(self, seq, record):
+        return (
+            seq,
+            record.levelname.lower(),
+            self._format_date(record),
+            self._format_name(record),
+            self._format_level(record),
+            self._format_msg(record),
+        )
+
+    @staticmethod
+    def _omitted_note(count):
+        return (
+            None,
+            "warning",
+            "",
+            "",
+            "",
+            f"{count} older messages were omitted to limit the size of this log; "
+            "see the log-file for the full log",
+        )
+
+    def _close_spill_file(self):
+        if self._spill_file is not None:
+            self._spill_file.close()
+            self._spill_file = None
 
     _HEADER = [
         "<html>",
@@ -96,6 +226,26 @@ class MemoryHandler(logging.Handler):
     ]
 
 
+def _get_seq(row):
+    return row[0]
+
+
+def _render_row(row):
+    _, css, date, name, level, msg = row
+
+    yield "        <tr class='%s'>" % (css,)
+    yield "          <td>%s</td>" % (html.escape(date),)
+    yield "          <td>%s</td>" % (html.escape(name),)
+    yield "          <td>%s</td>" % (html.escape(level),)
+    yield "          <td>%s</td>" % (html.escape(msg),)
+    yield "        </tr>"
+
+
+def _row_size(row):
+    """Returns the number of characters in the rendered row, including newlines."""
+    return sum(len(line) + 1 for line in _render_row(row))
+
+
 def email(recipients, host, port, user, password, text):
     """Will attempt to email the given text to one or more recipients using
     the specified SMTP server. SSH is required except for localhost.
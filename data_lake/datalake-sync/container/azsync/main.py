@@ -1,9 +1,11 @@
 #!/usr/bin/env python3
 # -*- coding: utf8 -*-
+import functools
 import logging
 import logging.handlers
 import os
 import shutil
+import signal
 import sys
 import traceback
 
@@ -17,6 +19,7 @@ import azsync.commands.proteomics
 import azsync.logging
 import azsync.sync
 
+from azsync.commands.common import new_bandwidth_budget
 from azsync.fileutils import try_makedirs
 from azsync.logging import MemoryHandler
 
@@ -27,10 +30,11 @@ _LOG_MAX_SIZE = 1024 * 1042
 _LOG_MAX_FILES = 5
 
 
-def setup_logging(log_level, log_file):
+def setup_logging(log_level, log_file, memory_records=10000):
     """Sets up logging and returns the module level logger and a StringIO
     object that will receive all logged messages. If log_file is not None, a
-    rotating will be created at that path.
+    rotating will be created at that path. Up to 'memory_records' messages and
+    all warnings/errors are kept in memory, with the remainder spilled to disk.
 
     Will use 'coloredlogs' if installed, otherwise will fall back to plain logs.
     """
@@ -51,7 +55,7 @@ def setup_logging(log_level, log_file):
         root_log.addHandler(handler)
 
     # Log to memory, allowing error messages to be emailed regardless of FS state
-    handler = MemoryHandler()
+    handler = MemoryHandler(max_records=memory_records)
     handler.setFormatter(logging.Formatter(_LOG_FORMAT))
     root_log.addHandler(handler)
 
@@ -84,12 +88,57 @@ def parse_args(argv):
     return args
 
 
+def report_errors(args, log_handler):
+    """Emails the log if any errors were logged and clears the log; returns true if
+    errors were logged. Called after each batch of runs when using --watch.
+    """
+    log = logging.getLogger(_LOGGER)
+    if log_handler.max_level() < logging.ERROR:
+        return False
+
+    if args.log_recipients and args.smtp_host:
+        try:
+            azsync.logging.email(
+                recipients=args.log_recipients,
+                host=args.smtp_host,
+                port=args.smtp_port,
+                user=args.smtp_user,
+                password=args.smtp_password,
+                text=log_handler.log_content(
+                    max_size=args.log_email_max_mb * 1024 * 1024 or None
+                ),
+            )
+        except Exception as error:
+            log.error("failed to email log using %r: %r", args.smtp_host, error)
+            # Errors are kept, so that the log is emailed again later
+            return True
+
+    log_handler.clear()
+
+    return True
+
+
+def _stop_watching(signum, frame):
+    raise KeyboardInterrupt(f"received signal {signum}")
+
+
 def main(argv):
     args = parse_args(argv)
     args.main_folder = args.main_folder.absolute()
+    if args.hash_cache is None:
+        args.hash_cache = args.state_file.with_suffix(".hashes")
 
-    log, log_handler = setup_logging(log_level=args.log_level, log_file=args.log_file)
+    log, log_handler = setup_logging(
+        log_level=args.log_level,
+        log_file=args.log_file,
+        memory_records=args.log_memory_records,
+    )
     log.info("running %s", " ".join(sys.argv))
+    args.report_errors = functools.partial(report_errors, args, log_handler)
+    if getattr(args, "watch", False):
+        # Lets the daemon finish cleanly when stopped by docker/systemd
+        signal.signal(signal.SIGTERM, _stop_watching)
+
     if args.log_recipients and not args.smtp_host:
         log.error("recipients for log-file specified, but no --smtp-host was provided")
 
@@ -113,7 +162,9 @@ def main(argv):
         else:
             try:
                 with pid.PidFile(args.pid_file.name, args.pid_file.parent):
-                    args.command_main(args)
+                    with new_bandwidth_budget(args) as bandwidth:
+                        args.bandwidth = bandwidth
+                        args.command_main(args)
             except pid.PidFileError as error:
                 log.warning("Process is already running: %r", error)
     except azsync.azcopy.AZError as error:
@@ -123,20 +174,7 @@ def main(argv):
         for line in traceback.format_exc().splitlines():
             log.error("%s", line)
 
-    if log_handler.max_level() >= logging.ERROR:
-        if args.log_recipients and args.smtp_host:
-            try:
-                azsync.logging.email(
-                    recipients=args.log_recipients,
-                    host=args.smtp_host,
-                    port=args.smtp_port,
-                    user=args.smtp_user,
-                    password=args.smtp_password,
-                    text=log_handler.log_content(),
-                )
-            except Exception as error:
-                log.error("failed to email log using %r: %r", args.smtp_host, error)
-
+    if args.report_errors():
         return 1
 
     return 0
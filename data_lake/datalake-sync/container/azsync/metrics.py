@@ -0,0 +1,240 @@
+import collections
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+
+from pathlib import Path
+
+_MB = 1024 * 1024
+
+
+class TaskMetrics:
+    """Counters and per-phase wall times collected while executing a single task.
+    Phases are named after the operation being timed, e.g. 'sync', 'hash', 'list',
+    and 'upload'; time spent in a phase is summed across the rounds of a task.
+    """
+
+    def __init__(self, task, dst_url, tries):
+        self.task = task
+        self.dst_url = dst_url
+        self.tries = tries
+        self.tries_left = tries
+        self.seconds = collections.defaultdict(float)
+        self.files_hashed = 0
+        self.files_cached = 0
+        self.bytes_hashed = 0
+        self.files_uploaded = 0
+        self.bytes_uploaded = 0
+        self.listings = 0
+        self._started = time.monotonic()
+
+    @property
+    def kind(self):
+        """Returns the name of the task class, e.g. 'CheckedSync'."""
+        return self.task.split("(", 1)[0]
+
+    @property
+    def retries(self):
+        """Returns the number of tries consumed by the task."""
+        return self.tries - max(0, self.tries_left)
+
+    @property
+    def succeeded(self):
+        return self.tries_left > 0
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Adds the wall time spent in the 'with' block to the phase 'name'."""
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.seconds[name] += time.monotonic() - started
+
+    def add_hashed(self, filestats, pending):
+        """Records hashes collected for 'filestats', where the files in 'pending'
+        were hashed and the remaining hashes were found in caches.
+        """
+        self.files_hashed += len(pending)
+        self.files_cached += len(filestats) - len(pending)
+        self.bytes_hashed += sum(filestats[filepath].size for filepath in pending)
+
+    def add_uploaded(self, nfiles, nbytes):
+        self.files_uploaded += nfiles
+        self.bytes_uploaded += nbytes
+
+    def finish(self, tries_left):
+        self.tries_left = tries_left
+        self.seconds["total"] = time.monotonic() - self._started
+
+    def to_json(self):
+        listing_seconds = self.seconds.get("list", 0.0)
+
+        return {
+            "task": self.task,
+            "dst_url": self.dst_url,
+            "succeeded": self.succeeded,
+            "tries": self.tries,
+            "retries": self.retries,
+            "seconds": dict(self.seconds),
+            "files_hashed": self.files_hashed,
+            "files_cached": self.files_cached,
+            "bytes_hashed": self.bytes_hashed,
+            "files_uploaded": self.files_uploaded,
+            "bytes_uploaded": self.bytes_uploaded,
+            "listings": self.listings,
+            "hash_mb_per_sec": _rate(self.bytes_hashed, self.seconds.get("hash")),
+            "upload_mb_per_sec": _rate(
+                self.bytes_uploaded, self.seconds.get("upload")
+            ),
+            "listing_latency": listing_seconds / self.listings
+            if self.listings
+            else None,
+        }
+
+    def __repr__(self):
+        seconds = ", ".join(
+            f"{key}={value:.1f}s" for key, value in sorted(self.seconds.items())
+        )
+
+        return (
+            f"TaskMetrics(retries={self.retries}/{self.tries}, {seconds}, "
+            f"hashed={self.files_hashed} files/{self.bytes_hashed / _MB:.1f} MB, "
+            f"cached={self.files_cached} files, "
+            f"uploaded={self.files_uploaded} files/{self.bytes_uploaded / _MB:.1f} MB"
+            f", listings={self.listings})"
+        )
+
+
+class MetricsReport:
+    """Collects the TaskMetrics of tasks executed by a command and writes them as a
+    JSON summary and/or in the Prometheus text format, for use with the textfile
+    collector of the node exporter. Files are written when the report is closed.
+    Tasks may be added from multiple threads.
+    """
+
+    def __init__(self, command, json_file=None, prometheus_file=None):
+        self.command = command
+        self.json_file = json_file
+        self.prometheus_file = prometheus_file
+        self.tasks = []
+        self._started = time.time()
+        self._lock = threading.Lock()
+
+    def add(self, metrics):
+        if not isinstance(metrics, TaskMetrics):
+            raise ValueError(f"expected TaskMetrics, not {metrics!r}")
+
+        with self._lock:
+            self.tasks.append(metrics)
+
+    def to_json(self):
+        with self._lock:
+            tasks = [metrics.to_json() for metrics in self.tasks]
+
+        return {
+            "command": self.command,
+            "started": self._started,
+            "finished": time.time(),
+            "tasks": tasks,
+        }
+
+    def to_prometheus(self):
+        totals = collections.defaultdict(float)
+        with self._lock:
+            for metrics in self.tasks:
+                labels = (("task", metrics.kind),)
+                status = "succeeded" if metrics.succeeded else "failed"
+
+                totals["tasks", labels + (("status", status),)] += 1
+                totals["retries", labels] += metrics.retries
+                totals["listings", labels] += metrics.listings
+                for phase, seconds in metrics.seconds.items():
+                    totals["phase_seconds", labels + (("phase", phase),)] += seconds
+
+                for kind in ("hashed", "cached", "uploaded"):
+                    value = getattr(metrics, f"files_{kind}")
+                    totals["files", labels + (("kind", kind),)] += value
+
+                for kind in ("hashed", "uploaded"):
+                    value = getattr(metrics, f"bytes_{kind}")
+                    totals["bytes", labels + (("kind", kind),)] += value
+
+        lines = []
+        for name, help_text in _PROMETHEUS_METRICS:
+            lines.append(f"# HELP azsync_{name} {help_text}")
+            lines.append(f"# TYPE azsync_{name} gauge")
+
+            if name == "last_run_timestamp_seconds":
+                totals[name, ()] = time.time()
+
+            for (key, labels), value in sorted(totals.items()):
+                if key == name:
+                    labels = _format_labels((("command", self.command),) + labels)
+                    lines.append(f"azsync_{name}{{{labels}}} {value}")
+
+        return "\n".join(lines) + "\n"
+
+    def flush(self):
+        """Writes the metrics collected so far and starts a new report; used by
+        long-running commands after each batch of tasks.
+        """
+        self.close()
+
+        with self._lock:
+            self.tasks = []
+            self._started = time.time()
+
+    def close(self):
+        log = logging.getLogger(__name__)
+
+        if self.json_file is not None:
+            log.info("writing task metrics to '%s'", self.json_file)
+            _write_atomic(self.json_file, json.dumps(self.to_json(), indent=2))
+
+        if self.prometheus_file is not None:
+            log.info("writing prometheus metrics to '%s'", self.prometheus_file)
+            _write_atomic(self.prometheus_file, self.to_prometheus())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+
+_PROMETHEUS_METRICS = (
+    ("tasks", "Number of tasks executed in the last run"),
+    ("retries", "Tries consumed by tasks in the last run"),
+    ("listings", "Remote listings and lookups performed in the last run"),
+    ("phase_seconds", "Wall time spent per phase of tasks in the last run"),
+    ("files", "Files hashed, found in caches, or uploaded in the last run"),
+    ("bytes", "Bytes hashed or uploaded in the last run"),
+    ("last_run_timestamp_seconds", "Time at which the last run finished"),
+)
+
+
+def _rate(nbytes, seconds):
+    if not seconds:
+        return None
+
+    return nbytes / _MB / seconds
+
+
+def _format_labels(labels):
+    return ",".join(f'{key}="{value}"' for key, value in labels)
+
+
+def _write_atomic(filepath, text):
+    """Writes to a temporary file that is then renamed, so that readers such as the
+    textfile collector never observe partially written files.
+    """
+    filepath = Path(filepath)
+    filepath.parent.mkdir(parents=True, exist_ok=True)
+
+    tmp_filepath = filepath.with_name(f".{filepath.name}.{os.getpid()}.tmp")
+    tmp_filepath.write_text(text)
+    tmp_filepath.replace(filepath)
@@ -0,0 +1,204 @@
+import json
+import logging
+import os
+import sqlite3
+import time
+
+from contextlib import closing
+from pathlib import Path
+
+from azsync.fileutils import PartialStats
+
+# Directories modified this close to the previous scan are always listed again, since
+# further changes within the resolution of the mtime would otherwise go unnoticed
+_RACY_SECONDS = 2.0
+
+
+class TreeScan:
+    """Result of TreeSnapshot.scan: 'files' is a dict of {filepath: PartialStats} for
+    all files in the tree, while 'added', 'changed', and 'removed' are sets of paths
+    that differ from the previous scan of the same tree.
+    """
+
+    def __init__(self, files, added, changed, removed, newest_mtime):
+        self.files = files
+        self.added = added
+        self.changed = changed
+        self.removed = removed
+        self.newest_mtime = newest_mtime
+
+    def __repr__(self):
+        return (
+            f"TreeScan({len(self.files)} files, {len(self.added)} added, "
+            f"{len(self.changed)} changed, {len(self.removed)} removed)"
+        )
+
+
+class TreeSnapshot:
+    """Persistent snapshot of directory trees, recording the mtime and the entries of
+    each directory. Directories with an unchanged mtime are not listed again; only the
+    files recorded for them are stat'ed, since files modified in-place do not change
+    the mtime of their directory. The sizes and mtimes returned are therefore always
+    current. The snapshot only stores paths, so that it can be passed to worker
+    processes; each scan opens a new connection to the database.
+    """
+
+    def __init__(self, filepath):
+        self._filepath = Path(filepath)
+        self._filepath.parent.mkdir(parents=True, exist_ok=True)
+
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS dirs ("
+                "  path TEXT PRIMARY KEY,"
+                "  mtime REAL NOT NULL,"
+                "  scanned REAL NOT NULL,"
+                "  files TEXT NOT NULL,"
+                "  dirs TEXT NOT NULL"
+                ")"
+            )
+
+    def scan(self, root):
+        """Scans the tree at 'root', updates the snapshot, and returns a TreeScan."""
+        log = logging.getLogger(__name__)
+        root = Path(root)
+        if not root.is_dir():
+            # Single files are simply stat'ed, matching collect_files
+            stats = PartialStats.from_filepath(root)
+
+            return TreeScan({root: stats}, set(), set(), set(), stats.mtime)
+
+        with closing(self._connect()) as conn, conn:
+            previous, old_files = _load_rows(conn, root)
+
+            scan_time = time.time()
+            files = {}
+            newest_mtime = None
+            updates = []
+            listed = 0
+
+            pending = [root]
+            while pending:
+                dirpath = pending.pop()
+                mtime = os.stat(dirpath).st_mtime
+                newest_mtime = max(mtime, newest_mtime or mtime)
+
+                row = previous.pop(str(dirpath), None)
+                dir_files = None
+                if row is not None and _is_unchanged(row, mtime):
+                    # Files modified in-place do not change the mtime of the folder
+                    _, scanned, _, subdirs = row
+                    dir_files = _stat_files(dirpath, row[2])
+
+                if dir_files is None:
+                    scanned = scan_time
+                    dir_files, subdirs = _list_dir(dirpath)
+                    listed += 1
+
+                if (mtime, scanned, dir_files, subdirs) != row:
+                    updates.append(
+                        (
+                            str(dirpath),
+                            mtime,
+                            scanned,
+                            json.dumps(dir_files),
+                            json.dumps(subdirs),
+                        )
+                    )
+
+                for name, (size, file_mtime) in dir_files.items():
+                    files[dirpath / name] = PartialStats(size=size, mtime=file_mtime)
+                    newest_mtime = max(newest_mtime, file_mtime)
+
+                pending.extend(dirpath / name for name in subdirs)
+
+            # Directories not seen in this scan have been removed
+            conn.executemany(
+                "DELETE FROM dirs WHERE path = ?", [(key,) for key in previous]
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO dirs (path, mtime, scanned, files, dirs) "
+                "VALUES (?, ?, ?, ?, ?)",
+                updates,
+            )
+
+        log.debug("listed %i folders while scanning '%s'", listed, root)
+
+        added = set(files) - set(old_files)
+        removed = set(old_files) - set(files)
+        changed = set()
+        for filepath in set(files) & set(old_files):
+            if files[filepath] != old_files[filepath]:
+                changed.add(filepath)
+
+        return TreeScan(files, added, changed, removed, newest_mtime)
+
+    def _connect(self):
+        # Runs may be scanned concurrently, in which case writes must wait
+        return sqlite3.connect(str(self._filepath), timeout=60)
+
+
+def _load_rows(conn, root):
+    """Returns the previous rows for 'root' and its sub-folders, as a dict of
+    {path: (mtime, scanned, files, dirs)}, and the files listed in those rows.
+    """
+    prefix = os.path.join(str(root), "")
+    rows = conn.execute(
+        "SELECT path, mtime, scanned, files, dirs FROM dirs "
+        "WHERE path = ? OR substr(path, 1, ?) = ?",
+        (str(root), len(prefix), prefix),
+    ).fetchall()
+
+    previous = {}
+    old_files = {}
+    for path, mtime, scanned, dir_files, subdirs in rows:
+        dir_files = json.loads(dir_files)
+        previous[path] = (mtime, scanned, dir_files, json.loads(subdirs))
+
+        for name, (size, file_mtime) in dir_files.items():
+            old_files[Path(path) / name] = PartialStats(size=size, mtime=file_mtime)
+
+    return previous, old_files
+
+
+def _is_unchanged(row, mtime):
+    old_mtime, scanned, _, _ = row
+
+    return old_mtime == mtime and mtime < scanned - _RACY_SECONDS
+
+
+def _stat_files(dirpath, dir_files):
+    """Returns {filename: (size, mtime)} for the files previously listed for an
+    unchanged folder, or None if any of the files are missing.
+    """
+    files = {}
+    for name in dir_files:
+        try:
+            filestat = os.stat(dirpath / name)
+        except FileNotFoundError:
+            return None
+
+        # Lists rather than tuples, to match rows loaded from JSON
+        files[name] = [filestat.st_size, filestat.st_mtime]
+
+    return files
+
+
+def _list_dir(dirpath):
+    """Returns {filename: (size, mtime)} and a list of sub-folders for 'dirpath'. Like
+    os.walk, symbolic links to folders are not followed.
+    """
+    files = {}
+    subdirs = []
+    with os.scandir(dirpath) as entries:
+        for entry in entries:
+            if entry.is_dir():
+                if not entry.is_symlink():
+                    subdirs.append(entry.name)
+            else:
+                filestat = entry.stat()
+                files[entry.name] = (filestat.st_size, filestat.st_mtime)
+
+    subdirs.sort()
+
+    return files, subdirs
@@ -1,12 +1,17 @@
 import json
 import logging
 import os
+import sqlite3
+import threading
 import time
 import datetime
 
 from pathlib import Path
 
-from azsync.fileutils import PartialStats, iglob_folder
+from azsync.fileutils import PartialStats
+
+
+_SQLITE_HEADER = b"SQLite format 3\x00"
 
 
 def _get_value(name):
@@ -29,9 +34,10 @@ def _get_boolean_value(name):
 
 def _update_timestamp(name, overwrite=False):
     def _flag_setter(self):
-        if overwrite or self._data.get(name) is None:
-            self._data[name] = datetime.datetime.utcnow().timestamp()
-            self._parent._dirty = True
+        with self._parent._lock:
+            if overwrite or self._data.get(name) is None:
+                self._data[name] = datetime.datetime.utcnow().timestamp()
+                self._parent._update_run(self._kind, self._name, self._data)
 
     return _flag_setter
 
@@ -41,11 +47,13 @@ class StateError(RuntimeError):
 
 
 class _StateBase:
-    __slots__ = ["_parent", "_data"]
+    __slots__ = ["_parent", "_kind", "_name", "_data"]
 
-    def __init__(self, data, parent):
+    def __init__(self, data, parent, kind, name):
         self._data = data
         self._parent = parent
+        self._kind = kind
+        self._name = name
 
 
 class _MetabolomicsState(_StateBase):
@@ -84,106 +92,82 @@ class _ProteomicsState(_StateBase):
 
 
 class PersistentState:
-    def __init__(self, filepath, max_backups=10):
-        if not isinstance(max_backups, int) and max_backups >= 0:
-            raise ValueError(f"max_backups must be >= 0, not {max_backups!r}")
-        self._max_backups = max_backups
-        self._dirty = False
+    """SQLite backed state, with one row per run and per file. Updates are written
+    immediately, but only committed by save(). Updates may be made from multiple
+    threads, but are serialized with each other and with calls to save().
 
+    JSON state files written by earlier versions are converted when opened; the JSON
+    file is kept as a timestamped backup next to the state file.
+    """
+
+    def __init__(self, filepath):
         logger = logging.getLogger(__name__)
-        logging.debug("reading state from %r", filepath)
+        logger.debug("reading state from %r", filepath)
+
+        self._filepath = Path(filepath)
+        self._lock = threading.RLock()
+        # Run states are cached, so that every state object for a run shares its data
+        self._runs = {}
 
         try:
-            self._filepath = Path(filepath)
-            with self._filepath.open() as handle:
-                self._data = json.load(handle)
-        except FileNotFoundError:
-            logger.info("statefile '%s' not found; creating new state", self._filepath)
-            self._data = {}
+            if _is_json_state(self._filepath):
+                _migrate_json_state(self._filepath)
+            elif not self._filepath.exists():
+                logger.info("statefile '%s' not found; creating new state", filepath)
+
+            self._conn = _connect(self._filepath)
         except Exception as error:
             logger.error("error while reading statefile: %r", error)
             raise
 
     def save(self, force=False):
-        if self._dirty or force:
-            logger = logging.getLogger(__name__)
-            logging.info("writing state to %r", self._filepath)
-
-            data = json.dumps(self._data)
-
-            filepath = self._filepath
-            folder = filepath.parent
-            folder.mkdir(parents=True, exist_ok=True)
-
-            # Create hard-link to current file, allowing safe replacement
-            while True:
-                backup = _add_timestamp(filepath)
-                try:
-                    os.link(filepath, backup)
-                    break
-                except FileExistsError:
-                    pass  # Possible race-condition?
-                except FileNotFoundError:
-                    break  # No previous state file
-
-            # Write current data to temporary file
-            while True:
-                replacement = _add_timestamp(filepath, "_new")
-                try:
-                    with replacement.open("x") as handle:
-                        handle.write(data)
-                        handle.flush()
-                        break
-                except FileExistsError:
-                    pass
-
-            # Finally, replace original file with new content
-            replacement.replace(filepath)
-
-            # Clean up old backups
-            backups = iglob_folder(filepath.parent, filepath.name + ".[0-9]*")
-            for backup in backups[: -self._max_backups]:
-                logger.debug("removing backup file %r", backups[0])
-                backup.unlink()
-
-            self._dirty = False
+        with self._lock:
+            if self._conn.in_transaction or force:
+                logger = logging.getLogger(__name__)
+                logger.info("writing state to %r", self._filepath)
 
-    def get_metabolomics_run(self, name):
-        runs = self._data.setdefault("metabolomics", {})
-        if name not in runs:
-            runs[name] = {"observed": datetime.datetime.utcnow().timestamp()}
-            self._dirty = True
+                self._conn.commit()
 
-        return _MetabolomicsState(data=runs[name], parent=self)
+    def close(self):
+        with self._lock:
+            self._conn.commit()
+            self._conn.close()
 
-    def get_ngs_run(self, name):
-        runs = self._data.setdefault("ngs", {})
-        if name not in runs:
-            runs[name] = {"observed": datetime.datetime.utcnow().timestamp()}
-            self._dirty = True
+    def get_metabolomics_run(self, name):
+        return _MetabolomicsState(**self._get_run("metabolomics", name))
 
-        return _NGSState(data=runs[name], parent=self)
+    def get_ngs_run(self, name):
+        return _NGSState(**self._get_run("ngs", name))
 
     def get_ngs_runs(self):
-        for key, value in self._data.get("ngs", {}).items():
-            yield key, _NGSState(data=value, parent=self)
+        with self._lock:
+            names = self._conn.execute(
+                "SELECT name FROM runs WHERE kind = ? ORDER BY rowid", ("ngs",)
+            ).fetchall()
 
-    def get_proteomics_run(self, name):
-        runs = self._data.setdefault("proteomics", {})
-        if name not in runs:
-            runs[name] = {"observed": datetime.datetime.utcnow().timestamp()}
-            self._dirty = True
+            runs = [(name, self._get_run("ngs", name)) for (name,) in names]
 
-        return _ProteomicsState(data=runs[name], parent=self)
+        for key, value in runs:
+            yield key, _NGSState(**value)
+
+    def get_proteomics_run(self, name):
+        return _ProteomicsState(**self._get_run("proteomics", name))
 
     def get_file_stats(self, filepath):
         if not isinstance(filepath, (Path, str)):
             raise ValueError(f"expected Path or str, not {filepath!r}")
 
-        stats = self._data.get("stats", {})
-        item = stats.get(str(filepath))
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT hash, size, mtime FROM stats WHERE path = ?", (str(filepath),)
+            ).fetchone()
+
+        if row is None:
+            return None
+
+        md5, size, mtime = row
 
-        return None if item is None else PartialStats.from_json(item)
+        return PartialStats(hash=md5, size=size, mtime=mtime)
 
     def set_file_stats(self, filepath, value):
         if not isinstance(filepath, (Path, str)):
@@ -191,15 +175,171 @@ class PersistentState:
         elif not isinstance(value, PartialStats):
             raise ValueError(f"expected PartialStats, not {value!r}")
 
-        stats = self._data.setdefault("stats", {})
-        stats[str(filepath)] = value.to_json()
-        self._dirty = True
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO stats (path, hash, size, mtime) "
+                "VALUES (?, ?, ?, ?)",
+                (str(filepath), value.hash, value.size, value.mtime),
+            )
+
+    def get_staged_blocks(self, dst_url, stats):
+        """Returns the set of block IDs staged for an upload of a file with the size
+        and mtime in 'stats' to 'dst_url'; blocks staged for other versions of the
+        file are not returned.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT block_id FROM blocks WHERE url = ? AND size = ? AND mtime = ?",
+                (dst_url, stats.size, stats.mtime),
+            ).fetchall()
+
+        return {block_id for (block_id,) in rows}
+
+    def add_staged_block(self, dst_url, stats, block_id):
+        """Records a block staged for 'dst_url'; the block is committed immediately,
+        so that the upload can be resumed even if the process is killed.
+        """
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM blocks WHERE url = ? AND (size != ? OR mtime != ?)",
+                (dst_url, stats.size, stats.mtime),
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO blocks (url, size, mtime, block_id) "
+                "VALUES (?, ?, ?, ?)",
+                (dst_url, stats.size, stats.mtime, block_id),
+            )
+            self._conn.commit()
+
+    def clear_staged_blocks(self, dst_url):
+        """Forgets the blocks staged for 'dst_url', e.g. once they are committed."""
+        with self._lock:
+            self._conn.execute("DELETE FROM blocks WHERE url = ?", (dst_url,))
+            self._conn.commit()
+
+    def _get_run(self, kind, name):
+        """Returns keyword arguments for the state object of run 'name'; the run is
+        added to the state if it has not been observed before.
+        """
+        with self._lock:
+            data = self._runs.get((kind, name))
+            if data is None:
+                row = self._conn.execute(
+                    "SELECT data FROM runs WHERE kind = ? AND name = ?", (kind, name)
+                ).fetchone()
+
+                if row is None:
+                    data = {"observed": datetime.datetime.utcnow().timestamp()}
+                    self._update_run(kind, name, data)
+                else:
+                    (data,) = row
+                    data = json.loads(data)
+
+                self._runs[(kind, name)] = data
+
+            return {"data": data, "parent": self, "kind": kind, "name": name}
+
+    def _update_run(self, kind, name, data):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO runs (kind, name, data) VALUES (?, ?, ?)",
+                (kind, name, json.dumps(data)),
+            )
 
     def __enter__(self):
         return self
 
     def __exit__(self, *args, **kwargs):
-        self.save()
+        self.close()
+
+
+def _connect(filepath):
+    filepath.parent.mkdir(parents=True, exist_ok=True)
+
+    conn = sqlite3.connect(str(filepath), check_same_thread=False)
+    # Commits only append to the write-ahead log, rather than rewriting pages
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS runs ("
+        "  kind TEXT NOT NULL,"
+        "  name TEXT NOT NULL,"
+        "  data TEXT NOT NULL,"
+        "  PRIMARY KEY (kind, name)"
+        ")"
+    )
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS stats ("
+        "  path TEXT PRIMARY KEY,"
+        "  hash TEXT,"
+        "  size INTEGER,"
+        "  mtime REAL"
+        ")"
+    )
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS blocks ("
+        "  url TEXT NOT NULL,"
+        "  size INTEGER NOT NULL,"
+        "  mtime REAL NOT NULL,"
+        "  block_id TEXT NOT NULL,"
+        "  PRIMARY KEY (url, block_id)"
+        ")"
+    )
+    conn.commit()
+
+    return conn
+
+
+def _is_json_state(filepath):
+    """Returns true if 'filepath' is a (non-empty) JSON state file."""
+    try:
+        with filepath.open("rb") as handle:
+            header = handle.read(len(_SQLITE_HEADER))
+    except FileNotFoundError:
+        return False
+
+    return bool(header) and header != _SQLITE_HEADER
+
+
+def _migrate_json_state(filepath):
+    """Converts a JSON state file to SQLite; the new database is written to a
+    temporary file, so that the JSON file is only replaced once fully converted.
+    """
+    logger = logging.getLogger(__name__)
+    logger.info("converting JSON statefile '%s' to SQLite", filepath)
+
+    with filepath.open() as handle:
+        data = json.load(handle)
+
+    while True:
+        replacement = _add_timestamp(filepath, "_new")
+        if not replacement.exists():
+            break
+
+    conn = _connect(replacement)
+    try:
+        with conn:
+            for kind in ("metabolomics", "ngs", "proteomics"):
+                conn.executemany(
+                    "INSERT INTO runs (kind, name, data) VALUES (?, ?, ?)",
+                    [
+                        (kind, name, json.dumps(value))
+                        for name, value in data.get(kind, {}).items()
+                    ],
+                )
+
+            conn.executemany(
+                "INSERT INTO stats (path, hash, size, mtime) VALUES (?, ?, ?, ?)",
+                [
+                    (key, value["hash"], value["size"], value["mtime"])
+                    for key, value in data.get("stats", {}).items()
+                ],
+            )
+    finally:
+        conn.close()
+
+    # Keep the JSON file as a backup, named like the backups made by JSON states
+    os.link(filepath, _add_timestamp(filepath))
+    replacement.replace(filepath)
 
 
 def _add_timestamp(filepath, suffix=""):
@@ -6,6 +6,9 @@ import tempfile
 from pathlib import Path
 
 from .fileutils import collect_md5_hashes, calculate_md5_hashes
+from .hashcache import HashCache
+from .metrics import TaskMetrics
+from .snapshot import TreeSnapshot
 from .utilities import urljoin, urlquote
 
 from .azcopy import AZFileNotFoundError
@@ -14,39 +17,81 @@ TRIES = 5
 
 
 class CheckedSync:
-    def __init__(self, src_dir, dst_url, rm_dst=False, timeout=10 * 60):
+    # Metrics collected by the last call to execute, if supported by the task
+    metrics = None
+
+    def __init__(
+        self,
+        src_dir,
+        dst_url,
+        rm_dst=False,
+        timeout=10 * 60,
+        hash_workers=1,
+        hash_cache=None,
+        snapshot=None,
+    ):
         _typecheck("src_dir", src_dir, (str, Path))
         _typecheck("dst_url", dst_url, str)
         _typecheck("rm_dst", rm_dst, int)
         _typecheck("timeout", timeout, int)
+        _typecheck("hash_workers", hash_workers, int)
+        _typecheck("hash_cache", hash_cache, (HashCache, type(None)))
+        _typecheck("snapshot", snapshot, (TreeSnapshot, type(None)))
 
         self.src_dir = src_dir
         self.dst_url = dst_url
         self.rm_dst = rm_dst
         self.timeout = timeout
+        self.hash_workers = hash_workers
+        self.hash_cache = hash_cache
+        self.snapshot = snapshot
 
     def execute(self, client, tries=TRIES):
+        self.metrics = TaskMetrics(repr(self), self.dst_url, tries)
+        tries = self._execute(client, tries, self.metrics)
+        self.metrics.finish(tries)
+
+        return tries
+
+    def _execute(self, client, tries, metrics):
         log = logging.getLogger(__name__)
 
+        listing = _RemoteListing(client, self.dst_url, metrics)
         local_hashes = {}
         all_hashes_validated = False
         while tries > 0 and not all_hashes_validated:
             # Synchronize folder using 'azcopy sync'
-            client.sync(self.src_dir, self.dst_url, rm_dst=self.rm_dst)
+            with metrics.phase("sync"):
+                client.sync(self.src_dir, self.dst_url, rm_dst=self.rm_dst)
 
+            previous_hashes = local_hashes
             try:
                 # Collect sizes/hashes from sequencing machine; a failure due to a
                 # timeout is considered a fatal error since we cannot predict when
                 # the drive will become available (typically within a few hours).
-                local_hashes = collect_md5_hashes(
-                    self.src_dir, cache=local_hashes, timeout=self.timeout
-                )
+                with metrics.phase("hash"):
+                    local_hashes = collect_md5_hashes(
+                        self.src_dir,
+                        cache=local_hashes,
+                        timeout=self.timeout,
+                        workers=self.hash_workers,
+                        hash_cache=self.hash_cache,
+                        snapshot=self.snapshot,
+                        metrics=metrics,
+                    )
             except multiprocessing.TimeoutError as error:
                 log.error("timeout while hashing files at %r: %r", self.src_dir, error)
-                return False
+                return 0
+
+            # Files modified since the previous check may have been uploaded by sync
+            listing.invalidate(
+                filepath.relative_to(self.src_dir)
+                for filepath, local_hash in local_hashes.items()
+                if previous_hashes.get(filepath) != local_hash
+            )
 
             # Collect sizes/hashes from Azure
-            remote_hashes = client.list_md5s(dst_url=self.dst_url)
+            remote_hashes = listing.get()
 
             all_hashes_validated = True
             # Compare hashes and remove mismatching files
@@ -57,12 +102,19 @@ class CheckedSync:
                 if remote_hash is None:
                     all_hashes_validated = False
                     log.warning("md5 not found on Azure for '%s'", filepath)
+                    listing.invalidate([filepath])
                 elif not local_hash.match(remote_hash, optional_mtime=True):
                     all_hashes_validated = False
                     log.warning("md5 mismatch for '%s'", filepath)
                     log.debug("local = md5s %s, remote = %s", local_hash, remote_hash)
 
-                    client.remove(dst_url=urljoin(self.dst_url, urlquote(filepath)))
+                    with metrics.phase("remove"):
+                        client.remove(dst_url=urljoin(self.dst_url, urlquote(filepath)))
+                    listing.invalidate([filepath])
+
+            if self.rm_dst:
+                # Extra files are expected to be removed by the next sync
+                listing.invalidate(remote_hashes)
 
             if not all_hashes_validated:
                 # Ensure that the sync-loop will not repeat infinitly in case of any
@@ -87,6 +139,8 @@ class CheckedSync:
 
 
 class CheckedCopy:
+    metrics = None
+
     def __init__(self, src_file, dst_url, timeout=10 * 60):
         _typecheck("src_file", src_file, (str, Path))
         _typecheck("dst_url", dst_url, str)
@@ -98,17 +152,47 @@ class CheckedCopy:
         self.filestats = None
 
     def execute(self, client, tries=TRIES):
+        self.metrics = TaskMetrics(repr(self), self.dst_url, tries)
+        tries = self._execute(client, tries, self.metrics)
+        self.metrics.finish(tries)
+
+        return tries
+
+    def _execute(self, client, tries, metrics):
         first_loop = True
         local_hashes = {}
+        uploads = 0
+        # Stats returned by the last upload, if any
+        uploaded = None
         self.filestats = None
         log = logging.getLogger(__name__)
 
+        if tries > 0 and client.hashes_uploads:
+            # Files missing on Azure are uploaded without first being hashed, since
+            # the client returns the hash calculated while uploading the file
+            try:
+                metrics.listings += 1
+                with metrics.phase("list"):
+                    client.get_md5(dst_url=self.dst_url)
+            except AZFileNotFoundError:
+                with metrics.phase("upload"):
+                    uploaded = client.copy(self.src_file, self.dst_url)
+                if uploaded is not None:
+                    local_hashes[Path(self.src_file)] = uploaded
+
+                uploads += 1
+                first_loop = False
+
         while tries > 0:
             try:
                 # Collect sizes/hashes from network drive
-                local_hashes = collect_md5_hashes(
-                    self.src_file, cache=local_hashes, timeout=self.timeout
-                )
+                with metrics.phase("hash"):
+                    local_hashes = collect_md5_hashes(
+                        self.src_file,
+                        cache=local_hashes,
+                        timeout=self.timeout,
+                        metrics=metrics,
+                    )
             except multiprocessing.TimeoutError as error:
                 log.error("timeout while hashing files at %r: %r", self.src_file, error)
                 return 0
@@ -118,10 +202,19 @@ class CheckedCopy:
                 return 0
 
             (local_hash,) = local_hashes.values()
+            if (
+                client.verifies_uploads
+                and uploaded is not None
+                and local_hash.match(uploaded)
+            ):
+                # The upload was validated by Azure and the file has not changed since
+                break
 
             try:
                 # Collect sizes/hashes from Azure
-                remote_hash = client.get_md5(dst_url=self.dst_url)
+                metrics.listings += 1
+                with metrics.phase("list"):
+                    remote_hash = client.get_md5(dst_url=self.dst_url)
                 if local_hash.match(remote_hash, optional_mtime=True):
                     break
             except AZFileNotFoundError:
@@ -134,11 +227,14 @@ class CheckedCopy:
                 if not first_loop:
                     tries -= 1
 
-            client.copy(self.src_file, self.dst_url)
+            with metrics.phase("upload"):
+                uploaded = client.copy(self.src_file, self.dst_url)
+            uploads += 1
             first_loop = False
 
         if local_hashes:
             (self.filestats,) = local_hashes.values()
+            metrics.add_uploaded(uploads, uploads * self.filestats.size)
 
         return tries
 
@@ -150,14 +246,22 @@ class CheckedCopy:
 
 
 class CheckedMultiCopy:
-    def __init__(self, file_map, dst_url, timeout=10 * 60):
+    metrics = None
+
+    def __init__(
+        self, file_map, dst_url, timeout=10 * 60, hash_workers=1, hash_cache=None
+    ):
         _typecheck("file_map", file_map, dict)
         _typecheck("dst_url", dst_url, str)
         _typecheck("timeout", timeout, int)
+        _typecheck("hash_workers", hash_workers, int)
+        _typecheck("hash_cache", hash_cache, (HashCache, type(None)))
 
         self.file_map = {}
         self.dst_url = dst_url
         self.timeout = timeout
+        self.hash_workers = hash_workers
+        self.hash_cache = hash_cache
         self.filestats = None
 
         for key, value in file_map.items():
@@ -167,25 +271,56 @@ class CheckedMultiCopy:
             self.file_map[Path(key)] = Path(value)
 
     def execute(self, client, tries=TRIES):
+        self.metrics = TaskMetrics(repr(self), self.dst_url, tries)
+        tries = self._execute(client, tries, self.metrics)
+        self.metrics.finish(tries)
+
+        return tries
+
+    def _execute(self, client, tries, metrics):
         log = logging.getLogger(__name__)
         self.filestats = None
         first_loop = True
+        # Sizes of uploaded files are only known once the files have been hashed
+        uploaded = []
+
+        if tries > 0 and client.hashes_uploads:
+            # Files missing on Azure are uploaded without first being hashed, since
+            # the client adds the hashes calculated while uploading to the hash cache
+            metrics.listings += 1
+            with metrics.phase("list"):
+                remote_hashes = client.list_md5s(self.dst_url)
+
+            upload_queue = {}
+            for key, filepath in self.file_map.items():
+                if key not in remote_hashes:
+                    upload_queue[key] = filepath
+
+            if upload_queue:
+                uploaded.extend(self._copy_many(log, client, upload_queue, metrics))
+                first_loop = False
 
         while tries > 0:
             try:
                 # Collect sizes/hashes from network drive
-                self.filestats = calculate_md5_hashes(
-                    # sorted() used to allow comparions of mocked calls
-                    filepaths=sorted(self.file_map.values()),
-                    timeout=self.timeout,
-                    cache=self.filestats,
-                )
+                with metrics.phase("hash"):
+                    self.filestats = calculate_md5_hashes(
+                        # sorted() used to allow comparions of mocked calls
+                        filepaths=sorted(self.file_map.values()),
+                        timeout=self.timeout,
+                        cache=self.filestats,
+                        workers=self.hash_workers,
+                        hash_cache=self.hash_cache,
+                        metrics=metrics,
+                    )
             except multiprocessing.TimeoutError as error:
                 log.error("timeout while hashing files: %r", error)
                 return 0
 
             # Collect sizes/hashes from Azure; first check is expected to fail
-            remote_hashes = client.list_md5s(self.dst_url)
+            metrics.listings += 1
+            with metrics.phase("list"):
+                remote_hashes = client.list_md5s(self.dst_url)
 
             upload_queue = {}
             for key, filepath in self.file_map.items():
@@ -203,13 +338,30 @@ class CheckedMultiCopy:
                 tries -= 1
 
             if tries > 0:
-                for key, filepath in sorted(upload_queue.items()):
-                    client.copy(filepath, urljoin(self.dst_url, urlquote(key)))
+                # Failed files are retried based on the listing at the next iteration
+                uploaded.extend(self._copy_many(log, client, upload_queue, metrics))
 
             first_loop = False
 
+        metrics.add_uploaded(
+            len(uploaded),
+            sum(self.filestats[filepath].size for filepath in uploaded),
+        )
+
         return tries
 
+    def _copy_many(self, log, client, upload_queue, metrics):
+        """Uploads files in 'upload_queue' and returns the paths of uploaded files."""
+        with metrics.phase("upload"):
+            failed = client.copy_many(upload_queue, self.dst_url)
+
+        if failed:
+            log.warning("%i of %i files failed", len(failed), len(upload_queue))
+
+        return [
+            filepath for key, filepath in upload_queue.items() if key not in failed
+        ]
+
     def __repr__(self):
         values = [self.file_map, self.dst_url, self.timeout]
         values_str = ", ".join(repr(value) for value in values)
@@ -218,6 +370,8 @@ class CheckedMultiCopy:
 
 
 class RemoveLocal:
+    metrics = None
+
     def __init__(self, dst):
         _typecheck("dst", dst, (str, Path))
 
@@ -234,6 +388,8 @@ class RemoveLocal:
 
 
 class RemoveRemote:
+    metrics = None
+
     def __init__(self, dst):
         _typecheck("dst", dst, str)
 
@@ -249,6 +405,8 @@ class RemoveRemote:
 
 
 class Write:
+    metrics = None
+
     def __init__(self, dst, data):
         _typecheck("dst", dst, str)
         _typecheck("data", data, (bytes, str))
@@ -262,24 +420,62 @@ class Write:
     def execute(self, client, tries=TRIES):
         if tries <= 0:
             return tries
+        elif client.verifies_uploads:
+            self.metrics = TaskMetrics(repr(self), self.dst, tries)
+            tries = self._write(client, tries, self.metrics)
+            self.metrics.finish(tries)
+
+            return tries
 
         with tempfile.NamedTemporaryFile() as handle:
             handle.write(self.data)
             handle.flush()
 
-            return CheckedCopy(handle.name, self.dst).execute(client)
+            task = CheckedCopy(handle.name, self.dst)
+            tries = task.execute(client)
+            self.metrics = task.metrics
+
+            return tries
+
+    def _write(self, client, tries, metrics):
+        """Writes the data using a single request, verified using the MD5 returned
+        by Azure, rather than uploading and then looking up a temporary file.
+        """
+        log = logging.getLogger(__name__)
+
+        while tries > 0:
+            with metrics.phase("upload"):
+                stats = client.write(self.data, self.dst)
+            metrics.add_uploaded(1, len(self.data))
+
+            if stats is not None:
+                break
+
+            log.warning("md5 mismatch for %r", self.dst)
+            tries -= 1
+
+        return tries
 
     def __repr__(self):
         return f"Write({self.dst!r}, ...)"
 
 
-def execute(client, tasks, tries=TRIES):
+def execute(client, tasks, tries=TRIES, report=None):
+    """Executes tasks in order, until all tasks have run or a task fails. Metrics
+    collected by tasks are logged and added to 'report', if set.
+    """
     log = logging.getLogger(__name__)
 
     for task in tasks:
         log.info("running task %r", task)
 
         tries = task.execute(client, tries)
+
+        if task.metrics is not None:
+            log.info("task metrics: %r", task.metrics)
+            if report is not None:
+                report.add(task.metrics)
+
         if tries <= 0:
             log.error("Failed to run task %r", task)
             return False
@@ -287,6 +483,47 @@ def execute(client, tasks, tries=TRIES):
     return True
 
 
+class _RemoteListing:
+    """Caches the sizes/hashes listed for 'dst_url' between the rounds of a task.
+    Paths that may have been modified, e.g. by uploads or removals, must be marked
+    using 'invalidate'; only those paths are looked up again by the next 'get'.
+
+    Cached entries are not checked against the ETag/Last-Modified of blobs, so
+    blobs modified or removed by other processes while the task is running are not
+    detected until the listing is recreated by the next task for 'dst_url'.
+    """
+
+    def __init__(self, client, dst_url, metrics):
+        self._client = client
+        self._dst_url = dst_url
+        self._metrics = metrics
+        self._hashes = None
+        self._stale = set()
+
+    def invalidate(self, paths):
+        self._stale.update(paths)
+
+    def get(self):
+        """Returns a (modifiable) dict of {relative path: PartialStats}."""
+        if self._hashes is None:
+            self._metrics.listings += 1
+            with self._metrics.phase("list"):
+                self._hashes = self._client.list_md5s(dst_url=self._dst_url)
+        elif self._stale:
+            for path in self._stale:
+                self._hashes.pop(path, None)
+
+            self._metrics.listings += 1
+            with self._metrics.phase("list"):
+                self._hashes.update(
+                    self._client.list_md5s(dst_url=self._dst_url, paths=self._stale)
+                )
+
+        self._stale = set()
+
+        return dict(self._hashes)
+
+
 def _typecheck(name, value, types):
     if not isinstance(value, types):
         raise ValueError(f"invalid task {name} param: {value!r}")
@@ -0,0 +1,409 @@
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import time
+import traceback
+
+from pathlib import Path
+
+WATCH_BACKENDS = ("auto", "inotify", "poll")
+
+# Events in remote changes to network file-systems are not reported by inotify
+_NETWORK_FILESYSTEMS = frozenset(
+    ("cifs", "smb3", "smbfs", "nfs", "nfs4", "9p", "fuse.sshfs", "fuse.rclone")
+)
+
+# Constants from <sys/inotify.h>
+_IN_MODIFY = 0x00000002
+_IN_ATTRIB = 0x00000004
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ONLYDIR = 0x01000000
+_IN_ISDIR = 0x40000000
+
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+class RunWatcher:
+    """Watches sub-folders (runs) of 'root' and reports the names of runs in which
+    changes were observed. If 'flag' is set, then only the creation or modification
+    of that file in a run is reported, otherwise any file being written, created,
+    or moved into a run is reported. New runs are always reported.
+
+    The 'inotify' backend is used if available, except for network file-systems,
+    for which the 'poll' backend checks the mtime of the flag of each run (or of
+    the run folder itself if no flag is set) every 'interval' seconds.
+    """
+
+    def __init__(self, root, flag=None, interval=60.0, backend="auto"):
+        log = logging.getLogger(__name__)
+        if backend not in WATCH_BACKENDS:
+            raise ValueError(f"unknown watch backend {backend!r}")
+        elif interval <= 0:
+            raise ValueError(f"interval must be positive, not {interval!r}")
+
+        self.root = Path(root)
+        self.flag = None if flag is None else Path(flag)
+        self.interval = interval
+        self._ignored = set()
+        self._backend = None
+
+        if backend == "auto":
+            fstype = _get_filesystem_type(self.root)
+            if fstype in _NETWORK_FILESYSTEMS:
+                log.info("polling %r on %s file-system", str(self.root), fstype)
+                backend = "poll"
+            else:
+                try:
+                    self._backend = _InotifyBackend(self)
+                except OSError as error:
+                    log.warning("inotify not available; polling instead: %s", error)
+                    backend = "poll"
+        elif backend == "inotify":
+            self._backend = _InotifyBackend(self)
+
+        if self._backend is None:
+            self._backend = _PollingBackend(self)
+
+        log.info("watching %r using %s", str(self.root), self._backend.name)
+
+    @property
+    def backend(self):
+        return self._backend.name
+
+    def poll(self, timeout):
+        """Waits up to 'timeout' seconds for changes; returns the set of names of
+        runs that changed, not including runs that are being ignored.
+        """
+        return self._backend.poll(max(0.0, timeout)) - self._ignored
+
+    def ignore(self, name):
+        """Stops watching a run, e.g. because it has been synchronized."""
+        self._ignored.add(name)
+        self._backend.ignore(name)
+
+    def close(self):
+        self._backend.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def _list_runs(self):
+        try:
+            with os.scandir(self.root) as entries:
+                return {entry.name for entry in entries if entry.is_dir()}
+        except FileNotFoundError:
+            # The main folder is unavailable while instruments are turned off
+            return set()
+
+
+class PendingRuns:
+    """Runs waiting to be synchronized, each with the time at which it is due."""
+
+    def __init__(self):
+        self._due = {}
+
+    def touch(self, name, due):
+        """Sets the time at which a run is due, postponing it if already pending;
+        repeated events for a run thereby restart its debounce delay.
+        """
+        self._due[name] = due
+
+    def add(self, name, due):
+        """Adds a run if not already pending, or makes it due earlier."""
+        self._due[name] = min(due, self._due.get(name, due))
+
+    def next_due(self):
+        return min(self._due.values(), default=None)
+
+    def pop_due(self, now):
+        """Removes and returns the sorted names of runs that are due at 'now'."""
+        names = sorted(name for name, due in self._due.items() if due <= now)
+        for name in names:
+            self._due.pop(name)
+
+        return names
+
+    def __len__(self):
+        return len(self._due)
+
+
+def run_daemon(watcher, collect, sync, debounce, rescan, after_sync=None, cycles=None):
+    """Synchronizes runs as they change until interrupted. Runs returned by
+    'collect()' are due immediately at startup and every 'rescan' seconds, which
+    also catches any events missed by the watcher, while runs reported by the
+    watcher are due once no further changes have been seen for 'debounce' seconds.
+
+    'sync(names)' is called with the due runs and returns the names of runs that
+    no longer need to be watched; exceptions are logged, and the runs are retried at
+    the next rescan. 'after_sync()' is called after every call to 'sync', and
+    'cycles' limits the number of calls to 'sync'.
+    """
+    log = logging.getLogger(__name__)
+    pending = PendingRuns()
+    next_rescan = time.time()
+
+    try:
+        while cycles is None or cycles > 0:
+            now = time.time()
+            if now >= next_rescan:
+                log.info("scanning %r for runs", str(watcher.root))
+                for name in collect():
+                    pending.add(name, now)
+
+                next_rescan = now + rescan
+
+            names = pending.pop_due(now)
+            if names:
+                log.info("synchronizing %i runs: %s", len(names), ", ".join(names))
+                try:
+                    for name in sync(names):
+                        watcher.ignore(name)
+                except Exception as error:
+                    log.error("unhandled exception %r", error)
+                    for line in traceback.format_exc().splitlines():
+                        log.error("%s", line)
+                finally:
+                    if after_sync is not None:
+                        after_sync()
+
+                if cycles is not None:
+                    cycles -= 1
+
+                continue
+
+            timeout = min(next_rescan, pending.next_due() or next_rescan) - now
+            for name in watcher.poll(timeout):
+                log.debug("change observed in run %r", name)
+                pending.touch(name, time.time() + debounce)
+    except KeyboardInterrupt:
+        log.info("stopped watching %r", str(watcher.root))
+
+
+class _PollingBackend:
+    name = "poll"
+
+    def __init__(self, watcher):
+        self._watcher = watcher
+        self._mtimes = self._scan()
+        self._next_poll = time.monotonic() + watcher.interval
+
+    def poll(self, timeout):
+        delay = self._next_poll - time.monotonic()
+        if delay > timeout:
+            time.sleep(timeout)
+            return set()
+
+        time.sleep(max(0.0, delay))
+        self._next_poll = time.monotonic() + self._watcher.interval
+
+        mtimes = self._scan()
+        changed = {
+            name
+            for name, mtime in mtimes.items()
+            if name not in self._mtimes or self._mtimes[name] != mtime
+        }
+        self._mtimes = mtimes
+
+        return changed
+
+    def ignore(self, name):
+        self._mtimes.pop(name, None)
+
+    def close(self):
+        pass
+
+    def _scan(self):
+        """Returns {name: mtime} for runs not being ignored, where 'mtime' is that of
+        the flag (None if missing) or of the run folder; one stat per run.
+        """
+        watcher = self._watcher
+        result = {}
+        for name in watcher._list_runs() - watcher._ignored:
+            filepath = watcher.root / name
+            if watcher.flag is not None:
+                filepath = filepath / watcher.flag
+
+            try:
+                result[name] = filepath.stat().st_mtime
+            except FileNotFoundError:
+                result[name] = None
+
+        return result
+
+
+class _InotifyBackend:
+    name = "inotify"
+
+    def __init__(self, watcher):
+        self._watcher = watcher
+        self._inotify = _Inotify()
+        # Watch descriptors of runs and vice versa
+        self._runs = {}
+        self._wds = {}
+
+        # Only top-level entries are checked against nested flags
+        self._filename = None
+        if watcher.flag is not None:
+            self._filename = watcher.flag.parts[0]
+
+        self._root_wd = self._inotify.add_watch(
+            watcher.root,
+            _IN_CREATE | _IN_MOVED_TO | _IN_DELETE | _IN_MOVED_FROM | _IN_ONLYDIR,
+        )
+
+        self._add_runs()
+
+    def poll(self, timeout):
+        changed = set()
+        for wd, mask, name in self._inotify.read(timeout):
+            if mask & _IN_Q_OVERFLOW:
+                # Events were lost, so every run is treated as changed
+                changed.update(self._add_runs())
+            elif wd == self._root_wd:
+                if not mask & _IN_ISDIR:
+                    continue
+                elif mask & (_IN_CREATE | _IN_MOVED_TO):
+                    if self._add_run(name):
+                        changed.add(name)
+                else:
+                    self._wds.pop(self._runs.pop(name, None), None)
+            elif not mask & _IN_IGNORED:
+                run = self._wds.get(wd)
+                if run is not None and self._filename in (None, name):
+                    changed.add(run)
+
+        return changed
+
+    def ignore(self, name):
+        wd = self._runs.pop(name, None)
+        if wd is not None:
+            self._wds.pop(wd, None)
+            self._inotify.rm_watch(wd)
+
+    def close(self):
+        self._inotify.close()
+
+    def _add_runs(self):
+        names = self._watcher._list_runs() - self._watcher._ignored
+        for name in names:
+            self._add_run(name)
+
+        return names
+
+    def _add_run(self, name):
+        if name in self._runs:
+            return True
+
+        mask = _IN_CREATE | _IN_MOVED_TO | _IN_CLOSE_WRITE | _IN_ATTRIB | _IN_ONLYDIR
+        if self._watcher.flag is None:
+            mask |= _IN_MODIFY
+
+        try:
+            wd = self._inotify.add_watch(self._watcher.root / name, mask)
+        except (FileNotFoundError, NotADirectoryError):
+            # Removed or replaced by a file before the watch could be added
+            return False
+
+        self._runs[name] = wd
+        self._wds[wd] = name
+
+        return True
+
+
+class _Inotify:
+    """Minimal wrapper around the Linux inotify API using ctypes."""
+
+    def __init__(self):
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            self._add_watch = libc.inotify_add_watch
+            self._rm_watch = libc.inotify_rm_watch
+            init = libc.inotify_init1
+        except (AttributeError, OSError) as error:
+            raise OSError(f"inotify not supported: {error}")
+
+        self._add_watch.argtypes = (ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32)
+        self._fd = init(os.O_CLOEXEC | os.O_NONBLOCK)
+        if self._fd < 0:
+            _raise_errno("inotify_init1")
+
+    def add_watch(self, path, mask):
+        wd = self._add_watch(self._fd, os.fsencode(path), mask)
+        if wd < 0:
+            _raise_errno("inotify_add_watch", path)
+
+        return wd
+
+    def rm_watch(self, wd):
+        # Fails if the watch was already removed, e.g. because the folder was deleted
+        self._rm_watch(self._fd, wd)
+
+    def read(self, timeout):
+        """Returns a list of (wd, mask, name) for events within 'timeout' seconds."""
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return []
+
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _cookie, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset : offset + length].rstrip(b"\0")
+            offset += length
+
+            events.append((wd, mask, os.fsdecode(name)))
+
+        return events
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+def _raise_errno(func, path=None):
+    errno = ctypes.get_errno()
+    if path is None:
+        raise OSError(errno, f"{func}: {os.strerror(errno)}")
+
+    raise OSError(errno, f"{func}: {os.strerror(errno)}", str(path))
+
+
+def _get_filesystem_type(path):
+    """Returns the type of the file-system containing 'path' or None if unknown."""
+    path = os.path.realpath(path)
+
+    try:
+        with open("/proc/mounts", encoding="utf-8") as handle:
+            mounts = [line.split()[1:3] for line in handle if line.strip()]
+    except OSError:
+        return None
+
+    best, result = "", None
+    for mountpoint, fstype in mounts:
+        # Spaces and other special characters are escaped as octal values
+        mountpoint = mountpoint.encode().decode("unicode_escape")
+        if (
+            path == mountpoint or path.startswith(os.path.join(mountpoint, ""))
+        ) and len(mountpoint) > len(best):
+            best, result = mountpoint, fstype
+
+    return result
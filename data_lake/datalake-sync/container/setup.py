@@ -29,6 +29,10 @@ setup(
     version=_get_version(),
     packages=find_packages(),
     install_requires=_get_requirements(),
+    extras_require={
+        "native": ["azure-identity", "azure-storage-blob"],
+        "fast": ["xxhash"],
+    },
     entry_points={"console_scripts": ["sync_to_azure=azsync.main:entry_point"]},
     zip_safe=False,
     include_package_data=True,
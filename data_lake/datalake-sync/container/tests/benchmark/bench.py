@@ -0,0 +1,996 @@
+#!/usr/bin/env python3
+# -*- coding: utf8 -*-
+import argparse
+import contextlib
+import datetime
+import hashlib
+import io
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+import uuid
+
+from pathlib import Path
+
+# Dummy azure identifiers
+AZURE_TENANT_ID = "15fb0f5f-d60c-4f96-aeae-6fcf4777af5d"
+AZURE_APPLICATION_ID = "e65bfd60-8b35-4ed6-bbd0-af3bbe027d66"
+AZURE_STORAGE_ACCOUNT = "storage"
+AZURE_CONTAINER = "container"
+
+# Path of the SQLite database used as a stand-in for blob storage
+_STORE_ENV = "BENCH_AZSYNC_STORE"
+# Simulated upload bandwidth in MB/s; unset or 0 means no limit
+_UPLOAD_MBPS_ENV = "BENCH_AZSYNC_UPLOAD_MBPS"
+
+_KB = 1024
+_MB = 1024 * _KB
+
+# Files are backdated, so that they are not skipped for being too recently modified
+_FILE_AGE = 2 * 24 * 60 * 60
+
+# Runs (or projects/datasets), files per run, and size of bulk data files
+_PROFILES = {
+    "tiny": {"runs": 1, "files": 50, "size": 64 * _KB},
+    "small": {"runs": 2, "files": 500, "size": 256 * _KB},
+    "medium": {"runs": 4, "files": 2000, "size": 1 * _MB},
+    "large": {"runs": 8, "files": 5000, "size": 2 * _MB},
+}
+
+# Each scenario runs the command with a new state file; the hash cache and tree
+# snapshot are either new ("verify") or kept from the "upload" scenario ("cached")
+_SCENARIOS = ("upload", "verify", "cached")
+
+_NOISE = os.urandom(_MB)
+
+# Modules making up the mock Azure SDK used to benchmark the 'native' backend
+_MOCK_AZURE_SDK = {
+    "azure/__init__.py": "",
+    "azure/core/__init__.py": "",
+    "azure/core/exceptions.py": (
+        "from bench import MockAzureError as AzureError\n"
+        "from bench import MockAzureError as HttpResponseError\n"
+        "from bench import MockResourceNotFoundError as ResourceNotFoundError\n"
+    ),
+    "azure/identity/__init__.py": (
+        "from bench import MockCredential as ClientSecretCredential\n"
+    ),
+    "azure/storage/__init__.py": "",
+    "azure/storage/blob/__init__.py": (
+        "from bench import MockBlobBlock as BlobBlock\n"
+        "from bench import MockBlobServiceClient as BlobServiceClient\n"
+        "from bench import MockContentSettings as ContentSettings\n"
+    ),
+}
+
+
+class HelpFormatter(argparse.ArgumentDefaultsHelpFormatter):
+    """Help formatter with default values and word-wrapping."""
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault("width", 79)
+
+        super().__init__(*args, **kwargs)
+
+
+class BenchError(Exception):
+    pass
+
+
+########################################################################################
+# Generation of run folders
+
+
+def _miseq_run(idx, nfiles, size):
+    name = f"2009{idx % 100:02d}_M02023_{idx:04d}_000000000-J7GJ3"
+    files = _ngs_metadata(name)
+
+    tiles = [f"11{lane:02d}" for lane in range(1, 20)]
+    for num in range(nfiles - len(files) - 1):
+        cycle, tile = divmod(num, len(tiles))
+        filename = f"C{cycle + 1}.1/s_1_{tiles[tile]}.bcl"
+        files.append((f"{name}/Data/Intensities/BaseCalls/L001/{filename}", size))
+
+    # The completion flag is written last, like the sequencing machines do
+    files.append((f"{name}/RTAComplete.txt", 64))
+
+    return name, files
+
+
+def _nextseq_run(idx, nfiles, size):
+    name = f"2009{idx % 100:02d}_NB501234_{idx:04d}_AHXXXXXXXX"
+    files = _ngs_metadata(name)
+
+    for num in range((nfiles - len(files) - 1) // 2):
+        cycle, lane = divmod(num, 4)
+        prefix = f"{name}/Data/Intensities/BaseCalls/L{lane + 1:03d}/{cycle + 1:04d}"
+        files.append((f"{prefix}.bcl.bgzf", size))
+        files.append((f"{prefix}.bcl.bgzf.bci", 4 * _KB))
+
+    files.append((f"{name}/RunCompletionStatus.xml", 1 * _KB))
+
+    return name, files
+
+
+def _ngs_metadata(name):
+    files = [
+        (f"{name}/RunInfo.xml", 2 * _KB),
+        (f"{name}/runParameters.xml", 8 * _KB),
+        (f"{name}/SampleSheet.csv", 4 * _KB),
+    ]
+
+    for metric in ("Tile", "Q", "Error", "Extraction", "Index", "CorrectedInt"):
+        files.append((f"{name}/InterOp/{metric}MetricsOut.bin", 256 * _KB))
+
+    return files
+
+
+def _proteomics_run(idx, nfiles, size):
+    name = f"prot{idx + 100}"
+    files = [
+        (f"{name}/method.meth", 64 * _KB),
+        (f"{name}/{uuid.UUID(int=idx)}.sld", 16 * _KB),
+        (f"{name}/results.xlsx", 256 * _KB),
+    ]
+
+    for num in range(nfiles - len(files)):
+        if num % 10:
+            files.append((f"{name}/Sample_{num:04d}.raw", size))
+        else:
+            files.append((f"{name}/blank{num:04d}.raw", size))
+
+    return name, files
+
+
+def _metabolomics_run(idx, nfiles, size):
+    name = f"S{idx:03d}"
+    files = []
+    for filename in ("featureQCComponentGroups", "featureQCComponents", "traML"):
+        files.append((f"DataProcessingMethod_{name}/{filename}.csv", 32 * _KB))
+    files.append((f"DataProcessingMethod_{name}/sequence.csv", 4 * _KB))
+
+    for num in range(nfiles - len(files)):
+        files.append((f"RawData_{name}/20200831/sample_{num:04d}.raw", size))
+
+    return name, files
+
+
+_LAYOUTS = {
+    "miseq": {
+        "command": "ngs",
+        "runs": _miseq_run,
+        "options": ["--completion-flag", "RTAComplete.txt"],
+    },
+    "nextseq": {
+        "command": "ngs",
+        "runs": _nextseq_run,
+        "options": ["--completion-flag", "RunCompletionStatus.xml"],
+    },
+    "proteomics": {
+        "command": "proteomics",
+        "runs": _proteomics_run,
+        "options": [],
+    },
+    "metabolomics": {
+        "command": "metabolomics",
+        "runs": _metabolomics_run,
+        "options": [],
+    },
+}
+
+
+def generate_tree(root, layout, profile):
+    """Writes run folders for 'layout' to 'root' and returns (nfiles, nbytes). Trees
+    are re-used if previously generated for the same layout/profile.
+    """
+    log = logging.getLogger("generate")
+    # Marker kept outside the tree, since commands warn about unexpected files
+    marker = root.with_name(f"{root.name}.json")
+    if marker.exists():
+        log.info("re-using %s tree at '%s'", layout, root)
+        data = json.loads(marker.read_text())
+
+        return data["files"], data["bytes"]
+
+    if root.exists():
+        shutil.rmtree(root)
+
+    settings = _PROFILES[profile]
+    make_run = _LAYOUTS[layout]["runs"]
+
+    nfiles = nbytes = 0
+    mtime = time.time() - _FILE_AGE
+    for idx in range(settings["runs"]):
+        name, files = make_run(idx, settings["files"], settings["size"])
+        log.info("writing %i files for %s run %r", len(files), layout, name)
+
+        for filename, size in files:
+            _write_file(root / filename, size, mtime)
+            nfiles += 1
+            nbytes += size
+
+    _backdate_folders(root, mtime)
+    marker.write_text(json.dumps({"files": nfiles, "bytes": nbytes}))
+
+    return nfiles, nbytes
+
+
+def _write_file(filepath, size, mtime):
+    """Writes 'size' bytes of data; files start with a unique header, so that files
+    have different hashes, while the remaining data is re-used to save time.
+    """
+    filepath.parent.mkdir(parents=True, exist_ok=True)
+
+    with filepath.open("wb") as handle:
+        data = uuid.uuid4().bytes[:size]
+        handle.write(data)
+        size -= len(data)
+
+        while size > 0:
+            data = _NOISE[:size]
+            handle.write(data)
+            size -= len(data)
+
+    os.utime(filepath, (mtime, mtime))
+
+
+def _backdate_folders(root, mtime):
+    for dirpath, _, _ in os.walk(root):
+        os.utime(dirpath, (mtime, mtime))
+
+
+########################################################################################
+# Blob storage stand-in, shared by the mock azcopy executable and the mock Azure SDK
+
+
+class BlobStore:
+    """Records the name, size, and MD5 of uploaded blobs in a SQLite database; file
+    contents are read and hashed during uploads, but are not stored.
+    """
+
+    def __init__(self, filepath):
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(str(filepath), timeout=60, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS blobs ("
+            "  name TEXT PRIMARY KEY,"
+            "  size INTEGER NOT NULL,"
+            "  md5 TEXT NOT NULL,"
+            "  modified REAL NOT NULL"
+            ")"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS blocks ("
+            "  name TEXT NOT NULL,"
+            "  block_id TEXT NOT NULL,"
+            "  size INTEGER NOT NULL,"
+            "  PRIMARY KEY (name, block_id)"
+            ")"
+        )
+        self._conn.commit()
+
+    def get(self, name):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT name, size, md5, modified FROM blobs WHERE name = ?", (name,)
+            ).fetchone()
+
+    def iter_prefix(self, prefix):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT name, size, md5, modified FROM blobs "
+                "WHERE substr(name, 1, ?) = ? ORDER BY name",
+                (len(prefix), prefix),
+            ).fetchall()
+
+        return rows
+
+    def put(self, name, size, md5):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO blobs VALUES (?, ?, ?, ?)",
+                (name, size, md5, time.time()),
+            )
+
+    def set_md5(self, name, md5):
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE blobs SET md5 = ? WHERE name = ?", (md5, name))
+
+    def remove(self, name):
+        with self._lock, self._conn:
+            return self._conn.execute(
+                "DELETE FROM blobs WHERE name = ?", (name,)
+            ).rowcount
+
+    def stage_block(self, name, block_id, size):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO blocks VALUES (?, ?, ?)", (name, block_id, size)
+            )
+
+    def get_blocks(self, name):
+        with self._lock:
+            return dict(
+                self._conn.execute(
+                    "SELECT block_id, size FROM blocks WHERE name = ?", (name,)
+                )
+            )
+
+    def commit_blocks(self, name, block_ids):
+        with self._lock:
+            blocks = self.get_blocks(name)
+            self.put(name, sum(blocks[block_id] for block_id in block_ids), "")
+
+            with self._conn:
+                self._conn.execute("DELETE FROM blocks WHERE name = ?", (name,))
+
+    def upload(self, name, handle):
+        """Reads and hashes 'handle' at the simulated upload rate, if any."""
+        hasher = hashlib.md5()
+        size = 0
+        started = time.monotonic()
+        while True:
+            data = handle.read(_MB)
+            if not data:
+                break
+
+            hasher.update(data)
+            size += len(data)
+            _simulate_transfer(started, size)
+
+        self.put(name, size, hasher.hexdigest())
+
+
+def _simulate_transfer(started, nbytes):
+    mbps = float(os.environ.get(_UPLOAD_MBPS_ENV) or 0)
+    if mbps > 0:
+        delay = started + nbytes / (mbps * _MB) - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+
+def _blob_name(url):
+    """Returns the unquoted '{container}/{blob}' for a blob URL."""
+    return urllib.parse.unquote(urllib.parse.urlsplit(url).path).lstrip("/")
+
+
+def _open_store():
+    filepath = os.environ.get(_STORE_ENV)
+    if filepath is None:
+        raise BenchError(f"{_STORE_ENV} not set")
+
+    return BlobStore(filepath)
+
+
+########################################################################################
+# Mock azcopy executable
+
+
+# Options that take a value; all other options are flags
+_AZCOPY_VALUE_OPTIONS = ("--log-level", "--cap-mbps", "--output-type")
+
+
+def mock_azcopy_main(argv):
+    command, *argv = argv
+    options = {}
+    values = []
+    while argv:
+        value = argv.pop(0)
+        if value in _AZCOPY_VALUE_OPTIONS or value == "--delete-destination":
+            options[value] = argv.pop(0)
+        elif value.startswith("--"):
+            options[value] = True
+        else:
+            values.append(value)
+
+    if command in ("login", "logout"):
+        return 0
+
+    store = _open_store()
+    if command == "copy":
+        src, dst = values
+        if src.endswith("/*"):
+            _mock_copy_tree(store, Path(src[:-2]), _blob_name(dst))
+        else:
+            with open(src, "rb") as handle:
+                store.upload(_blob_name(dst), handle)
+    elif command == "sync":
+        src, dst = values
+        rm_dst = options.get("--delete-destination") == "true"
+        _mock_sync(store, Path(src), _blob_name(dst), rm_dst)
+    elif command == "remove":
+        (dst,) = values
+        if not store.remove(_blob_name(dst)):
+            print("X-Ms-Error-Code: [BlobNotFound]")
+            return 1
+    elif command == "list_md5s":
+        (dst,) = values
+        prefix = _blob_name(dst).rstrip("/") + "/"
+        for name, size, md5, _ in store.iter_prefix(prefix):
+            print(f"MD5: {md5}\t{size}\t{name[len(prefix) :]}")
+    elif command == "get_md5":
+        (dst,) = values
+        row = store.get(_blob_name(dst))
+        if row is None:
+            print("X-Ms-Error-Code: [BlobNotFound]")
+            return 1
+
+        name, size, md5, _ = row
+        print(f"MD5: {md5}\t{size}\t{name}")
+    else:
+        print(f"unknown command {command!r}")
+        return 1
+
+    return 0
+
+
+def _mock_copy_tree(store, root, prefix):
+    for dirpath, _, filenames in os.walk(root, followlinks=True):
+        for filename in filenames:
+            filepath = Path(dirpath) / filename
+            with filepath.open("rb") as handle:
+                store.upload(f"{prefix}/{filepath.relative_to(root)}", handle)
+
+
+def _mock_sync(store, root, prefix, rm_dst):
+    # Like azcopy, files are uploaded if missing, if the size differs, or if newer
+    remote = {}
+    for name, size, _, modified in store.iter_prefix(prefix + "/"):
+        remote[name] = (size, modified)
+
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            filepath = Path(dirpath) / filename
+            name = f"{prefix}/{filepath.relative_to(root)}"
+            stats = filepath.stat()
+
+            size, modified = remote.pop(name, (None, None))
+            if size != stats.st_size or modified < stats.st_mtime:
+                with filepath.open("rb") as handle:
+                    store.upload(name, handle)
+
+    if rm_dst:
+        for name in remote:
+            store.remove(name)
+
+
+########################################################################################
+# Mock Azure SDK, backed by the same blob storage stand-in
+
+
+class MockAzureError(Exception):
+    def __init__(self, message=None, error_code=None, **kwargs):
+        super().__init__(message)
+        self.error_code = error_code
+
+
+class MockResourceNotFoundError(MockAzureError):
+    pass
+
+
+class MockCredential:
+    def __init__(self, tenant_id, client_id, client_secret, **kwargs):
+        pass
+
+    def close(self):
+        pass
+
+
+class MockContentSettings:
+    def __init__(self, content_md5=None, **kwargs):
+        self.content_md5 = content_md5
+
+
+class MockBlobBlock:
+    def __init__(self, block_id, **kwargs):
+        self.id = block_id
+
+
+class MockBlobProperties:
+    def __init__(self, name, size, md5, modified):
+        self.name = name
+        self.size = size
+        self.content_settings = MockContentSettings(
+            content_md5=bytearray.fromhex(md5) if md5 else None
+        )
+        self.last_modified = datetime.datetime.fromtimestamp(
+            modified, datetime.timezone.utc
+        )
+
+
+class MockBlobServiceClient:
+    _store = None
+    _lock = threading.Lock()
+
+    def __init__(self, account_url, credential=None, **kwargs):
+        with self._lock:
+            if MockBlobServiceClient._store is None:
+                MockBlobServiceClient._store = _open_store()
+
+    def get_blob_client(self, container, blob):
+        return MockBlobClient(self._store, f"{container}/{blob}")
+
+    def get_container_client(self, container):
+        return MockContainerClient(self._store, container)
+
+    def close(self):
+        pass
+
+
+class MockBlobClient:
+    def __init__(self, store, name):
+        self._store = store
+        self._name = name
+
+    def upload_blob(self, data, **kwargs):
+        if isinstance(data, bytes):
+            # Data written in a single request, e.g. flag files
+            data = io.BytesIO(data)
+
+        self._store.upload(self._name, data)
+
+    def stage_block(self, block_id, data, **kwargs):
+        _simulate_transfer(time.monotonic(), len(data))
+        self._store.stage_block(self._name, block_id, len(data))
+
+    def get_block_list(self, block_list_type="committed", **kwargs):
+        blocks = self._store.get_blocks(self._name)
+
+        return [], [MockBlobBlock(block_id) for block_id in blocks]
+
+    def commit_block_list(self, block_list, **kwargs):
+        self._store.commit_blocks(self._name, [block.id for block in block_list])
+
+    def set_http_headers(self, content_settings=None, **kwargs):
+        md5 = content_settings.content_md5
+        self._store.set_md5(self._name, bytes(md5).hex() if md5 else "")
+
+    def delete_blob(self, **kwargs):
+        if not self._store.remove(self._name):
+            raise MockResourceNotFoundError("BlobNotFound", error_code="BlobNotFound")
+
+    def get_blob_properties(self, **kwargs):
+        row = self._store.get(self._name)
+        if row is None:
+            raise MockResourceNotFoundError("BlobNotFound", error_code="BlobNotFound")
+
+        return MockBlobProperties(*row)
+
+
+class MockContainerClient:
+    def __init__(self, store, container):
+        self._store = store
+        self._container = container
+
+    def list_blobs(self, name_starts_with="", **kwargs):
+        prefix = f"{self._container}/"
+        for name, size, md5, modified in self._store.iter_prefix(
+            prefix + name_starts_with
+        ):
+            yield MockBlobProperties(name[len(prefix) :], size, md5, modified)
+
+
+########################################################################################
+# Benchmarks
+
+
+def run_micro_benchmarks(args, tree, nbytes, workdir):
+    """Benchmarks scanning and hashing of 'tree' using azsync.fileutils directly."""
+    sys.path.insert(0, str(args.source))
+
+    from azsync.fileutils import collect_files, collect_md5_hashes, md5_hash
+    from azsync.snapshot import TreeSnapshot
+
+    results = {}
+    with _timer(results, "scan"):
+        filepaths = collect_files(tree)
+
+    snapshot = TreeSnapshot(workdir / "micro.tree")
+    with _timer(results, "snapshot-cold"):
+        snapshot.scan(tree)
+
+    with _timer(results, "snapshot-warm"):
+        snapshot.scan(tree)
+
+    with _timer(results, "hash", nbytes):
+        collect_md5_hashes(tree, workers=args.hash_workers, timeout=24 * 60 * 60)
+
+    # Single-process hashing, comparing the original read() loop with re-used
+    # buffers (readinto) and memory mapped files; files are in the page cache
+    with _timer(results, "hash-read", nbytes):
+        for filepath in filepaths:
+            _md5_hash_read(filepath)
+
+    with _timer(results, "hash-readinto", nbytes):
+        for filepath in filepaths:
+            md5_hash(filepath, use_mmap=False)
+
+    with _timer(results, "hash-mmap", nbytes):
+        for filepath in filepaths:
+            md5_hash(filepath, use_mmap=True)
+
+    return results
+
+
+def _md5_hash_read(filepath, block_size=256 * _KB):
+    """The original azsync.fileutils.md5_hash, allocating a new block per read."""
+    with open(filepath, "rb") as handle:
+        hasher = hashlib.md5()
+        block = handle.read(block_size)
+        while block:
+            hasher.update(block)
+            block = handle.read(block_size)
+
+    return hasher.hexdigest().upper()
+
+
+def run_command_benchmark(args, layout, scenario, tree, nbytes, workdir):
+    log = logging.getLogger("run")
+    settings = _LAYOUTS[layout]
+
+    # The hash cache and tree snapshot are kept between the upload/cached scenarios
+    cache_name = "verify" if scenario == "verify" else "upload"
+
+    command = [
+        args.executable,
+        settings["command"],
+        "--tenant-id",
+        AZURE_TENANT_ID,
+        "--application-id",
+        AZURE_APPLICATION_ID,
+        "--storage-account",
+        AZURE_STORAGE_ACCOUNT,
+        "--container-name",
+        AZURE_CONTAINER,
+        "--credentials",
+        args.root / "credentials.txt",
+        "--pid-file",
+        workdir / "bench.pid",
+        "--state-file",
+        workdir / f"{scenario}.db",
+        "--hash-cache",
+        workdir / f"{cache_name}.hashes",
+        "--hash-workers",
+        str(args.hash_workers),
+        "--main-folder",
+        tree,
+        "--azure-backend",
+        args.backend,
+        "--log-file",
+        workdir / f"{scenario}.log",
+        "--metrics-json",
+        workdir / f"{scenario}.metrics.json",
+    ]
+
+    command.extend(settings["options"])
+    if settings["command"] == "ngs":
+        command.extend(("--tree-snapshot", workdir / f"{cache_name}.tree"))
+    command.extend(args.extra_args)
+
+    env = dict(os.environ)
+    env["PATH"] = "{}:{}".format(args.root / "bin", env["PATH"])
+    env[_STORE_ENV] = str(workdir / "blobs.db")
+    env[_UPLOAD_MBPS_ENV] = str(args.upload_mbps)
+    if args.backend == "native":
+        pythonpath = [args.root / "python", Path(__file__).parent.absolute()]
+        if env.get("PYTHONPATH"):
+            pythonpath.append(env["PYTHONPATH"])
+
+        env["PYTHONPATH"] = ":".join(map(str, pythonpath))
+
+    log.info("running %s/%s", layout, scenario)
+    log.debug("running command %r", command)
+
+    results = {}
+    with _timer(results, "wall", nbytes):
+        # Run in the work dir, so that no azcopy.cfg is picked up by accident
+        proc = subprocess.run(
+            [str(value) for value in command],
+            cwd=workdir,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+        )
+
+    if proc.returncode:
+        for line in proc.stderr.decode("utf-8", "replace").splitlines()[-10:]:
+            log.error("  %s", line)
+
+        raise BenchError(f"{layout}/{scenario} failed with code {proc.returncode}")
+
+    metrics = json.loads((workdir / f"{scenario}.metrics.json").read_text())
+    results.update(_summarize_task_metrics(metrics["tasks"]))
+
+    return results
+
+
+def _summarize_task_metrics(tasks):
+    totals = {"retries": 0, "listings": 0, "bytes_hashed": 0, "bytes_uploaded": 0}
+    seconds = {}
+    for task in tasks:
+        for key in totals:
+            totals[key] += task[key]
+
+        for key, value in task["seconds"].items():
+            if key != "total":
+                seconds[key] = seconds.get(key, 0.0) + value
+
+    for key, value in seconds.items():
+        totals[f"{key}_seconds"] = value
+
+    for key in ("hash", "upload"):
+        if seconds.get(key):
+            totals[f"{key}_mb_per_sec"] = totals[f"bytes_{key}ed"] / _MB / seconds[key]
+
+    return totals
+
+
+@contextlib.contextmanager
+def _timer(results, name, nbytes=None):
+    started = time.monotonic()
+    yield
+
+    elapsed = time.monotonic() - started
+    results[f"{name}_seconds"] = elapsed
+    if nbytes is not None:
+        results[f"{name}_mb_per_sec"] = nbytes / _MB / elapsed
+
+
+def compare_results(results, baseline, tolerance):
+    """Logs changes in time spent relative to 'baseline'; returns false if any
+    benchmark is slower by more than 'tolerance' (a fraction).
+    """
+    log = logging.getLogger("compare")
+
+    regressions = 0
+    for name, values in sorted(results.items()):
+        old_values = baseline.get(name, {})
+        for key, value in sorted(values.items()):
+            old_value = old_values.get(key)
+            if not key.endswith("_seconds") or not old_value:
+                continue
+
+            delta = (value - old_value) / old_value
+            log_func = log.info
+            if delta > tolerance:
+                log_func = log.error
+                regressions += 1
+
+            log_func(
+                "%s %s: %.2fs -> %.2fs (%+.1f%%)",
+                name,
+                key,
+                old_value,
+                value,
+                delta * 100,
+            )
+
+    if regressions:
+        log.error(
+            "%i benchmarks regressed by more than %.0f%%",
+            regressions,
+            tolerance * 100,
+        )
+
+    return not regressions
+
+
+def log_results(results):
+    log = logging.getLogger("results")
+    for name, values in sorted(results.items()):
+        log.info("%s:", name)
+        for key, value in sorted(values.items()):
+            if isinstance(value, float):
+                log.info("  %s = %.2f", key, value)
+            else:
+                log.info("  %s = %s", key, value)
+
+
+########################################################################################
+
+
+def cli_parse_args():
+    parser = argparse.ArgumentParser(
+        formatter_class=HelpFormatter,
+        description="Benchmarks scanning, hashing, and synchronization of generated "
+        "run folders using the 'ngs', 'proteomics', and 'metabolomics' commands. "
+        "Azure is replaced by a local stand-in that hashes, but does not store, "
+        "uploaded data; the 'azcopy' backend is benchmarked using a mock azcopy "
+        "executable and the 'native' backend using a mock Azure SDK.",
+    )
+    parser.add_argument(
+        "--root",
+        type=Path,
+        default=Path("/tmp/") / os.environ.get("USER", "bench") / "azsync-bench",
+        metavar="PATH",
+        help="Root folder for generated trees and benchmark state",
+    )
+    parser.add_argument(
+        "--profile",
+        default="small",
+        choices=tuple(_PROFILES),
+        help="Number and size of generated files; 'medium' and 'large' generate "
+        "trees totalling roughly 8 GB and 80 GB per layout",
+    )
+    parser.add_argument(
+        "--layout",
+        dest="layouts",
+        nargs="+",
+        default=list(_LAYOUTS),
+        choices=tuple(_LAYOUTS),
+        help="Run-folder layouts to benchmark",
+    )
+    parser.add_argument(
+        "--regenerate",
+        action="store_true",
+        help="Re-generate trees, rather than re-using previously generated trees",
+    )
+    parser.add_argument(
+        "--skip-micro",
+        action="store_true",
+        help="Skip benchmarks of scanning and hashing using azsync.fileutils",
+    )
+    parser.add_argument(
+        "--skip-commands",
+        action="store_true",
+        help="Skip benchmarks running the 'sync_to_azure' executable",
+    )
+    parser.add_argument(
+        "--executable",
+        default="sync_to_azure",
+        metavar="EXE",
+        help="Path to 'sync_to_azure' executable",
+    )
+    parser.add_argument(
+        "--source",
+        type=Path,
+        default=Path(__file__).absolute().parent.parent.parent,
+        metavar="PATH",
+        help="Location of the 'azsync' package used for micro benchmarks",
+    )
+    parser.add_argument(
+        "--backend",
+        default="azcopy",
+        choices=("azcopy", "native"),
+        help="Azure backend used by 'sync_to_azure'",
+    )
+    parser.add_argument(
+        "--hash-workers",
+        type=int,
+        default=1,
+        help="Number of processes used to hash files",
+    )
+    parser.add_argument(
+        "--upload-mbps",
+        type=float,
+        default=0,
+        help="Simulated upload bandwidth in MB/s; 0 means no limit",
+    )
+    parser.add_argument(
+        "--output",
+        type=Path,
+        metavar="JSON",
+        help="Write results to this file, for use with --baseline",
+    )
+    parser.add_argument(
+        "--baseline",
+        type=Path,
+        metavar="JSON",
+        help="Compare results with those previously written using --output",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.1,
+        help="Benchmarks slower than the baseline by more than this fraction are "
+        "reported as regressions, causing a non-zero exit code",
+    )
+    parser.add_argument(
+        "extra_args",
+        nargs=argparse.REMAINDER,
+        help="Options passed to 'sync_to_azure', following a '--'",
+    )
+
+    return parser
+
+
+def cli_main(argv):
+    parser = cli_parse_args()
+    args = parser.parse_args(argv)
+    if args.extra_args[:1] == ["--"]:
+        args.extra_args = args.extra_args[1:]
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s %(name)s %(levelname)s %(message)s",
+        datefmt="%H:%M:%S",
+    )
+
+    log = logging.getLogger("main")
+    if not (args.skip_commands or shutil.which(args.executable)):
+        log.error("executable %r not found", args.executable)
+        return 1
+
+    baseline = None
+    if args.baseline is not None:
+        log.info("reading baseline from '%s'", args.baseline)
+        baseline = json.loads(args.baseline.read_text())
+
+    args.root = args.root.absolute()
+    args.root.mkdir(parents=True, exist_ok=True)
+    (args.root / "credentials.txt").write_text("fake-credentials-for-azsync")
+
+    bin_dir = args.root / "bin"
+    if bin_dir.exists():
+        shutil.rmtree(bin_dir)
+    bin_dir.mkdir()
+    (bin_dir / "azure-storage-azcopy").symlink_to(Path(__file__).absolute())
+
+    for filename, source in _MOCK_AZURE_SDK.items():
+        filepath = args.root / "python" / filename
+        filepath.parent.mkdir(parents=True, exist_ok=True)
+        filepath.write_text(source)
+
+    results = {}
+    try:
+        for layout in args.layouts:
+            tree = args.root / "trees" / f"{layout}-{args.profile}"
+            if args.regenerate:
+                tree.with_name(f"{tree.name}.json").unlink(missing_ok=True)
+
+            nfiles, nbytes = generate_tree(tree, layout, args.profile)
+            log.info("%s tree: %i files, %.1f MB", layout, nfiles, nbytes / _MB)
+
+            workdir = args.root / "work" / layout
+            if workdir.exists():
+                shutil.rmtree(workdir)
+            workdir.mkdir(parents=True)
+
+            if not args.skip_micro:
+                results[f"{layout}/micro"] = run_micro_benchmarks(
+                    args, tree, nbytes, workdir
+                )
+
+            if not args.skip_commands:
+                for scenario in _SCENARIOS:
+                    results[f"{layout}/{scenario}"] = run_command_benchmark(
+                        args, layout, scenario, tree, nbytes, workdir
+                    )
+    except BenchError as error:
+        log.error("benchmark failed: %s", error)
+        return 1
+
+    log_results(results)
+
+    if args.output is not None:
+        log.info("writing results to '%s'", args.output)
+        args.output.write_text(json.dumps(results, indent=2, sort_keys=True))
+
+    if baseline is not None and not compare_results(
+        results, baseline, args.tolerance
+    ):
+        return 1
+
+    return 0
+
+
+########################################################################################
+
+
+def main(argv):
+    executable = Path(__file__)
+    if executable.is_symlink():
+        return mock_azcopy_main(argv)
+
+    return cli_main(argv)
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -12,6 +12,7 @@ fi
 
 GROUP=${1:-.}
 FILTER=${2:-.}
+BACKEND=${3:-azcopy}
 OLD_PWD=${PWD}
 
 # Attempt to find location of venv
@@ -47,7 +48,7 @@ do
     echo
     echo "-- ${test} --"
 
-    if ! ./tester.py --config ${test/\/*/}.ini --test "${test}";
+    if ! ./tester.py --config ${test/\/*/}.ini --test "${test}" --backend "${BACKEND}";
     then
         echo
         echo "Test failed: ${test}"
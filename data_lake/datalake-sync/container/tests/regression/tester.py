@@ -1,10 +1,12 @@
 #!/usr/bin/env python3
 # -*- coding: utf8 -*-
 import argparse
+import contextlib
 import datetime
 import getpass
 import hashlib
 import inspect
+import io
 import json
 import logging
 import os
@@ -13,8 +15,10 @@ import re
 import shutil
 import subprocess
 import sys
+import tempfile
 import time
 import traceback
+import urllib.parse
 
 from pathlib import Path
 
@@ -34,7 +38,28 @@ _RNG_AGE_RANGE = 12
 
 _HOSTS = ("main", "alt", "azure")
 
-_RE_PARAM = re.compile(r"^\${[A-Z]+}$")
+# Parameters optionally followed by a fixed suffix, e.g. "${STAGING}/*"
+_RE_PARAM = re.compile(r"^(\${[A-Z]+})(.*)$")
+
+# Modules making up the mock Azure SDK used to test the 'native' backend
+_MOCK_AZURE_SDK = {
+    "azure/__init__.py": "",
+    "azure/core/__init__.py": "",
+    "azure/core/exceptions.py": (
+        "from tester import MockAzureError as AzureError\n"
+        "from tester import MockAzureError as HttpResponseError\n"
+        "from tester import MockResourceNotFoundError as ResourceNotFoundError\n"
+    ),
+    "azure/identity/__init__.py": (
+        "from tester import MockCredential as ClientSecretCredential\n"
+    ),
+    "azure/storage/__init__.py": "",
+    "azure/storage/blob/__init__.py": (
+        "from tester import MockBlobBlock as BlobBlock\n"
+        "from tester import MockBlobServiceClient as BlobServiceClient\n"
+        "from tester import MockContentSettings as ContentSettings\n"
+    ),
+}
 
 
 class HelpFormatter(argparse.ArgumentDefaultsHelpFormatter):
@@ -193,6 +218,18 @@ class TestAction:
 
         return True
 
+    @staticmethod
+    def _action_copy_many(state, source, destination, files):
+        # Only listed files are copied, allowing partially failed jobs to be tested
+        for key in files:
+            filepath = os.path.join(update_path(state, source), key)
+            if not os.path.isfile(filepath):
+                raise TestError(f"file {key!r} not staged for copy")
+
+            TestAction._action_copy(state, filepath, f"{destination}/{key}")
+
+        return True
+
     @staticmethod
     def _action_list_md5s(state, source):
         # Source is expected to be a folder to match azcopy behavior
@@ -273,9 +310,11 @@ class TestEventTemplates:
     CONTAINER = "container"
     DESTINATION = "destination"
     ROOT_URL = f"https://storage.blob.core.windows.net/{CONTAINER}/{DESTINATION}"
+    # Backend being tested; templates may expand to different events per backend
+    BACKEND = "azcopy"
 
     @classmethod
-    def event_from_template(cls, data):
+    def events_from_template(cls, data):
         name = data.pop("template")
         pre_actions = data.pop("pre_actions", ())
         post_actions = data.pop("post_actions", ())
@@ -283,18 +322,18 @@ class TestEventTemplates:
 
         func = get_self_action(cls, name, data)
 
-        event = func(**data)
-
-        actions = []
-        actions.extend(pre_actions)
-        actions.extend(event.pop("actions", []))
-        actions.extend(post_actions)
+        events = func(**data)
+        if isinstance(events, dict):
+            events = [events]
 
-        event["actions"] = actions
+        # Pre-actions apply to the first and post-actions/return codes to the last
+        first, last = events[0], events[-1]
+        first["actions"] = list(pre_actions) + first.get("actions", [])
+        last["actions"] = last.get("actions", []) + list(post_actions)
         if return_code is not None:
-            event["return_code"] = return_code
+            last["return_code"] = return_code
 
-        return event
+        return events
 
     @classmethod
     def _action_copy(cls, source, destination):
@@ -317,6 +356,41 @@ class TestEventTemplates:
             ],
         }
 
+    @classmethod
+    def _action_copy_many(cls, destination, files):
+        # The native backend uploads files one by one, in order, and stops on errors
+        # not specific to a single file (e.g. errors raised by the mock SDK)
+        if cls.BACKEND == "native":
+            return [
+                cls._action_copy(source, f"{destination}/{key}")
+                for key, source in sorted(files.items(), key=lambda it: Path(it[0]))
+            ]
+
+        # azcopy copies all files in one job, via a temporary folder of symlinks
+        return {
+            "call": [
+                "azure-storage-azcopy",
+                "copy",
+                "--log-level",
+                "WARNING",
+                "--put-md5",
+                "--recursive",
+                "--follow-symlinks",
+                "--output-type",
+                "json",
+                "${STAGING}/*",
+                f"{cls.ROOT_URL}/{destination}",
+            ],
+            "actions": [
+                {
+                    "call": "copy_many",
+                    "source": "${STAGING}",
+                    "destination": f"{cls.DESTINATION}/{destination}",
+                    "files": sorted(files),
+                }
+            ],
+        }
+
     @classmethod
     def _action_get_md5(cls, filename):
         return {
@@ -409,9 +483,6 @@ class TestEventTemplates:
 
 class TestEvent:
     def __init__(self, data):
-        if "template" in data:
-            data = TestEventTemplates.event_from_template(data)
-
         self.call = data.pop("call", None)
         if self.call is None:
             raise TestError("no call specified for event")
@@ -474,7 +545,14 @@ class TestRun:
         elif not isinstance(self.events, list):
             raise TestError(f"events must be list, not {self.events!r}")
 
-        self.events = [TestEvent(event) for event in self.events]
+        events = []
+        for event in self.events:
+            if "template" in event:
+                events.extend(TestEventTemplates.events_from_template(event))
+            else:
+                events.append(event)
+
+        self.events = [TestEvent(event) for event in events]
 
         self.return_code = data.pop("return_code", 0)
         if not isinstance(self.return_code, int):
@@ -566,8 +644,16 @@ class TestRun:
         if self.sync == "nextseq":
             command.extend(("--samplesheet-folder", args.root / "storage" / "alt"))
 
+        command.extend(("--azure-backend", args.backend))
+
         env = dict(os.environ)
         env["PATH"] = "{}:{}".format(args.root / "bin", env["PATH"])
+        if args.backend == "native":
+            pythonpath = [args.root / "python", Path(__file__).parent.absolute()]
+            if env.get("PYTHONPATH"):
+                pythonpath.append(env["PYTHONPATH"])
+
+            env["PYTHONPATH"] = ":".join(map(str, pythonpath))
         env["FAKE_AZSYNC_STATE"] = args.root / f"{test_num:02g}_state.json"
 
         log.info("running commmand %r", command)
@@ -706,11 +792,16 @@ def match_call(expected, received):
 
     for expected, received in zip(expected, received):
         if expected != received:
-            if _RE_PARAM.match(expected) and expected not in ("${MAIN}", "${ALT}"):
-                params[expected] = received
-            else:
+            match = _RE_PARAM.match(expected)
+            if match is None or match.group(1) in ("${MAIN}", "${ALT}"):
                 return None
 
+            name, suffix = match.groups()
+            if not received.endswith(suffix):
+                return None
+
+            params[name] = received[: len(received) - len(suffix)]
+
     return params
 
 
@@ -779,6 +870,7 @@ def mock_main(argv):
     # Log messages to state file, keeping mock output to a minimum
     handler = MemoryHandler(state["log"])
     root = logging.getLogger()
+    root_level = root.level
     root.setLevel(logging.DEBUG)
     root.addHandler(handler)
 
@@ -789,6 +881,10 @@ def mock_main(argv):
         sys.stderr.write(f"unhandled {error!r}; aborting ..\n")
         state["failed"] = True
         return_code = 255
+    finally:
+        # Required when called in-process via the mock Azure SDK
+        root.removeHandler(handler)
+        root.setLevel(root_level)
 
     with open(state_filename, "wt") as handle:
         json.dump(state, handle, indent=2)
@@ -796,6 +892,139 @@ def mock_main(argv):
     return return_code
 
 
+########################################################################################
+# Mock Azure SDK; calls are translated into the equivalent azcopy calls, allowing the
+# same test templates to be used for both the 'azcopy' and the 'native' backends.
+
+
+class MockAzureError(Exception):
+    def __init__(self, message=None, error_code=None, **kwargs):
+        super().__init__(message)
+        self.error_code = error_code
+
+
+class MockResourceNotFoundError(MockAzureError):
+    pass
+
+
+class MockCredential:
+    def __init__(self, tenant_id, client_id, client_secret, **kwargs):
+        pass
+
+    def close(self):
+        pass
+
+
+class MockContentSettings:
+    def __init__(self, content_md5=None, **kwargs):
+        self.content_md5 = content_md5
+
+
+class MockBlobBlock:
+    def __init__(self, block_id, **kwargs):
+        self.id = block_id
+
+
+class MockBlobProperties:
+    def __init__(self, name, size, md5):
+        self.name = name
+        self.size = size
+        self.content_settings = MockContentSettings(
+            content_md5=bytearray.fromhex(md5) if md5 else None
+        )
+
+
+class MockBlobServiceClient:
+    def __init__(self, account_url, credential=None, **kwargs):
+        self.account_url = account_url.rstrip("/")
+
+    def get_blob_client(self, container, blob):
+        return MockBlobClient(self.account_url, container, blob)
+
+    def get_container_client(self, container):
+        return MockContainerClient(self.account_url, container)
+
+    def close(self):
+        pass
+
+
+class MockBlobClient:
+    def __init__(self, account_url, container, blob):
+        self.url = mock_blob_url(account_url, container, blob)
+
+    def upload_blob(self, data, **kwargs):
+        if isinstance(data, bytes):
+            # Data written in a single request is staged as a file for the mock 'copy'
+            with tempfile.NamedTemporaryFile() as handle:
+                handle.write(data)
+                handle.flush()
+                handle.seek(0)
+
+                return self.upload_blob(handle, **kwargs)
+
+        # The stream is consumed, since the client hashes the data while uploading
+        while data.read(64 * 1024):
+            pass
+
+        # Log-level matches the default used by the 'copy' template
+        mock_sdk_call(
+            ["copy", "--log-level", "WARNING", "--put-md5", data.name, self.url]
+        )
+
+    def set_http_headers(self, content_settings=None, **kwargs):
+        # MD5s are calculated by the mock 'copy' command
+        pass
+
+    def delete_blob(self, **kwargs):
+        mock_sdk_call(["remove", "--log-level", "WARNING", self.url])
+
+    def get_blob_properties(self, **kwargs):
+        (properties,) = mock_sdk_call(["get_md5", self.url])
+
+        return properties
+
+
+class MockContainerClient:
+    def __init__(self, account_url, container):
+        self.account_url = account_url
+        self.container = container
+
+    def list_blobs(self, name_starts_with="", **kwargs):
+        url = mock_blob_url(self.account_url, self.container, name_starts_with)
+
+        result = []
+        for properties in mock_sdk_call(["list_md5s", url.rstrip("/")]):
+            properties.name = name_starts_with + properties.name
+            result.append(properties)
+
+        return result
+
+
+def mock_blob_url(account_url, container, blob):
+    return "/".join((account_url, container, urllib.parse.quote(blob)))
+
+
+def mock_sdk_call(argv):
+    """Runs mock azcopy command and returns MockBlobProperties for MD5 lines."""
+    stdout = io.StringIO()
+    with contextlib.redirect_stdout(stdout):
+        return_code = mock_main(["azure-storage-azcopy"] + argv)
+
+    if return_code:
+        if "X-Ms-Error-Code: [BlobNotFound]" in stdout.getvalue():
+            raise MockResourceNotFoundError("BlobNotFound", error_code="BlobNotFound")
+
+        raise MockAzureError(f"mock azure call returned {return_code}")
+
+    result = []
+    for line in stdout.getvalue().splitlines():
+        if line.startswith("MD5: "):
+            md5, size, name = line[5:].split("\t", 2)
+            result.append(MockBlobProperties(name=name, size=int(size), md5=md5))
+
+    return result
+
+
 ########################################################################################
 
 
@@ -830,6 +1059,13 @@ def cli_parse_args():
         metavar="EXE",
         help="Path to 'sync_to_azure' executable",
     )
+    parser.add_argument(
+        "--backend",
+        default="azcopy",
+        choices=("azcopy", "native"),
+        help="Azure backend used by 'sync_to_azure'; the 'native' backend is tested "
+        "using a mock Azure SDK that behaves like the mock azcopy executable",
+    )
 
     return parser
 
@@ -868,6 +1104,7 @@ def cli_main(argv):
     with args.test.open("rt") as handle:
         tests = json.load(handle)
 
+    TestEventTemplates.BACKEND = args.backend
     runner = TestRunner(tests)
 
     if args.root.exists():
@@ -884,6 +1121,14 @@ def cli_main(argv):
     log.info("creating mock executable at %r", bin_dir / "azure-storage-azcopy")
     (bin_dir / "azure-storage-azcopy").symlink_to(Path(__file__).absolute())
 
+    if args.backend == "native":
+        python_dir = args.root / "python"
+        log.info("creating mock Azure SDK at %r", python_dir)
+        for filename, source in _MOCK_AZURE_SDK.items():
+            filepath = python_dir / filename
+            filepath.parent.mkdir(parents=True, exist_ok=True)
+            filepath.write_text(source)
+
     if not runner.run(args):
         return 1
 
@@ -0,0 +1,113 @@
+import json
+
+from datetime import datetime
+
+import pytest
+
+from azsync.bandwidth import BandwidthBudget, BandwidthProfile, parse_hours
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        ("22:00-06:00", (22 * 60, 6 * 60)),
+        ("8-17:30", (8 * 60, 17 * 60 + 30)),
+        ("20:00-24:00", (20 * 60, 0)),
+    ],
+)
+def test_parse_hours(value, expected):
+    assert parse_hours(value) == expected
+
+
+@pytest.mark.parametrize("value", ["", "22:00", "25:00-06:00", "06:60-07:00", "a-b"])
+def test_parse_hours__invalid_values(value):
+    with pytest.raises(ValueError):
+        parse_hours(value)
+
+
+@pytest.mark.parametrize("value", [-1, "10"])
+def test_bandwidth_profile__invalid_caps(value):
+    with pytest.raises(ValueError):
+        BandwidthProfile(day_mbps=value)
+    with pytest.raises(ValueError):
+        BandwidthProfile(day_mbps=10, night_mbps=value)
+
+
+@pytest.mark.parametrize(
+    "hour, minute, expected",
+    [(21, 59, 10), (22, 0, 100), (3, 0, 100), (5, 59, 100), (6, 0, 10), (12, 0, 10)],
+)
+def test_bandwidth_profile__night_wraps_midnight(hour, minute, expected):
+    profile = BandwidthProfile(day_mbps=10, night_mbps=100)
+
+    assert profile.cap_mbps(datetime(2024, 1, 1, hour, minute)) == expected
+
+
+def test_bandwidth_profile__night_within_day():
+    profile = BandwidthProfile(day_mbps=10, night_mbps=0, night_hours=(60, 120))
+
+    assert profile.cap_mbps(datetime(2024, 1, 1, 0, 59)) == 10
+    assert profile.cap_mbps(datetime(2024, 1, 1, 1, 0)) is None
+    assert profile.cap_mbps(datetime(2024, 1, 1, 2, 0)) == 10
+
+
+def test_bandwidth_profile__night_defaults_to_day():
+    profile = BandwidthProfile(day_mbps=10)
+
+    assert profile.cap_mbps(datetime(2024, 1, 1, 0, 0)) == 10
+    assert profile.cap_mbps(datetime(2024, 1, 1, 12, 0)) == 10
+
+
+def test_bandwidth_budget__without_folder():
+    with BandwidthBudget(BandwidthProfile(day_mbps=100)) as budget:
+        assert budget.cap_mbps() == 100
+        assert budget.cap_mbps(workers=4) == 25
+
+
+def test_bandwidth_budget__no_limit(tmp_path):
+    with BandwidthBudget(BandwidthProfile(day_mbps=0), root=tmp_path) as budget:
+        assert budget.cap_mbps() is None
+
+
+def test_bandwidth_budget__invalid_priority():
+    with pytest.raises(ValueError):
+        BandwidthBudget(BandwidthProfile(day_mbps=100), priority="urgent")
+
+
+def test_bandwidth_budget__shared_by_priority(tmp_path):
+    profile = BandwidthProfile(day_mbps=140)
+
+    with BandwidthBudget(profile, "high", root=tmp_path, refresh=0) as budget_1:
+        with BandwidthBudget(profile, "normal", root=tmp_path, refresh=0) as budget_2:
+            with BandwidthBudget(profile, "low", root=tmp_path, refresh=0) as budget_3:
+                assert budget_1.cap_mbps() == 80
+                assert budget_2.cap_mbps() == 40
+                assert budget_3.cap_mbps() == 20
+
+            assert budget_1.cap_mbps() == pytest.approx(140 * 4 / 6)
+            assert budget_2.cap_mbps() == pytest.approx(140 * 2 / 6)
+
+        assert budget_1.cap_mbps() == 140
+
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_bandwidth_budget__share_is_cached(tmp_path):
+    profile = BandwidthProfile(day_mbps=100)
+
+    with BandwidthBudget(profile, root=tmp_path, refresh=3600) as budget_1:
+        assert budget_1.cap_mbps() == 100
+        with BandwidthBudget(profile, root=tmp_path) as budget_2:
+            assert budget_1.cap_mbps() == 100
+            assert budget_2.cap_mbps() == 50
+
+
+def test_bandwidth_budget__stale_leases_are_removed(tmp_path):
+    # Leases are not locked if the owning process was killed
+    stale = tmp_path / "stale.lease"
+    stale.write_text(json.dumps({"priority": "high", "pid": 1}))
+
+    with BandwidthBudget(BandwidthProfile(day_mbps=100), root=tmp_path) as budget:
+        assert budget.cap_mbps() == 100
+
+    assert not stale.exists()
@@ -0,0 +1,799 @@
+import datetime
+import hashlib
+import importlib
+import os
+import sys
+import threading
+import time
+import types
+
+from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import ANY, MagicMock, call, patch
+
+import pytest
+
+
+def _install_mock_azure_sdk():
+    """Installs the mock Azure SDK used by the regression tests in place of the
+    'azure' package, so that the native backend is tested without the Azure SDK.
+    """
+    sys.path.insert(0, str(Path(__file__).parent.parent / "regression"))
+    tester = importlib.import_module("tester")
+
+    for filename, source in tester._MOCK_AZURE_SDK.items():
+        name = filename[:-3].replace("/", ".")
+        if name.endswith(".__init__"):
+            name = name[: -len(".__init__")]
+
+        module = types.ModuleType(name)
+        if filename.endswith("__init__.py"):
+            module.__path__ = []
+
+        exec(source, module.__dict__)
+        sys.modules[name] = module
+
+        parent, _, child = name.rpartition(".")
+        if parent:
+            setattr(sys.modules[parent], child, module)
+
+
+_install_mock_azure_sdk()
+
+from azure.core.exceptions import HttpResponseError, ResourceNotFoundError  # noqa
+
+from azsync.azcopy import AZError, AZFileNotFoundError, AZLoginError  # noqa
+from azsync.blob import AZBlobClient, _split_url, _UploadStream  # noqa
+from azsync.fileutils import PartialStats, fast_digest  # noqa
+from azsync.hashcache import HashCache  # noqa
+from azsync.state import PersistentState  # noqa
+from tester import MockBlobBlock  # noqa
+
+from .test_azcopy.common import (  # noqa
+    PopenMock,
+    default_login_call,
+    default_logout_call,
+    APP_ID,
+    TENANT_ID,
+    SECRET,
+)
+
+ACCOUNT_URL = "https://storage.blob.core.windows.net"
+
+
+def _blob(name, size, md5, mtime=0):
+    return SimpleNamespace(
+        name=name,
+        size=size,
+        last_modified=datetime.datetime.fromtimestamp(mtime, datetime.timezone.utc),
+        content_settings=SimpleNamespace(
+            content_md5=None if md5 is None else bytearray.fromhex(md5)
+        ),
+    )
+
+
+@pytest.fixture
+def client():
+    return AZBlobClient(tenant_id=TENANT_ID, app_id=APP_ID, secret=SECRET)
+
+
+@pytest.fixture
+def service():
+    with patch.object(AZBlobClient, "_new_service", autospec=True) as mock:
+        mock.return_value = MagicMock()
+
+        yield mock
+
+
+def test_blob_client__invalid_max_connections():
+    with pytest.raises(ValueError):
+        AZBlobClient(TENANT_ID, APP_ID, SECRET, max_connections=0)
+
+
+def test_blob_client__invalid_credentials():
+    with pytest.raises(ValueError):
+        AZBlobClient(TENANT_ID, APP_ID, " ")
+
+
+def test_split_url():
+    assert _split_url(f"{ACCOUNT_URL}/container/foo/bar%20zod.txt") == (
+        ACCOUNT_URL,
+        "container",
+        "foo/bar zod.txt",
+    )
+    assert _split_url(f"{ACCOUNT_URL}/container") == (ACCOUNT_URL, "container", "")
+
+
+def test_blob_client__login_and_logout(client, service):
+    with PopenMock.patch() as mock:
+        mock.side_effect = [PopenMock(), PopenMock()]
+
+        with client:
+            assert not client.is_logged_in()
+            assert client.login()
+            assert client.is_logged_in()
+            assert client.login()
+
+        assert not client.is_logged_in()
+        assert mock.mock_calls == [default_login_call(), default_logout_call()]
+
+
+def test_blob_client__login_failed(client, service):
+    with PopenMock.patch() as mock:
+        mock.side_effect = [PopenMock(returncode=1)]
+
+        with client:
+            with pytest.raises(AZLoginError):
+                client.get_md5(f"{ACCOUNT_URL}/container/foo")
+
+        assert mock.mock_calls == [default_login_call()]
+        assert service.mock_calls == []
+
+
+def test_blob_client__connections_are_reused(client, service):
+    with PopenMock.patch() as mock:
+        mock.side_effect = [PopenMock(), PopenMock()]
+
+        with client:
+            client.remove(f"{ACCOUNT_URL}/container/foo")
+            client.remove(f"{ACCOUNT_URL}/container/bar")
+
+        assert service.mock_calls == [call(client, ACCOUNT_URL)]
+        assert service.return_value.mock_calls == [
+            call.get_blob_client("container", "foo"),
+            call.get_blob_client().delete_blob(),
+            call.get_blob_client("container", "bar"),
+            call.get_blob_client().delete_blob(),
+            call.close(),
+        ]
+
+
+def test_blob_client__copy(client, service, tmp_path):
+    src_file = tmp_path / "file.txt"
+    src_file.write_bytes(b"foobar")
+
+    blob_client = service.return_value.get_blob_client
+    blob_client.return_value.upload_blob.side_effect = lambda data, **_: data.read()
+
+    with PopenMock.patch() as mock:
+        mock.side_effect = [PopenMock(), PopenMock()]
+
+        with client:
+            client.copy(src_file, f"{ACCOUNT_URL}/container/foo/file%201.txt")
+
+        blob_client.assert_called_once_with("container", "foo/file 1.txt")
+        blob_client.return_value.upload_blob.assert_called_once_with(
+            ANY, length=6, overwrite=True, validate_content=True, max_concurrency=4
+        )
+
+        # The file is only read once, by the upload; the MD5 is set afterwards
+        (data,), _ = blob_client.return_value.upload_blob.call_args
+        assert data.name == str(src_file)
+
+        _, kwargs = blob_client.return_value.set_http_headers.call_args
+        md5 = kwargs["content_settings"].content_md5
+        assert bytes(md5).hex().upper() == "3858F62230AC3C915F300C664312C63F"
+
+
+def test_blob_client__get_md5(client, service):
+    blob_client = service.return_value.get_blob_client.return_value
+    blob_client.get_blob_properties.return_value = _blob(
+        "foo", 6, "3858F62230AC3C915F300C664312C63F"
+    )
+
+    with PopenMock.patch() as mock:
+        mock.side_effect = [PopenMock(), PopenMock()]
+
+        with client:
+            assert client.get_md5(f"{ACCOUNT_URL}/container/foo") == PartialStats(
+                hash="3858F62230AC3C915F300C664312C63F", size=6
+            )
+
+
+def test_blob_client__get_md5__missing_md5(client, service):
+    blob_client = service.return_value.get_blob_client.return_value
+    blob_client.get_blob_properties.return_value = _blob("foo", 6, None)
+
+    with PopenMock.patch() as mock:
+        mock.side_effect = [PopenMock(), PopenMock()]
+
+        with client:
+            assert client.get_md5(f"{ACCOUNT_URL}/container/foo") == PartialStats(
+                hash="", size=6
+            )
+
+
+def test_blob_client__get_md5__not_found(client, service):
+    blob_client = service.return_value.get_blob_client.return_value
+    blob_client.get_blob_properties.side_effect = ResourceNotFoundError()
+
+    with PopenMock.patch() as mock:
+        mock.side_effect = [PopenMock(), PopenMock()]
+
+        with client:
+            with pytest.raises(AZFileNotFoundError):
+                client.get_md5(f"{ACCOUNT_URL}/container/foo")
+
+
+def test_blob_client__remove__error(client, service):
+    blob_client = service.return_value.get_blob_client.return_value
+    blob_client.delete_blob.side_effect = HttpResponseError()
+
+    with PopenMock.patch() as mock:
+        mock.side_effect = [PopenMock(), PopenMock()]
+
+        with client:
+            with pytest.raises(AZError):
+                client.remove(f"{ACCOUNT_URL}/container/foo")
+
+
+def test_blob_client__list_md5s(client, service):
+    container = service.return_value.get_container_client.return_value
+    container.list_blobs.return_value = [
+        _blob("foo/bar/a.txt", 6, "3858F62230AC3C915F300C664312C63F"),
+        _blob("foo/bar/b/c.txt", 0, None),
+    ]
+
+    with PopenMock.patch() as mock:
+        mock.side_effect = [PopenMock(), PopenMock()]
+
+        with client:
+            assert client.list_md5s(f"{ACCOUNT_URL}/container/foo/bar") == {
+                Path("a.txt"): PartialStats(
+                    hash="3858F62230AC3C915F300C664312C63F", size=6
+                ),
+                Path("b/c.txt"): PartialStats(hash="", size=0),
+            }
+
+        service.return_value.get_container_client.assert_called_once_with("container")
+        container.list_blobs.assert_called_once_with(name_starts_with="foo/bar/")
+
+
+def test_blob_client__list_md5s__container_root(client, service):
+    container = service.return_value.get_container_client.return_value
+    container.list_blobs.return_value = []
+
+    with PopenMock.patch() as mock:
+        mock.side_effect = [PopenMock(), PopenMock()]
+
+        with client:
+            assert client.list_md5s(f"{ACCOUNT_URL}/container/") == {}
+
+        container.list_blobs.assert_called_once_with(name_starts_with="")
+
+
+def test_blob_client__list_md5s__paths(client, service):
+    blob_client = service.return_value.get_blob_client.return_value
+    blob_client.get_blob_properties.side_effect = [
+        _blob("foo/a.txt", 6, "3858F62230AC3C915F300C664312C63F"),
+        ResourceNotFoundError(),
+    ]
+
+    with PopenMock.patch() as mock:
+        mock.side_effect = [PopenMock(), PopenMock()]
+
+        with client:
+            paths = {Path("a.txt"), Path("b c.txt")}
+            assert client.list_md5s(f"{ACCOUNT_URL}/container/foo", paths=paths) == {
+                Path("a.txt"): PartialStats(
+                    hash="3858F62230AC3C915F300C664312C63F", size=6
+                ),
+            }
+
+        assert service.return_value.get_blob_client.call_args_list == [
+            call("container", "foo/a.txt"),
+            call("container", "foo/b c.txt"),
+        ]
+        service.return_value.get_container_client.assert_not_called()
+
+
+def test_blob_client__sync_uses_azcopy(client, service):
+    with PopenMock.patch() as mock:
+        mock.side_effect = [PopenMock(), PopenMock(), PopenMock()]
+
+        with client:
+            client.set_log_level("WARNING")
+            client.sync("/src", f"{ACCOUNT_URL}/container/foo")
+
+        assert mock.mock_calls[1] == call(
+            [
+                "azure-storage-azcopy",
+                "sync",
+                "--log-level",
+                "WARNING",
+                "--put-md5",
+                "--delete-destination",
+                "false",
+                "/src",
+                f"{ACCOUNT_URL}/container/foo",
+            ]
+        )
+        assert service.mock_calls == []
+
+
+def test_blob_client__copy_many(client, service, tmp_path):
+    (tmp_path / "file_1").write_bytes(b"foobar")
+    (tmp_path / "file_2").write_bytes(b"foobar")
+
+    with PopenMock.patch() as mock:
+        mock.side_effect = [PopenMock(), PopenMock()]
+
+        with client:
+            client.copy_many(
+                {"foo": tmp_path / "file_1", Path("bar/zod?.txt"): tmp_path / "file_2"},
+                f"{ACCOUNT_URL}/container/dst",
+            )
+
+        assert service.mock_calls == [call(client, ACCOUNT_URL)]
+        blob_client = service.return_value.get_blob_client
+        assert blob_client.call_args_list == [
+            call("container", "dst/bar/zod?.txt"),
+            call("container", "dst/foo"),
+        ]
+        assert blob_client.return_value.upload_blob.call_count == 2
+
+
+def test_upload_stream__unlimited(tmp_path):
+    (tmp_path / "file").write_bytes(b"foobar")
+
+    with (tmp_path / "file").open("rb") as handle:
+        with patch("azsync.blob.time", autospec=True) as mock:
+            stream = _UploadStream(handle)
+
+            assert stream.name == handle.name
+            assert stream.read(4) == b"foob"
+            assert stream.read() == b"ar"
+
+        mock.sleep.assert_not_called()
+
+
+def test_upload_stream__bandwidth_cap(tmp_path):
+    (tmp_path / "file").write_bytes(b"x" * 1000)
+
+    with (tmp_path / "file").open("rb") as handle:
+        with patch("azsync.blob.time", autospec=True) as mock:
+            mock.monotonic.side_effect = [10.0, 10.5]
+
+            # 0.004 mbps = 500 bytes per second
+            stream = _UploadStream(handle, cap_mbps=0.004)
+            assert stream.read() == b"x" * 1000
+
+        mock.sleep.assert_called_once_with(1.5)
+
+
+def test_blob_client__copy_many__per_file_failures(client, service, tmp_path):
+    (tmp_path / "file_1").write_bytes(b"foobar")
+    (tmp_path / "file_2").write_bytes(b"foobar")
+
+    blob_client = service.return_value.get_blob_client
+    blob_client.return_value.upload_blob.side_effect = [
+        HttpResponseError(error_code="AuthorizationFailure"),
+        None,
+    ]
+
+    with PopenMock.patch() as mock:
+        mock.side_effect = [PopenMock(), PopenMock()]
+
+        with client:
+            failed = client.copy_many(
+                {"foo": tmp_path / "file_1", "bar": tmp_path / "file_2"},
+                f"{ACCOUNT_URL}/container/dst",
+            )
+
+    assert failed == {"bar"}
+
+
+def test_blob_client__copy_many__unknown_error(client, service, tmp_path):
+    (tmp_path / "file_1").write_bytes(b"foobar")
+
+    blob_client = service.return_value.get_blob_client
+    blob_client.return_value.upload_blob.side_effect = HttpResponseError()
+
+    with PopenMock.patch() as mock:
+        mock.side_effect = [PopenMock(), PopenMock()]
+
+        with client:
+            with pytest.raises(AZError):
+                client.copy_many(
+                    {"foo": tmp_path / "file_1"}, f"{ACCOUNT_URL}/container/dst"
+                )
+
+
+def test_blob_client__invalid_max_uploads():
+    with pytest.raises(ValueError):
+        AZBlobClient(TENANT_ID, APP_ID, SECRET, max_uploads=0)
+    with pytest.raises(ValueError):
+        AZBlobClient(TENANT_ID, APP_ID, SECRET, max_upload_bytes=0)
+
+
+def _track_concurrent_uploads(service):
+    """Makes uploads take a little while; returns a list of the number of uploads
+    in progress as each upload started.
+    """
+    lock = threading.Lock()
+    running = []
+    observed = []
+
+    def _upload(data, **kwargs):
+        with lock:
+            running.append(data)
+            observed.append(len(running))
+
+        time.sleep(0.05)
+        with lock:
+            running.remove(data)
+
+    blob_client = service.return_value.get_blob_client
+    blob_client.return_value.upload_blob.side_effect = _upload
+
+    return observed
+
+
+@pytest.mark.parametrize(
+    "max_uploads, max_upload_bytes, expected",
+    ((1, None, 1), (2, None, 2), (4, None, 4), (4, 12, 2), (4, 5, 1)),
+)
+def test_blob_client__copy_many__concurrent_uploads(
+    service, tmp_path, max_uploads, max_upload_bytes, expected
+):
+    file_map = {}
+    for idx in range(8):
+        file_map[f"file_{idx}"] = tmp_path / f"file_{idx}"
+        file_map[f"file_{idx}"].write_bytes(b"foobar")
+
+    observed = _track_concurrent_uploads(service)
+    client = AZBlobClient(
+        TENANT_ID,
+        APP_ID,
+        SECRET,
+        max_uploads=max_uploads,
+        max_upload_bytes=max_upload_bytes,
+    )
+
+    with PopenMock.patch() as mock:
+        mock.side_effect = [PopenMock(), PopenMock()]
+
+        with client:
+            assert client.copy_many(file_map, f"{ACCOUNT_URL}/container/dst") == set()
+
+    assert len(observed) == 8
+    assert max(observed) == expected
+
+
+def test_blob_client__copy_many__bandwidth_cap_is_shared(service, tmp_path):
+    (tmp_path / "file_1").write_bytes(b"foobar")
+    (tmp_path / "file_2").write_bytes(b"foobar")
+
+    client = AZBlobClient(TENANT_ID, APP_ID, SECRET, max_uploads=4)
+    client.set_bandwidth_cap(100)
+
+    with PopenMock.patch() as mock:
+        mock.side_effect = [PopenMock(), PopenMock()]
+
+        with client, patch("azsync.blob._UploadStream", wraps=_UploadStream) as stream:
+            client.copy_many(
+                {"foo": tmp_path / "file_1", "bar": tmp_path / "file_2"},
+                f"{ACCOUNT_URL}/container/dst",
+            )
+
+    expected = call(ANY, cap_mbps=50, hashers=())
+    assert stream.call_args_list == [expected, expected]
+
+
+def test_blob_client__copy_many__unknown_error_stops_uploads(service, tmp_path):
+    file_map = {}
+    for idx in range(8):
+        file_map[f"file_{idx}"] = tmp_path / f"file_{idx}"
+        file_map[f"file_{idx}"].write_bytes(b"foobar")
+
+    blob_client = service.return_value.get_blob_client
+    blob_client.return_value.upload_blob.side_effect = HttpResponseError()
+    client = AZBlobClient(TENANT_ID, APP_ID, SECRET, max_uploads=2)
+
+    with PopenMock.patch() as mock:
+        mock.side_effect = [PopenMock(), PopenMock()]
+
+        with client:
+            with pytest.raises(AZError):
+                client.copy_many(file_map, f"{ACCOUNT_URL}/container/dst")
+
+    # Only uploads already in progress are attempted
+    assert blob_client.return_value.upload_blob.call_count <= 2
+
+
+def test_blob_client__lazy_verification(client):
+    assert not client.verifies_uploads
+    client.set_lazy_verification(True)
+    assert client.verifies_uploads
+
+
+@pytest.mark.parametrize("acknowledged", (None, {}, {"content_md5": None}))
+def test_blob_client__write(client, service, acknowledged):
+    md5 = hashlib.md5(b"foobar").digest()
+    blob_client = service.return_value.get_blob_client
+    blob_client.return_value.upload_blob.return_value = acknowledged
+
+    with PopenMock.patch() as mock:
+        mock.side_effect = [PopenMock(), PopenMock()]
+
+        with client:
+            stats = client.write(b"foobar", f"{ACCOUNT_URL}/container/dst.sync")
+
+    assert stats == PartialStats(hash=md5.hex().upper(), size=6)
+    assert blob_client.call_args_list == [call("container", "dst.sync")]
+    ((data,), kwargs) = blob_client.return_value.upload_blob.call_args
+    assert data == b"foobar"
+    assert bytes(kwargs["content_settings"].content_md5) == md5
+    # The Content-MD5 is set by the upload itself
+    blob_client.return_value.set_http_headers.assert_not_called()
+
+
+def test_blob_client__write__acknowledged_md5(client, service):
+    blob_client = service.return_value.get_blob_client
+    upload_blob = blob_client.return_value.upload_blob
+
+    with PopenMock.patch() as mock:
+        mock.side_effect = [PopenMock(), PopenMock()]
+
+        with client:
+            upload_blob.return_value = {
+                "content_md5": bytearray(hashlib.md5(b"foobar").digest())
+            }
+            assert client.write(b"foobar", f"{ACCOUNT_URL}/container/dst")
+
+            upload_blob.return_value = {
+                "content_md5": bytearray(hashlib.md5(b"barfoo").digest())
+            }
+            assert client.write(b"foobar", f"{ACCOUNT_URL}/container/dst") is None
+
+
+def _upload_reads_data(service):
+    blob_client = service.return_value.get_blob_client
+    blob_client.return_value.upload_blob.side_effect = lambda data, **_: data.read()
+
+    return blob_client
+
+
+def test_blob_client__copy__returns_stats(client, service, tmp_path):
+    src_file = tmp_path / "file.txt"
+    src_file.write_bytes(b"foobar")
+    _upload_reads_data(service)
+
+    with PopenMock.patch() as mock:
+        mock.side_effect = [PopenMock(), PopenMock()]
+
+        with client:
+            stats = client.copy(src_file, f"{ACCOUNT_URL}/container/file.txt")
+
+    assert client.hashes_uploads is False
+    assert stats == PartialStats(
+        hash="3858F62230AC3C915F300C664312C63F",
+        size=6,
+        mtime=src_file.stat().st_mtime,
+    )
+
+
+def test_blob_client__copy__file_modified_during_upload(client, service, tmp_path):
+    src_file = tmp_path / "file.txt"
+    src_file.write_bytes(b"foobar")
+
+    def _upload_blob(data, **kwargs):
+        data.read()
+        os.utime(src_file, (12345, 12345))
+
+    blob_client = service.return_value.get_blob_client
+    blob_client.return_value.upload_blob.side_effect = _upload_blob
+
+    with HashCache(tmp_path / "cache.db") as cache:
+        client.set_hash_cache(cache)
+
+        with PopenMock.patch() as mock:
+            mock.side_effect = [PopenMock(), PopenMock()]
+
+            with client:
+                assert client.copy(src_file, f"{ACCOUNT_URL}/container/x") is None
+
+        assert cache.get(src_file) is None
+
+
+def test_blob_client__copy__records_hash(client, service, tmp_path):
+    src_file = tmp_path / "file.txt"
+    src_file.write_bytes(b"foobar")
+    _upload_reads_data(service)
+
+    with HashCache(tmp_path / "cache.db") as cache:
+        client.set_hash_cache(cache)
+        assert client.hashes_uploads is True
+
+        with PopenMock.patch() as mock:
+            mock.side_effect = [PopenMock(), PopenMock()]
+
+            with client:
+                stats = client.copy(src_file, f"{ACCOUNT_URL}/container/file.txt")
+
+        assert cache.get(src_file) == stats
+
+
+def test_blob_client__copy__records_fast_digest(client, service, tmp_path):
+    src_file = tmp_path / "file.txt"
+    src_file.write_bytes(b"foobar")
+    _upload_reads_data(service)
+
+    with HashCache(tmp_path / "cache.db", fast_digests=True) as cache:
+        client.set_hash_cache(cache)
+
+        with PopenMock.patch() as mock:
+            mock.side_effect = [PopenMock(), PopenMock()]
+
+            with client:
+                stats = client.copy(src_file, f"{ACCOUNT_URL}/container/file.txt")
+
+        assert cache.get_digest(src_file) == (stats, fast_digest(src_file))
+
+
+@pytest.mark.parametrize("rm_dst", [False, True])
+def test_blob_client__sync__native(client, service, tmp_path, rm_dst):
+    src_dir = tmp_path / "src"
+    (src_dir / "sub").mkdir(parents=True)
+    for filename in ("same", "missing", "resized", "sub/newer"):
+        (src_dir / filename).write_bytes(b"foobar")
+        os.utime(src_dir / filename, (1000, 1000))
+    os.utime(src_dir / "sub" / "newer", (3000, 3000))
+
+    container = service.return_value.get_container_client.return_value
+    container.list_blobs.return_value = [
+        _blob("dst/same", 6, None, mtime=2000),
+        _blob("dst/resized", 7, None, mtime=2000),
+        _blob("dst/sub/newer", 6, None, mtime=2000),
+        _blob("dst/extra", 6, None, mtime=2000),
+    ]
+    blob_client = _upload_reads_data(service)
+
+    with HashCache(tmp_path / "cache.db") as cache:
+        client.set_hash_cache(cache)
+
+        with PopenMock.patch() as mock:
+            mock.side_effect = [PopenMock(), PopenMock()]
+
+            with client:
+                client.sync(src_dir, f"{ACCOUNT_URL}/container/dst", rm_dst=rm_dst)
+
+            # azcopy is only used to login and logout
+            assert mock.mock_calls == [default_login_call(), default_logout_call()]
+
+        expected_calls = [
+            call("container", "dst/missing"),
+            call("container", "dst/resized"),
+            call("container", "dst/sub/newer"),
+        ]
+        if rm_dst:
+            expected_calls.append(call("container", "dst/extra"))
+
+        assert blob_client.call_args_list == expected_calls
+        assert blob_client.return_value.delete_blob.call_count == int(rm_dst)
+        assert cache.get(src_dir / "missing").hash == "3858F62230AC3C915F300C664312C63F"
+        assert cache.get(src_dir / "same") is None
+
+
+def _block_id(index, data):
+    return f"{index:06d}-{hashlib.md5(data).hexdigest()}"
+
+
+@pytest.fixture
+def checkpoints(tmp_path, client):
+    with PersistentState(tmp_path / "state.db") as state:
+        client.block_size = 4
+        client.set_checkpoints(state)
+
+        yield state
+
+
+def test_blob_client__copy__small_files_not_uploaded_in_blocks(
+    client, service, checkpoints, tmp_path
+):
+    src_file = tmp_path / "file.txt"
+    src_file.write_bytes(b"foo")
+    blob_client = _upload_reads_data(service)
+
+    with PopenMock.patch() as mock:
+        mock.side_effect = [PopenMock(), PopenMock()]
+
+        with client:
+            client.copy(src_file, f"{ACCOUNT_URL}/container/file.txt")
+
+    assert blob_client.return_value.upload_blob.call_count == 1
+    blob_client.return_value.stage_block.assert_not_called()
+
+
+def test_blob_client__copy__blocks(client, service, checkpoints, tmp_path):
+    src_file = tmp_path / "file.txt"
+    src_file.write_bytes(b"foobarbazqu")
+    dst_url = f"{ACCOUNT_URL}/container/file.txt"
+    blob_client = service.return_value.get_blob_client.return_value
+    block_ids = [_block_id(0, b"foob"), _block_id(1, b"arba"), _block_id(2, b"zqu")]
+
+    with PopenMock.patch() as mock:
+        mock.side_effect = [PopenMock(), PopenMock()]
+
+        with client:
+            stats = client.copy(src_file, dst_url)
+
+    assert stats.hash == hashlib.md5(b"foobarbazqu").hexdigest().upper()
+    assert blob_client.stage_block.call_args_list == [
+        call(block_ids[0], b"foob", validate_content=True),
+        call(block_ids[1], b"arba", validate_content=True),
+        call(block_ids[2], b"zqu", validate_content=True),
+    ]
+    ((blocks,), _) = blob_client.commit_block_list.call_args
+    assert [block.id for block in blocks] == block_ids
+    blob_client.upload_blob.assert_not_called()
+    blob_client.get_block_list.assert_not_called()
+    # Blocks are forgotten once committed
+    stats = PartialStats.from_filepath(src_file)
+    assert checkpoints.get_staged_blocks(dst_url, stats) == set()
+
+
+def test_blob_client__copy__blocks__records_fast_digest(
+    client, service, checkpoints, tmp_path
+):
+    src_file = tmp_path / "file.txt"
+    src_file.write_bytes(b"foobarbazqu")
+
+    with HashCache(tmp_path / "cache.db", fast_digests=True) as cache:
+        client.set_hash_cache(cache)
+
+        with PopenMock.patch() as mock:
+            mock.side_effect = [PopenMock(), PopenMock()]
+
+            with client:
+                stats = client.copy(src_file, f"{ACCOUNT_URL}/container/file.txt")
+
+        assert cache.get_digest(src_file) == (stats, fast_digest(src_file))
+
+
+def test_blob_client__copy__blocks__resumed(client, service, checkpoints, tmp_path):
+    src_file = tmp_path / "file.txt"
+    src_file.write_bytes(b"foobarbazqu")
+    dst_url = f"{ACCOUNT_URL}/container/file.txt"
+    blob_client = service.return_value.get_blob_client.return_value
+    block_ids = [_block_id(0, b"foob"), _block_id(1, b"arba"), _block_id(2, b"zqu")]
+
+    stats = PartialStats.from_filepath(src_file)
+    checkpoints.add_staged_block(dst_url, stats, block_ids[0])
+    checkpoints.add_staged_block(dst_url, stats, block_ids[1])
+    # The second block is recorded, but was discarded by Azure
+    blob_client.get_block_list.return_value = ([], [MockBlobBlock(block_ids[0])])
+
+    with PopenMock.patch() as mock:
+        mock.side_effect = [PopenMock(), PopenMock()]
+
+        with client:
+            client.copy(src_file, dst_url)
+
+    assert blob_client.stage_block.call_args_list == [
+        call(block_ids[1], b"arba", validate_content=True),
+        call(block_ids[2], b"zqu", validate_content=True),
+    ]
+    ((blocks,), _) = blob_client.commit_block_list.call_args
+    assert [block.id for block in blocks] == block_ids
+
+
+def test_blob_client__copy__blocks__failure_is_checkpointed(
+    client, service, checkpoints, tmp_path
+):
+    src_file = tmp_path / "file.txt"
+    src_file.write_bytes(b"foobarbazqu")
+    dst_url = f"{ACCOUNT_URL}/container/file.txt"
+    blob_client = service.return_value.get_blob_client.return_value
+    blob_client.stage_block.side_effect = [None, HttpResponseError()]
+
+    with PopenMock.patch() as mock:
+        mock.side_effect = [PopenMock(), PopenMock()]
+
+        with client:
+            with pytest.raises(AZError):
+                client.copy(src_file, dst_url)
+
+    blob_client.commit_block_list.assert_not_called()
+    stats = PartialStats.from_filepath(src_file)
+    assert checkpoints.get_staged_blocks(dst_url, stats) == {_block_id(0, b"foob")}
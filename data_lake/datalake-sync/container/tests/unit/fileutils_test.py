@@ -1,4 +1,6 @@
 import errno
+import hashlib
+import os
 import signal
 import multiprocessing
 
@@ -9,14 +11,20 @@ import pytest
 
 from azsync.fileutils import (
     PartialStats,
+    _calculate_md5_hashes,
     calculate_md5_hashes,
     collect_files,
     collect_md5_hashes,
+    fast_digest,
+    hash_file,
     iglob_folder,
     init_worker_process,
     md5_hash,
+    md5_hash_and_digest,
     try_makedirs,
 )
+from azsync.hashcache import HashCache
+from azsync.metrics import TaskMetrics
 
 
 def _write_file(root, rel_path, text=""):
@@ -153,6 +161,46 @@ def test_md5_hash__non_empty_file__str(tmp_path):
     assert md5_hash(str(tmpfile)) == "3858F62230AC3C915F300C664312C63F"
 
 
+@pytest.mark.parametrize("use_mmap", (True, False))
+@pytest.mark.parametrize("block_size", (1, 4, 6, 7, 1024))
+def test_md5_hash__block_sizes(tmp_path, use_mmap, block_size):
+    tmpfile = tmp_path / "foobar.txt"
+    tmpfile.write_text("foobar")
+
+    value = md5_hash(tmpfile, block_size=block_size, use_mmap=use_mmap)
+    assert value == "3858F62230AC3C915F300C664312C63F"
+
+
+def test_md5_hash__invalid_block_size(tmp_path):
+    tmpfile = tmp_path / "foobar.txt"
+    tmpfile.write_text("foobar")
+
+    with pytest.raises(ValueError):
+        md5_hash(tmpfile, block_size=0)
+
+
+def test_hash_file__multiple_hashers(tmp_path):
+    tmpfile = tmp_path / "foobar.txt"
+    tmpfile.write_bytes(bytes(range(256)) * 17)
+    expected = [hashlib.md5(tmpfile.read_bytes()), hashlib.sha1(tmpfile.read_bytes())]
+
+    for use_mmap in (True, False):
+        hashers = [hashlib.md5(), hashlib.sha1()]
+        assert hash_file(tmpfile, hashers, block_size=1000, use_mmap=use_mmap) == 4352
+        assert [it.digest() for it in hashers] == [it.digest() for it in expected]
+
+
+def test_hash_file__mmap_not_supported(tmp_path):
+    tmpfile = tmp_path / "foobar.txt"
+    tmpfile.write_text("foobar")
+
+    with patch("mmap.mmap", autospec=True) as mock:
+        mock.side_effect = OSError(errno.ENODEV, "No such device")
+
+        assert md5_hash(tmpfile, block_size=2) == "3858F62230AC3C915F300C664312C63F"
+        assert mock.called
+
+
 def test_iglob_folder__empty_folder(tmp_path):
     assert iglob_folder(tmp_path, "*") == []
 
@@ -443,6 +491,21 @@ def test_calculate_md5_hashes__with_partial_cache(tmp_path):
         }
 
 
+def test_calculate_md5_hashes__metrics(tmp_path):
+    _write_file(tmp_path, "foobar.txt", "foobar")
+    cache = calculate_md5_hashes([tmp_path / "foobar.txt"])
+    _write_file(tmp_path, "zod.zip", "bar")
+
+    metrics = TaskMetrics("task", "url", tries=5)
+    calculate_md5_hashes(
+        [tmp_path / "foobar.txt", tmp_path / "zod.zip"], cache, metrics=metrics
+    )
+
+    assert metrics.files_cached == 1
+    assert metrics.files_hashed == 1
+    assert metrics.bytes_hashed == 3
+
+
 def test_calculate_md5_hashes__with_cache_missing_hash(tmp_path):
     filepaths = [tmp_path / "foobar.txt"]
     file_1_mtime = _write_file(tmp_path, "foobar.txt", "foobar")
@@ -470,6 +533,203 @@ def test_calculate_md5_hashes__timeout_in_hash_md5(tmp_path):
             calculate_md5_hashes([file_path])
 
 
+def test_calculate_md5_hashes__multiple_workers(tmp_path):
+    filepaths = []
+    expected = {}
+    for idx in range(10):
+        filepath = tmp_path / f"file_{idx}.txt"
+        mtime = _write_file(tmp_path, filepath.name, "foobar" * idx)
+
+        filepaths.append(filepath)
+        expected[filepath] = PartialStats(
+            hash=md5_hash(filepath), size=6 * idx, mtime=mtime
+        )
+
+    assert calculate_md5_hashes(filepaths, workers=4) == expected
+
+
+def test_calculate_md5_hashes__multiple_workers__timeout_in_hash_md5(tmp_path):
+    file_path = tmp_path / "foobar.txt"
+    file_path.touch()
+    (tmp_path / "zod.txt").touch()
+
+    with patch("azsync.fileutils.md5_hash", autospec=True) as hmock:
+        hmock.side_effect = multiprocessing.TimeoutError(file_path)
+
+        with pytest.raises(multiprocessing.TimeoutError, match=str(file_path)):
+            calculate_md5_hashes([file_path, tmp_path / "zod.txt"], workers=2)
+
+
+class _SynchronousPool:
+    def __init__(self):
+        self.hashed = []
+
+    def apply_async(self, func, args, callback, error_callback):
+        (filepath,) = args
+        self.hashed.append(filepath)
+        callback(func(filepath))
+
+
+def test_calculate_md5_hashes__largest_files_first(tmp_path):
+    filestats = {}
+    for name, size in (("a", 3), ("b", 10), ("c", 0), ("d", 7)):
+        filepath = tmp_path / name
+        filepath.write_bytes(b"x" * size)
+        filestats[filepath] = PartialStats.from_filepath(filepath)
+
+    pool = _SynchronousPool()
+    _calculate_md5_hashes(pool, filestats, cache={}, timeout=60, workers=2)
+
+    assert pool.hashed == [
+        tmp_path / "b",
+        tmp_path / "d",
+        tmp_path / "a",
+        tmp_path / "c",
+    ]
+
+
+def test_calculate_md5_hashes__cached_files_not_hashed(tmp_path):
+    filepath_1 = tmp_path / "a"
+    filepath_1.write_bytes(b"foobar")
+    filepath_2 = tmp_path / "b"
+    filepath_2.write_bytes(b"foo")
+
+    cached = PartialStats.from_filepath(filepath_1)
+    cached.hash = "dummy md5 hash"
+
+    filestats = {
+        filepath_1: PartialStats.from_filepath(filepath_1),
+        filepath_2: PartialStats.from_filepath(filepath_2),
+    }
+
+    pool = _SynchronousPool()
+    result = _calculate_md5_hashes(
+        pool, filestats, cache={filepath_1: cached}, timeout=60, workers=2
+    )
+
+    assert pool.hashed == [filepath_2]
+    assert result[filepath_1].hash == "dummy md5 hash"
+    assert result[filepath_2].hash == md5_hash(filepath_2)
+
+
+def test_collect_md5_hashes__with_hash_cache(tmp_path):
+    cache_path = tmp_path / "cache.db"
+    tmp_path = tmp_path / "root"
+    tmp_path.mkdir()
+
+    file_1_mtime = _write_file(tmp_path, "foobar.txt", "foobar")
+    file_2_mtime = _write_file(tmp_path, "zod.zip", "")
+
+    expected = {
+        (tmp_path / "foobar.txt"): PartialStats(
+            hash="3858F62230AC3C915F300C664312C63F",
+            size=6,
+            mtime=file_1_mtime,
+        ),
+        (tmp_path / "zod.zip"): PartialStats(
+            hash="D41D8CD98F00B204E9800998ECF8427E",
+            size=0,
+            mtime=file_2_mtime,
+        ),
+    }
+
+    with HashCache(cache_path) as hash_cache:
+        assert collect_md5_hashes(tmp_path / "foobar.txt", hash_cache=hash_cache)
+
+    with HashCache(cache_path) as hash_cache:
+        with patch("azsync.fileutils.md5_hash", autospec=True) as mock:
+            mock.return_value = "D41D8CD98F00B204E9800998ECF8427E"
+
+            assert collect_md5_hashes(tmp_path, hash_cache=hash_cache) == expected
+
+        # Newly calculated hashes are added to the cache
+        assert hash_cache.get(tmp_path / "zod.zip") == expected[tmp_path / "zod.zip"]
+
+
+def test_calculate_md5_hashes__with_outdated_hash_cache(tmp_path):
+    filepaths = [tmp_path / "foobar.txt"]
+    _write_file(tmp_path, "foobar.txt", "foo")
+
+    with HashCache(tmp_path / "cache.db") as hash_cache:
+        calculate_md5_hashes(filepaths, hash_cache=hash_cache)
+
+        os.utime(filepaths[0], (1, 1))
+        file_1_mtime = _write_file(tmp_path, "foobar.txt", "foobar")
+
+        assert calculate_md5_hashes(filepaths, hash_cache=hash_cache) == {
+            (tmp_path / "foobar.txt"): PartialStats(
+                hash="3858F62230AC3C915F300C664312C63F",
+                size=6,
+                mtime=file_1_mtime,
+            ),
+        }
+
+
+def test_calculate_md5_hashes__fast_digests__touched_file(tmp_path):
+    filepath = tmp_path / "foobar.txt"
+    _write_file(tmp_path, "foobar.txt", "foobar")
+
+    with HashCache(tmp_path / "cache.db", fast_digests=True) as hash_cache:
+        calculate_md5_hashes([filepath], hash_cache=hash_cache)
+        _, digest = hash_cache.get_digest(filepath)
+        assert digest == fast_digest(filepath)
+
+        os.utime(filepath, (1, 1))
+        filestats = {filepath: PartialStats.from_filepath(filepath)}
+
+        # The digest is re-calculated, but the MD5 hash is not
+        pool = _SynchronousPool()
+        with patch("azsync.fileutils.md5_hash_and_digest", autospec=True) as mock:
+            _calculate_md5_hashes(
+                pool, filestats, {}, timeout=60, workers=2, hash_cache=hash_cache
+            )
+
+        assert not mock.called
+        assert pool.hashed == [filepath]
+        assert filestats[filepath].hash == "3858F62230AC3C915F300C664312C63F"
+        assert hash_cache.get(filepath) == PartialStats(
+            hash="3858F62230AC3C915F300C664312C63F", size=6, mtime=1
+        )
+
+
+def test_calculate_md5_hashes__fast_digests__modified_file(tmp_path):
+    filepath = tmp_path / "foobar.txt"
+    _write_file(tmp_path, "foobar.txt", "foobaz")
+
+    with HashCache(tmp_path / "cache.db", fast_digests=True) as hash_cache:
+        calculate_md5_hashes([filepath], hash_cache=hash_cache)
+
+        os.utime(filepath, (1, 1))
+        _write_file(tmp_path, "foobar.txt", "foobar")
+        filestats = {filepath: PartialStats.from_filepath(filepath)}
+
+        pool = _SynchronousPool()
+        _calculate_md5_hashes(
+            pool, filestats, {}, timeout=60, workers=2, hash_cache=hash_cache
+        )
+
+        # The digest is calculated first, followed by the MD5 hash
+        assert pool.hashed == [filepath, filepath]
+        assert filestats[filepath].hash == "3858F62230AC3C915F300C664312C63F"
+        assert hash_cache.get_digest(filepath) == (
+            filestats[filepath],
+            fast_digest(filepath),
+        )
+
+
+def test_fast_digest(tmp_path):
+    _write_file(tmp_path, "foobar.txt", "foobar")
+    _write_file(tmp_path, "foobaz.txt", "foobaz")
+
+    digest = fast_digest(tmp_path / "foobar.txt")
+    assert digest.split(":")[0] in ("xxh3_128", "blake2b")
+    assert digest != fast_digest(tmp_path / "foobaz.txt")
+    assert md5_hash_and_digest(tmp_path / "foobar.txt") == (
+        "3858F62230AC3C915F300C664312C63F",
+        digest,
+    )
+
+
 def test_mkdir__dir_exists(tmp_path):
     assert not try_makedirs(tmp_path)
     assert not try_makedirs(str(tmp_path))
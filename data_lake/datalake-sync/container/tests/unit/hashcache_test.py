@@ -0,0 +1,188 @@
+import os
+import sqlite3
+import threading
+
+from unittest.mock import call, patch
+
+import pytest
+
+from azsync.fileutils import PartialStats
+from azsync.hashcache import HashCache
+
+
+def test_hash_cache__empty(tmp_path):
+    with HashCache(tmp_path / "cache.db") as cache:
+        assert cache.get(tmp_path / "foo") is None
+
+
+def test_hash_cache__creates_folder(tmp_path):
+    with HashCache(tmp_path / "foo" / "cache.db"):
+        pass
+
+    assert (tmp_path / "foo" / "cache.db").is_file()
+
+
+def test_hash_cache__set_and_get(tmp_path):
+    stats = PartialStats(hash="11235", size=7913, mtime=12345.6789)
+
+    with HashCache(tmp_path / "cache.db") as cache:
+        cache.set(tmp_path / "foo", stats)
+
+        assert cache.get(tmp_path / "foo") == stats
+        assert cache.get(str(tmp_path / "foo")) == stats
+        assert cache.get(tmp_path / "bar") is None
+
+
+def test_hash_cache__persistent(tmp_path):
+    stats = PartialStats(hash="11235", size=7913, mtime=12345.6789)
+
+    with HashCache(tmp_path / "cache.db") as cache:
+        cache.set(tmp_path / "foo", stats)
+
+    with HashCache(tmp_path / "cache.db") as cache:
+        assert cache.get(tmp_path / "foo") == stats
+
+
+def test_hash_cache__replace(tmp_path):
+    with HashCache(tmp_path / "cache.db") as cache:
+        cache.set("foo", PartialStats(hash="11235", size=7913, mtime=12345))
+        cache.set("foo", PartialStats(hash="54321", size=3197, mtime=54321))
+
+        assert cache.get("foo") == PartialStats(hash="54321", size=3197, mtime=54321)
+
+
+def test_hash_cache__set__partial_stats(tmp_path):
+    with HashCache(tmp_path / "cache.db") as cache:
+        with pytest.raises(ValueError):
+            cache.set("foo", PartialStats(size=7913, mtime=12345))
+        with pytest.raises(ValueError):
+            cache.set("foo", PartialStats(hash="11235", mtime=12345))
+        with pytest.raises(ValueError):
+            cache.set("foo", PartialStats(hash="11235", size=7913))
+
+
+def test_hash_cache__invalid_types(tmp_path):
+    with HashCache(tmp_path / "cache.db") as cache:
+        with pytest.raises(ValueError):
+            cache.get(None)
+        with pytest.raises(ValueError):
+            cache.set(None, PartialStats(hash="11235", size=7913, mtime=12345))
+        with pytest.raises(ValueError):
+            cache.set("foo", {"hash": "11235", "size": 7913, "mtime": 12345})
+
+
+def test_hash_cache__digest(tmp_path):
+    stats = PartialStats(hash="11235", size=7913, mtime=12345)
+
+    with HashCache(tmp_path / "cache.db", fast_digests=True) as cache:
+        assert cache.fast_digests
+        cache.set("foo", stats)
+        cache.set("bar", stats, digest="blake2b:abcdef")
+
+    with HashCache(tmp_path / "cache.db") as cache:
+        assert not cache.fast_digests
+        assert cache.get_digest("foo") is None
+        assert cache.get_digest("bar") == (stats, "blake2b:abcdef")
+        assert cache.get_digest("zod") is None
+
+        with pytest.raises(ValueError):
+            cache.set("foo", stats, digest=b"abcdef")
+
+
+def test_hash_cache__adds_digest_column(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / "cache.db"))
+    conn.execute(
+        "CREATE TABLE hashes ("
+        "  path TEXT PRIMARY KEY,"
+        "  size INTEGER NOT NULL,"
+        "  mtime REAL NOT NULL,"
+        "  hash TEXT NOT NULL"
+        ")"
+    )
+    conn.execute("INSERT INTO hashes VALUES ('foo', 7913, 12345, '11235')")
+    conn.commit()
+    conn.close()
+
+    stats = PartialStats(hash="11235", size=7913, mtime=12345)
+    with HashCache(tmp_path / "cache.db", fast_digests=True) as cache:
+        assert cache.get("foo") == stats
+        assert cache.get_digest("foo") is None
+
+        cache.set("foo", stats, digest="blake2b:abcdef")
+        assert cache.get_digest("foo") == (stats, "blake2b:abcdef")
+
+
+def test_hash_cache__evict_missing(tmp_path):
+    root = tmp_path / "root"
+    root.mkdir()
+    (root / "exists").touch()
+    other = tmp_path / "root_2"
+    stats = PartialStats(hash="11235", size=7913, mtime=12345)
+
+    with HashCache(tmp_path / "cache.db") as cache:
+        cache.set(root / "exists", stats)
+        cache.set(root / "missing", stats)
+        cache.set(other / "missing", stats)
+
+        assert cache.evict_missing(root) == 1
+
+        assert cache.get(root / "exists") == stats
+        assert cache.get(root / "missing") is None
+        # Files outside of root are not touched
+        assert cache.get(other / "missing") == stats
+
+    with HashCache(tmp_path / "cache.db") as cache:
+        assert cache.get(root / "missing") is None
+
+
+def test_hash_cache__evict_missing__nothing_to_evict(tmp_path):
+    with HashCache(tmp_path / "cache.db") as cache:
+        assert cache.evict_missing(tmp_path) == 0
+
+
+def test_hash_cache__evict_missing__removed_folder(tmp_path):
+    root = tmp_path / "root"
+    root.mkdir()
+    (root / "file").touch()
+
+    with HashCache(tmp_path / "cache.db") as cache:
+        cache.set(root / "file", PartialStats(hash="11235", size=0, mtime=12345))
+
+        os.unlink(root / "file")
+        os.rmdir(root)
+
+        assert cache.evict_missing(root) == 1
+
+
+def test_hash_cache__evict_missing__lists_each_folder_once(tmp_path):
+    root = tmp_path / "root"
+    (root / "sub").mkdir(parents=True)
+    stats = PartialStats(hash="11235", size=7913, mtime=12345)
+
+    with HashCache(tmp_path / "cache.db") as cache:
+        for filename in ("a", "b", "sub/c", "sub/d"):
+            (root / filename).touch()
+            cache.set(root / filename, stats)
+
+        os.unlink(root / "sub" / "d")
+
+        with patch("os.listdir", wraps=os.listdir) as listdir:
+            assert cache.evict_missing(root) == 1
+
+        assert sorted(listdir.call_args_list) == [
+            call(str(root)),
+            call(str(root / "sub")),
+        ]
+        assert cache.get(root / "sub" / "d") is None
+        assert cache.get(root / "sub" / "c") == stats
+
+
+def test_hash_cache__shared_between_threads(tmp_path):
+    stats = PartialStats(hash="11235", size=7913, mtime=12345.6789)
+
+    with HashCache(tmp_path / "cache.db") as cache:
+        thread = threading.Thread(target=cache.set, args=(tmp_path / "foo", stats))
+        thread.start()
+        thread.join()
+
+        assert cache.get(tmp_path / "foo") == stats
@@ -1,6 +1,8 @@
 import logging
 import uuid
 
+import pytest
+
 from azsync.logging import MemoryHandler
 
 
@@ -30,3 +32,109 @@ def test_log_content(caplog):
 
         finally:
             log.removeHandler(handler)
+
+
+def test_clear(caplog):
+    with caplog.at_level(logging.NOTSET):
+        handler = MemoryHandler()
+        log = logging.getLogger()
+        log.addHandler(handler)
+
+        try:
+            line_1 = str(uuid.uuid4())
+            log.error("%s", line_1)
+            handler.clear()
+            assert handler.max_level() == logging.NOTSET
+            assert handler.log_records() == []
+
+            line_2 = str(uuid.uuid4())
+            log.info("%s", line_2)
+            assert handler.max_level() == logging.INFO
+            assert line_1 not in handler.log_content()
+            assert line_2 in handler.log_content()
+        finally:
+            log.removeHandler(handler)
+
+
+def _make_record(level, msg):
+    return logging.LogRecord("azsync", level, __file__, 1, msg, None, None)
+
+
+def test_max_records__invalid_values():
+    with pytest.raises(ValueError):
+        MemoryHandler(max_records=0)
+
+
+def test_max_records__warnings_are_kept():
+    handler = MemoryHandler(max_records=2)
+    records = [
+        _make_record(logging.INFO, "info 1"),
+        _make_record(logging.WARNING, "warning 1"),
+        _make_record(logging.INFO, "info 2"),
+        _make_record(logging.ERROR, "error 1"),
+        _make_record(logging.INFO, "info 3"),
+    ]
+
+    for record in records:
+        handler.emit(record)
+
+    assert handler.max_level() == logging.ERROR
+    assert handler.log_records() == [records[1], records[3], records[4]]
+
+
+def test_max_records__spilled_records_are_logged_in_order(monkeypatch):
+    monkeypatch.setattr(MemoryHandler, "_spill_chunk_size", 3)
+
+    handler = MemoryHandler(max_records=2)
+    messages = []
+    for idx in range(20):
+        level = logging.WARNING if idx % 7 == 0 else logging.DEBUG
+        messages.append(f"message {idx:02}")
+        handler.emit(_make_record(level, messages[-1]))
+
+    assert len(handler.log_records()) == 5
+    assert handler._spill_chunks
+
+    content = handler.log_content()
+    assert [content.index(msg) for msg in messages] == sorted(
+        content.index(msg) for msg in messages
+    )
+
+    handler.clear()
+    assert handler.log_records() == []
+    assert messages[0] not in handler.log_content()
+
+
+def test_log_content__max_size(monkeypatch):
+    monkeypatch.setattr(MemoryHandler, "_spill_chunk_size", 3)
+
+    handler = MemoryHandler(max_records=2)
+    messages = []
+    for idx in range(20):
+        level = logging.ERROR if idx == 3 else logging.INFO
+        messages.append(f"message {idx:02}")
+        handler.emit(_make_record(level, messages[-1]))
+
+    full_content = handler.log_content()
+    # The size limit applies to the rows, not to the header and tail
+    overhead = len(MemoryHandler().log_content())
+    content = handler.log_content(max_size=(len(full_content) - overhead) // 2)
+    assert len(content) < len(full_content)
+
+    # The oldest messages are omitted, except for errors
+    kept = [msg for msg in messages if msg in content]
+    assert kept == ["message 03"] + messages[-len(kept) + 1 :]
+    assert len(kept) < len(messages)
+    # A note is added for each run of omitted messages
+    assert "3 older messages were omitted" in content
+    assert f"{len(messages) - len(kept) - 3} older messages were omitted" in content
+
+
+def test_log_content__max_size__errors_are_kept():
+    handler = MemoryHandler()
+    for idx in range(5):
+        handler.emit(_make_record(logging.ERROR, f"error {idx}"))
+
+    content = handler.log_content(max_size=0)
+    assert all(f"error {idx}" in content for idx in range(5))
+    assert "omitted" not in content
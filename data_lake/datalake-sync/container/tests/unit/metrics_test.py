@@ -0,0 +1,137 @@
+import json
+
+from unittest.mock import patch
+
+import pytest
+
+from azsync.metrics import MetricsReport, TaskMetrics
+
+
+def _new_metrics(task="CheckedSync('src', 'dst')", tries=5):
+    return TaskMetrics(task, "dst", tries)
+
+
+def test_task_metrics__kind():
+    assert _new_metrics().kind == "CheckedSync"
+
+
+def test_task_metrics__phases_are_summed():
+    metrics = _new_metrics()
+    with patch("time.monotonic", side_effect=[10, 12, 20, 25.5]):
+        with metrics.phase("hash"):
+            pass
+        with metrics.phase("hash"):
+            pass
+
+    assert metrics.seconds == {"hash": 7.5}
+
+
+def test_task_metrics__phase_timed_on_exception():
+    metrics = _new_metrics()
+    with patch("time.monotonic", side_effect=[10, 12]):
+        with pytest.raises(KeyError):
+            with metrics.phase("list"):
+                raise KeyError("foo")
+
+    assert metrics.seconds == {"list": 2}
+
+
+def test_task_metrics__retries():
+    metrics = _new_metrics(tries=5)
+    metrics.finish(3)
+    assert metrics.retries == 2
+    assert metrics.succeeded
+
+    metrics.finish(-1)
+    assert metrics.retries == 5
+    assert not metrics.succeeded
+
+
+def test_task_metrics__to_json():
+    metrics = _new_metrics()
+    metrics.seconds.update(hash=2.0, upload=4.0, list=3.0)
+    metrics.bytes_hashed = 8 * 1024 * 1024
+    metrics.add_uploaded(2, 2 * 1024 * 1024)
+    metrics.listings = 2
+
+    data = metrics.to_json()
+    assert data["hash_mb_per_sec"] == 4.0
+    assert data["upload_mb_per_sec"] == 0.5
+    assert data["listing_latency"] == 1.5
+    assert data["files_uploaded"] == 2
+
+
+def test_task_metrics__to_json__no_time_spent():
+    data = _new_metrics().to_json()
+
+    assert data["hash_mb_per_sec"] is None
+    assert data["upload_mb_per_sec"] is None
+    assert data["listing_latency"] is None
+
+
+def test_metrics_report__rejects_invalid_values():
+    with pytest.raises(ValueError):
+        MetricsReport("ngs").add({})
+
+
+def test_metrics_report__writes_json(tmp_path):
+    metrics = _new_metrics()
+    metrics.files_hashed = 3
+    metrics.finish(5)
+
+    with MetricsReport("ngs", json_file=tmp_path / "out" / "metrics.json") as report:
+        report.add(metrics)
+
+    data = json.loads((tmp_path / "out" / "metrics.json").read_text())
+    assert data["command"] == "ngs"
+    assert [task["files_hashed"] for task in data["tasks"]] == [3]
+    assert list(tmp_path.glob("out/.*")) == []
+
+
+def test_metrics_report__writes_prometheus(tmp_path):
+    metrics_1 = _new_metrics()
+    metrics_1.files_hashed = 3
+    metrics_1.finish(4)
+    metrics_2 = _new_metrics()
+    metrics_2.files_hashed = 2
+    metrics_2.finish(0)
+
+    with MetricsReport("ngs", prometheus_file=tmp_path / "azsync.prom") as report:
+        report.add(metrics_1)
+        report.add(metrics_2)
+
+    lines = (tmp_path / "azsync.prom").read_text().splitlines()
+    assert "# TYPE azsync_files gauge" in lines
+    assert 'azsync_files{command="ngs",task="CheckedSync",kind="hashed"} 5.0' in lines
+    assert 'azsync_retries{command="ngs",task="CheckedSync"} 6.0' in lines
+    assert (
+        'azsync_tasks{command="ngs",task="CheckedSync",status="failed"} 1.0' in lines
+    )
+    assert (
+        'azsync_tasks{command="ngs",task="CheckedSync",status="succeeded"} 1.0'
+        in lines
+    )
+
+
+def test_metrics_report__nothing_written_by_default(tmp_path):
+    with MetricsReport("ngs") as report:
+        report.add(_new_metrics())
+
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_metrics_report__flush(tmp_path):
+    metrics = _new_metrics()
+    metrics.files_hashed = 3
+
+    report = MetricsReport("ngs", json_file=tmp_path / "metrics.json")
+    report.add(metrics)
+    report.flush()
+
+    data = json.loads((tmp_path / "metrics.json").read_text())
+    assert [task["files_hashed"] for task in data["tasks"]] == [3]
+
+    # Tasks written by flush() are not written again
+    report.close()
+    data = json.loads((tmp_path / "metrics.json").read_text())
+    assert data["tasks"] == []
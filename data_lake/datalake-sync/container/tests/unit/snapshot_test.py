@@ -0,0 +1,171 @@
+import os
+
+from unittest.mock import patch
+
+import pytest
+
+from azsync.fileutils import PartialStats, collect_files
+from azsync.snapshot import TreeSnapshot
+
+
+def _write_file(path, text="", mtime=1000):
+    path.write_text(text)
+    os.utime(path, (mtime, mtime))
+
+    return PartialStats(size=len(text), mtime=mtime)
+
+
+def _age_folders(root, mtime=1000):
+    """Sets old mtimes, so that folders are not considered to be racily modified."""
+    for dirpath, _, _ in os.walk(root):
+        os.utime(dirpath, (mtime, mtime))
+
+
+@pytest.fixture
+def tree(tmp_path):
+    root = tmp_path / "root"
+    (root / "sub").mkdir(parents=True)
+
+    return root
+
+
+def test_tree_snapshot__creates_folder(tmp_path):
+    TreeSnapshot(tmp_path / "foo" / "tree.db")
+
+    assert (tmp_path / "foo" / "tree.db").is_file()
+
+
+def test_tree_snapshot__empty_folder(tmp_path, tree):
+    scan = TreeSnapshot(tmp_path / "tree.db").scan(tree)
+
+    assert scan.files == {}
+    assert scan.added == scan.changed == scan.removed == set()
+
+
+def test_tree_snapshot__matches_collect_files(tmp_path, tree):
+    _write_file(tree / "a", "foo")
+    _write_file(tree / "sub" / "b", "foobar")
+
+    snapshot = TreeSnapshot(tmp_path / "tree.db")
+    scan = snapshot.scan(tree)
+
+    assert scan.files == collect_files(tree)
+    assert scan.added == {tree / "a", tree / "sub" / "b"}
+    assert collect_files(tree, snapshot=snapshot) == collect_files(tree)
+
+
+def test_tree_snapshot__single_file(tmp_path, tree):
+    stats = _write_file(tree / "a", "foo")
+
+    scan = TreeSnapshot(tmp_path / "tree.db").scan(tree / "a")
+
+    assert scan.files == {tree / "a": stats}
+
+
+def test_tree_snapshot__path_not_found(tmp_path, tree):
+    with pytest.raises(FileNotFoundError):
+        TreeSnapshot(tmp_path / "tree.db").scan(tree / "missing")
+
+
+def test_tree_snapshot__newest_mtime(tmp_path, tree):
+    _write_file(tree / "sub" / "a", mtime=5000)
+    _age_folders(tree)
+
+    assert TreeSnapshot(tmp_path / "tree.db").scan(tree).newest_mtime == 5000
+
+
+def test_tree_snapshot__unchanged_folders_not_listed(tmp_path, tree):
+    stats = _write_file(tree / "sub" / "a", "foo")
+    _age_folders(tree)
+
+    snapshot = TreeSnapshot(tmp_path / "tree.db")
+    snapshot.scan(tree)
+
+    with patch("os.scandir", side_effect=AssertionError("folder listed")):
+        scan = snapshot.scan(tree)
+
+    assert scan.files == {tree / "sub" / "a": stats}
+    assert scan.added == scan.changed == scan.removed == set()
+
+
+def test_tree_snapshot__files_modified_in_place(tmp_path, tree):
+    _write_file(tree / "sub" / "a", "foo")
+    _age_folders(tree)
+
+    snapshot = TreeSnapshot(tmp_path / "tree.db")
+    snapshot.scan(tree)
+
+    # Writing to a file does not change the mtime of its folder
+    stats = _write_file(tree / "sub" / "a", "foobar", mtime=5000)
+    _age_folders(tree)
+
+    with patch("os.scandir", side_effect=AssertionError("folder listed")):
+        scan = snapshot.scan(tree)
+
+    assert scan.files == {tree / "sub" / "a": stats}
+    assert scan.changed == {tree / "sub" / "a"}
+    assert scan.newest_mtime == 5000
+    # The updated stats are recorded in the snapshot
+    assert snapshot.scan(tree).changed == set()
+
+
+def test_tree_snapshot__changes(tmp_path, tree):
+    _write_file(tree / "changed", "foo")
+    _write_file(tree / "sub" / "removed", "foo")
+    _age_folders(tree)
+
+    snapshot = TreeSnapshot(tmp_path / "tree.db")
+    snapshot.scan(tree)
+
+    stats = _write_file(tree / "changed", "foobar")
+    _write_file(tree / "sub" / "added", "foo")
+    os.unlink(tree / "sub" / "removed")
+    # Modifying a file does not update its folder; only the sub-folder is unchanged
+    os.utime(tree, (2000, 2000))
+
+    scan = snapshot.scan(tree)
+
+    assert scan.added == {tree / "sub" / "added"}
+    assert scan.changed == {tree / "changed"}
+    assert scan.removed == {tree / "sub" / "removed"}
+    assert scan.files[tree / "changed"] == stats
+
+
+def test_tree_snapshot__removed_folder(tmp_path, tree):
+    _write_file(tree / "sub" / "a")
+    _age_folders(tree)
+
+    snapshot = TreeSnapshot(tmp_path / "tree.db")
+    snapshot.scan(tree)
+
+    os.unlink(tree / "sub" / "a")
+    os.rmdir(tree / "sub")
+
+    scan = snapshot.scan(tree)
+    assert scan.removed == {tree / "sub" / "a"}
+
+    # Re-creating the folder must not resurrect the old rows
+    (tree / "sub").mkdir()
+    _age_folders(tree, mtime=3000)
+
+    assert snapshot.scan(tree).files == {}
+
+
+def test_tree_snapshot__trees_are_independent(tmp_path, tree):
+    _write_file(tree / "a")
+    (tmp_path / "root_2").mkdir()
+
+    snapshot = TreeSnapshot(tmp_path / "tree.db")
+    snapshot.scan(tree)
+
+    assert snapshot.scan(tmp_path / "root_2").files == {}
+    assert snapshot.scan(tree).removed == set()
+
+
+def test_tree_snapshot__symlinked_folders_not_followed(tmp_path, tree):
+    _write_file(tree / "sub" / "a")
+    os.symlink(tree / "sub", tree / "link")
+
+    scan = TreeSnapshot(tmp_path / "tree.db").scan(tree)
+
+    assert set(scan.files) == {tree / "sub" / "a"}
@@ -0,0 +1,201 @@
+import json
+import sqlite3
+import threading
+
+import pytest
+
+from azsync.fileutils import PartialStats
+from azsync.state import PersistentState
+
+
+def test_state__new_state(tmp_path):
+    with PersistentState(tmp_path / "foo" / "state.db") as state:
+        assert list(state.get_ngs_runs()) == []
+        assert state.get_file_stats(tmp_path / "foo") is None
+
+    assert (tmp_path / "foo" / "state.db").is_file()
+
+
+def test_state__ngs_run(tmp_path):
+    with PersistentState(tmp_path / "state.db") as state:
+        run = state.get_ngs_run("run_1")
+        assert run.observed is not None
+        assert not run.is_synced
+
+        run.set_flag_synced()
+        run.set_data_synced()
+        run.set_sheet_synced()
+        assert run.is_synced
+
+    with PersistentState(tmp_path / "state.db") as state:
+        ((name, run),) = state.get_ngs_runs()
+        assert name == "run_1"
+        assert run.is_synced
+
+
+def test_state__run_objects_share_data(tmp_path):
+    with PersistentState(tmp_path / "state.db") as state:
+        run = state.get_ngs_run("run_1")
+        ((_, other),) = state.get_ngs_runs()
+
+        run.set_data_synced()
+        assert other.is_data_synced
+
+
+def test_state__run_kinds_are_separate(tmp_path):
+    with PersistentState(tmp_path / "state.db") as state:
+        state.get_proteomics_run("run_1").set_results_synced()
+        state.get_metabolomics_run("run_1")
+
+        assert list(state.get_ngs_runs()) == []
+        assert not state.get_proteomics_run("run_1").is_flag_synced
+        assert state.get_proteomics_run("run_1").are_results_synced
+
+
+def test_state__file_stats(tmp_path):
+    stats = PartialStats(hash="11235", size=7913, mtime=12345.6789)
+
+    with PersistentState(tmp_path / "state.db") as state:
+        state.set_file_stats(tmp_path / "foo", stats)
+        state.set_file_stats("bar", PartialStats(size=7913, mtime=12345))
+
+    with PersistentState(tmp_path / "state.db") as state:
+        assert state.get_file_stats(tmp_path / "foo") == stats
+        assert state.get_file_stats(str(tmp_path / "foo")) == stats
+        assert state.get_file_stats("bar") == PartialStats(size=7913, mtime=12345)
+
+
+def test_state__file_stats__invalid_types(tmp_path):
+    with PersistentState(tmp_path / "state.db") as state:
+        with pytest.raises(ValueError):
+            state.get_file_stats(None)
+        with pytest.raises(ValueError):
+            state.set_file_stats(None, PartialStats())
+        with pytest.raises(ValueError):
+            state.set_file_stats("foo", {"hash": "11235"})
+
+
+def test_state__uncommitted_changes_are_not_saved(tmp_path):
+    state = PersistentState(tmp_path / "state.db")
+    state.get_ngs_run("run_1")
+    state.set_file_stats("foo", PartialStats(size=1, mtime=2))
+
+    # Reading from another connection only sees committed changes
+    with PersistentState(tmp_path / "state.db") as other:
+        assert list(other.get_ngs_runs()) == []
+        assert other.get_file_stats("foo") is None
+
+    state.save()
+    with PersistentState(tmp_path / "state.db") as other:
+        assert [name for name, _ in other.get_ngs_runs()] == ["run_1"]
+
+    state.close()
+
+
+def test_state__uses_wal(tmp_path):
+    with PersistentState(tmp_path / "state.db"):
+        pass
+
+    conn = sqlite3.connect(str(tmp_path / "state.db"))
+    assert conn.execute("PRAGMA journal_mode").fetchone() == ("wal",)
+    conn.close()
+
+
+def test_state__migrate_json(tmp_path):
+    filepath = tmp_path / "state.db"
+    data = {
+        "ngs": {"run_1": {"observed": 1000, "flag": 2000}},
+        "proteomics": {"run_2": {"observed": 3000, "results": 4000}},
+        "metabolomics": {"run_3": {"observed": 5000}},
+        "stats": {"/foo/bar": {"hash": "11235", "size": 7913, "mtime": 12345}},
+    }
+    filepath.write_text(json.dumps(data))
+
+    with PersistentState(filepath) as state:
+        ((name, run),) = state.get_ngs_runs()
+        assert name == "run_1"
+        assert run.is_flag_synced
+        assert not run.is_data_synced
+        assert run.observed.timestamp() == 1000
+
+        assert state.get_proteomics_run("run_2").are_results_synced
+        assert state.get_metabolomics_run("run_3").observed.timestamp() == 5000
+        assert state.get_file_stats("/foo/bar") == PartialStats(
+            hash="11235", size=7913, mtime=12345
+        )
+
+    # The JSON state is kept as a backup and no temporary files remain
+    (backup,) = tmp_path.glob("state.db.[0-9]*")
+    assert json.loads(backup.read_text()) == data
+
+    # The converted state is used from now on
+    with PersistentState(filepath) as state:
+        assert [name for name, _ in state.get_ngs_runs()] == ["run_1"]
+
+    assert len(list(tmp_path.glob("state.db.[0-9]*"))) == 1
+
+
+def test_state__migrate_json__invalid_json(tmp_path):
+    filepath = tmp_path / "state.db"
+    filepath.write_text("{")
+
+    with pytest.raises(json.JSONDecodeError):
+        PersistentState(filepath)
+
+    assert filepath.read_text() == "{"
+
+
+def test_state__shared_between_threads(tmp_path):
+    stats = PartialStats(hash="11235", size=7913, mtime=12345.6789)
+
+    with PersistentState(tmp_path / "state.db") as state:
+        run = state.get_ngs_run("run_1")
+
+        thread = threading.Thread(target=run.set_data_synced)
+        thread.start()
+        thread.join()
+
+        thread = threading.Thread(target=state.set_file_stats, args=("foo", stats))
+        thread.start()
+        thread.join()
+
+        state.save()
+
+    with PersistentState(tmp_path / "state.db") as state:
+        assert state.get_ngs_run("run_1").is_data_synced
+        assert state.get_file_stats("foo") == stats
+
+
+def test_state__staged_blocks(tmp_path):
+    stats = PartialStats(size=7913, mtime=12345)
+
+    state = PersistentState(tmp_path / "state.db")
+    assert state.get_staged_blocks("url", stats) == set()
+
+    state.add_staged_block("url", stats, "block_1")
+    state.add_staged_block("url", stats, "block_2")
+    state.add_staged_block("other", stats, "block_3")
+
+    # Blocks are committed immediately, without waiting for save()
+    with PersistentState(tmp_path / "state.db") as other:
+        assert other.get_staged_blocks("url", stats) == {"block_1", "block_2"}
+
+        other.clear_staged_blocks("url")
+        assert other.get_staged_blocks("url", stats) == set()
+        assert other.get_staged_blocks("other", stats) == {"block_3"}
+
+    state.close()
+
+
+def test_state__staged_blocks__modified_file(tmp_path):
+    stats = PartialStats(size=7913, mtime=12345)
+    new_stats = PartialStats(size=7913, mtime=54321)
+
+    with PersistentState(tmp_path / "state.db") as state:
+        state.add_staged_block("url", stats, "block_1")
+        assert state.get_staged_blocks("url", new_stats) == set()
+
+        # Blocks staged for other versions of the file are discarded
+        state.add_staged_block("url", new_stats, "block_2")
+        assert state.get_staged_blocks("url", new_stats) == {"block_2"}
+        assert state.get_staged_blocks("url", stats) == set()
@@ -2,13 +2,15 @@ import multiprocessing
 import uuid
 
 from copy import deepcopy
-from unittest.mock import create_autospec, call, patch, Mock
+from unittest.mock import ANY, create_autospec, call, patch, Mock
 from pathlib import Path
 
 import pytest
 
 from azsync.azcopy import AZCopy, AZError, AZFileNotFoundError
+from azsync.blob import AZBlobClient
 from azsync.fileutils import PartialStats
+from azsync.metrics import MetricsReport
 from azsync.sync import (
     execute,
     CheckedCopy,
@@ -26,7 +28,12 @@ from .test_azcopy.common import Untouchable
 
 @pytest.fixture
 def client():
-    return create_autospec(AZCopy, instance=True)
+    client = create_autospec(AZCopy, instance=True)
+    client.copy_many.return_value = set()
+    client.hashes_uploads = False
+    client.verifies_uploads = False
+
+    return client
 
 
 @pytest.fixture
@@ -43,8 +50,12 @@ class ListMD5sWrapper:
     def __init__(self, out_values):
         self._out_iter = iter(out_values)
 
-    def __call__(self, dst_url):
-        return next(self._out_iter)
+    def __call__(self, dst_url, paths=None):
+        result = next(self._out_iter)
+        if paths is not None:
+            result = {key: value for key, value in result.items() if key in paths}
+
+        return result
 
 
 def mock_list_md5s(*args):
@@ -165,7 +176,15 @@ def test_checked_sync__terminates_if_collect_md5s_fails(client, source, destinat
         assert sync.execute(client) <= 0
         assert client.mock_calls == [
             call.sync(source, destination, rm_dst=False),
-            call.collect_md5_hashes__(source, cache={}, timeout=10 * 60),
+            call.collect_md5_hashes__(
+                source,
+                cache={},
+                timeout=10 * 60,
+                workers=1,
+                hash_cache=None,
+                snapshot=None,
+                metrics=ANY,
+            ),
         ]
 
 
@@ -185,7 +204,15 @@ def test_checked_sync__no_files__terminates_if_collect_md5s_fails(
 
         assert client.mock_calls == [
             call.sync(source, destination, rm_dst=False),
-            call.collect_md5_hashes__(source, cache={}, timeout=10 * 60),
+            call.collect_md5_hashes__(
+                source,
+                cache={},
+                timeout=10 * 60,
+                workers=1,
+                hash_cache=None,
+                snapshot=None,
+                metrics=ANY,
+            ),
             call.list_md5s(dst_url=destination),
         ]
 
@@ -202,7 +229,15 @@ def test_checked_sync__no_files__all_ok(client, source, destination):
         assert sync.execute(client) == TRIES
         assert client.mock_calls == [
             call.sync(source, destination, rm_dst=False),
-            call.collect_md5_hashes__(source, cache={}, timeout=10 * 60),
+            call.collect_md5_hashes__(
+                source,
+                cache={},
+                timeout=10 * 60,
+                workers=1,
+                hash_cache=None,
+                snapshot=None,
+                metrics=ANY,
+            ),
             call.list_md5s(dst_url=destination),
         ]
 
@@ -231,7 +266,15 @@ def test_checked_sync__matching_files(client, source, destination):
         assert sync.execute(client) == TRIES
         assert client.mock_calls == [
             call.sync(source, destination, rm_dst=False),
-            call.collect_md5_hashes__(source, cache={}, timeout=10 * 60),
+            call.collect_md5_hashes__(
+                source,
+                cache={},
+                timeout=10 * 60,
+                workers=1,
+                hash_cache=None,
+                snapshot=None,
+                metrics=ANY,
+            ),
             call.list_md5s(dst_url=destination),
         ]
 
@@ -263,11 +306,65 @@ def test_checked_sync__local_has_extra_files(client, source, destination):
         assert sync.execute(client) == TRIES - 1
         assert client.mock_calls == [
             call.sync(source, destination, rm_dst=False),
-            call.collect_md5_hashes__(source, cache={}, timeout=10 * 60),
+            call.collect_md5_hashes__(
+                source,
+                cache={},
+                timeout=10 * 60,
+                workers=1,
+                hash_cache=None,
+                snapshot=None,
+                metrics=ANY,
+            ),
             call.list_md5s(dst_url=destination),
             call.sync(source, destination, rm_dst=False),
-            call.collect_md5_hashes__(source, cache=dict(local_files), timeout=10 * 60),
-            call.list_md5s(dst_url=destination),
+            call.collect_md5_hashes__(
+                source,
+                cache=dict(local_files),
+                timeout=10 * 60,
+                workers=1,
+                hash_cache=None,
+                snapshot=None,
+                metrics=ANY,
+            ),
+            call.list_md5s(dst_url=destination, paths={Path("foo/bar")}),
+        ]
+
+
+def test_checked_sync__files_modified_locally_are_looked_up(
+    client, source, destination
+):
+    local_files_1 = {
+        (Path(source) / "foo/bar"): PartialStats(hash="1234", size=1234),
+        (Path(source) / "zod"): PartialStats(hash="4321", size=17),
+        (Path(source) / "xyz"): PartialStats(hash="5678", size=8),
+    }
+    local_files_2 = dict(local_files_1)
+    local_files_2[Path(source) / "xyz"] = PartialStats(hash="8765", size=9)
+
+    remote_files = [
+        {
+            Path("zod"): PartialStats(hash="4321", size=17),
+            Path("xyz"): PartialStats(hash="5678", size=8),
+        },
+        {
+            Path("foo/bar"): PartialStats(hash="1234", size=1234),
+            Path("zod"): Untouchable(),
+            Path("xyz"): PartialStats(hash="8765", size=9),
+        },
+    ]
+
+    with patch("azsync.sync.collect_md5_hashes", autospec=True) as mock:
+        # Attaching the mock ensures that it shows up in 'mock_calls'
+        client.attach_mock(mock, "collect_md5_hashes__")
+
+        mock.side_effect = [dict(local_files_1), dict(local_files_2)]
+        client.list_md5s = mock_list_md5s(remote_files)
+
+        sync = CheckedSync(source, destination)
+        assert sync.execute(client) == TRIES - 1
+        assert client.list_md5s.mock_calls == [
+            call(dst_url=destination),
+            call(dst_url=destination, paths={Path("foo/bar"), Path("xyz")}),
         ]
 
 
@@ -297,11 +394,27 @@ def test_checked_sync__remote_has_extra_files__rm_dst(client, source, destinatio
         assert sync.execute(client) == TRIES - 1
         assert client.mock_calls == [
             call.sync(source, destination, rm_dst=True),
-            call.collect_md5_hashes__(source, cache={}, timeout=10 * 60),
+            call.collect_md5_hashes__(
+                source,
+                cache={},
+                timeout=10 * 60,
+                workers=1,
+                hash_cache=None,
+                snapshot=None,
+                metrics=ANY,
+            ),
             call.list_md5s(dst_url=destination),
             call.sync(source, destination, rm_dst=True),
-            call.collect_md5_hashes__(source, cache=dict(local_files), timeout=10 * 60),
-            call.list_md5s(dst_url=destination),
+            call.collect_md5_hashes__(
+                source,
+                cache=dict(local_files),
+                timeout=10 * 60,
+                workers=1,
+                hash_cache=None,
+                snapshot=None,
+                metrics=ANY,
+            ),
+            call.list_md5s(dst_url=destination, paths={Path("foo/bar")}),
         ]
 
 
@@ -326,7 +439,15 @@ def test_checked_sync__remote_has_extra_files__no_rm_dst(client, source, destina
         assert sync.execute(client) == TRIES
         assert client.mock_calls == [
             call.sync(source, destination, rm_dst=False),
-            call.collect_md5_hashes__(source, cache={}, timeout=10 * 60),
+            call.collect_md5_hashes__(
+                source,
+                cache={},
+                timeout=10 * 60,
+                workers=1,
+                hash_cache=None,
+                snapshot=None,
+                metrics=ANY,
+            ),
             call.list_md5s(dst_url=destination),
         ]
 
@@ -359,12 +480,28 @@ def test_checked_sync__mismatching_file_size_on_remote(client, source, destinati
         assert sync.execute(client) == TRIES - 1
         assert client.mock_calls == [
             call.sync(source, destination, rm_dst=False),
-            call.collect_md5_hashes__(source, cache={}, timeout=10 * 60),
+            call.collect_md5_hashes__(
+                source,
+                cache={},
+                timeout=10 * 60,
+                workers=1,
+                hash_cache=None,
+                snapshot=None,
+                metrics=ANY,
+            ),
             call.list_md5s(dst_url=destination),
             call.remove(dst_url=urljoin(destination, "zod")),
             call.sync(source, destination, rm_dst=False),
-            call.collect_md5_hashes__(source, cache=dict(local_files), timeout=10 * 60),
-            call.list_md5s(dst_url=destination),
+            call.collect_md5_hashes__(
+                source,
+                cache=dict(local_files),
+                timeout=10 * 60,
+                workers=1,
+                hash_cache=None,
+                snapshot=None,
+                metrics=ANY,
+            ),
+            call.list_md5s(dst_url=destination, paths={Path("zod")}),
         ]
 
 
@@ -396,12 +533,28 @@ def test_checked_sync__mismatching_file_hash_on_remote(client, source, destinati
         assert sync.execute(client) == TRIES - 1
         assert client.mock_calls == [
             call.sync(source, destination, rm_dst=False),
-            call.collect_md5_hashes__(source, cache={}, timeout=10 * 60),
+            call.collect_md5_hashes__(
+                source,
+                cache={},
+                timeout=10 * 60,
+                workers=1,
+                hash_cache=None,
+                snapshot=None,
+                metrics=ANY,
+            ),
             call.list_md5s(dst_url=destination),
             call.remove(dst_url=urljoin(destination, "foo/bar")),
             call.sync(source, destination, rm_dst=False),
-            call.collect_md5_hashes__(source, cache=dict(local_files), timeout=10 * 60),
-            call.list_md5s(dst_url=destination),
+            call.collect_md5_hashes__(
+                source,
+                cache=dict(local_files),
+                timeout=10 * 60,
+                workers=1,
+                hash_cache=None,
+                snapshot=None,
+                metrics=ANY,
+            ),
+            call.list_md5s(dst_url=destination, paths={Path("foo/bar")}),
         ]
 
 
@@ -425,7 +578,15 @@ def test_checked_sync__mismatching_file_hash_on_remote__remove_fails(
 
         assert client.mock_calls == [
             call.sync(source, destination, rm_dst=False),
-            call.collect_md5_hashes__(source, cache={}, timeout=10 * 60),
+            call.collect_md5_hashes__(
+                source,
+                cache={},
+                timeout=10 * 60,
+                workers=1,
+                hash_cache=None,
+                snapshot=None,
+                metrics=ANY,
+            ),
             call.list_md5s(dst_url=destination),
             call.remove(dst_url=urljoin(destination, "zod")),
         ]
@@ -450,12 +611,28 @@ def test_checked_sync__remove_escapes_filenames(client, source, destination):
         assert sync.execute(client) == TRIES - 1
         assert client.mock_calls == [
             call.sync(source, destination, rm_dst=False),
-            call.collect_md5_hashes__(source, cache={}, timeout=10 * 60),
+            call.collect_md5_hashes__(
+                source,
+                cache={},
+                timeout=10 * 60,
+                workers=1,
+                hash_cache=None,
+                snapshot=None,
+                metrics=ANY,
+            ),
             call.list_md5s(dst_url=destination),
             call.remove(dst_url=urljoin(destination, "foo/bar%3F")),
             call.sync(source, destination, rm_dst=False),
-            call.collect_md5_hashes__(source, cache=dict(local_files), timeout=10 * 60),
-            call.list_md5s(dst_url=destination),
+            call.collect_md5_hashes__(
+                source,
+                cache=dict(local_files),
+                timeout=10 * 60,
+                workers=1,
+                hash_cache=None,
+                snapshot=None,
+                metrics=ANY,
+            ),
+            call.list_md5s(dst_url=destination, paths={Path("foo/bar?")}),
         ]
 
 
@@ -495,7 +672,7 @@ def test_checked_copy__terminates_if_collect_md5s_fails_1(client, source, destin
         copy = CheckedCopy(source, destination)
         assert copy.execute(client) <= 0
         assert client.mock_calls == [
-            call.collect_md5_hashes__(source, cache={}, timeout=10 * 60),
+            call.collect_md5_hashes__(source, cache={}, timeout=10 * 60, metrics=ANY),
         ]
 
 
@@ -509,7 +686,7 @@ def test_checked_copy__terminates_if_collect_md5s_fails_2(client, source, destin
         copy = CheckedCopy(source, destination)
         assert copy.execute(client) == 0
         assert client.mock_calls == [
-            call.collect_md5_hashes__(source, cache={}, timeout=10 * 60),
+            call.collect_md5_hashes__(source, cache={}, timeout=10 * 60, metrics=ANY),
         ]
 
 
@@ -542,10 +719,12 @@ def test_checked_copy__terminates_if_get_md5_fails__loop(client, source, destina
             copy.execute(client)
 
         assert client.mock_calls == [
-            call.collect_md5_hashes__(source, cache={}, timeout=10 * 60),
+            call.collect_md5_hashes__(source, cache={}, timeout=10 * 60, metrics=ANY),
             call.get_md5(dst_url=destination),
             call.copy(source, destination),
-            call.collect_md5_hashes__(source, cache=mock.return_value, timeout=10 * 60),
+            call.collect_md5_hashes__(
+                source, cache=mock.return_value, timeout=10 * 60, metrics=ANY
+            ),
             call.get_md5(dst_url=destination),
         ]
 
@@ -564,7 +743,7 @@ def test_checked_copy__terminates_if_copy_fails(client, source, destination):
             copy.execute(client)
 
         assert client.mock_calls == [
-            call.collect_md5_hashes__(source, cache={}, timeout=10 * 60),
+            call.collect_md5_hashes__(source, cache={}, timeout=10 * 60, metrics=ANY),
             call.get_md5(dst_url=destination),
             call.copy(source, destination),
         ]
@@ -581,7 +760,7 @@ def test_checked_copy__matching_files__files_on_server(client, source, destinati
         copy = CheckedCopy(source, destination)
         assert copy.execute(client) == TRIES
         assert client.mock_calls == [
-            call.collect_md5_hashes__(source, cache={}, timeout=10 * 60),
+            call.collect_md5_hashes__(source, cache={}, timeout=10 * 60, metrics=ANY),
             call.get_md5(dst_url=destination),
         ]
 
@@ -602,10 +781,12 @@ def test_checked_copy__matching_files__no_files_on_server(client, source, destin
         copy = CheckedCopy(source, destination)
         assert copy.execute(client) == TRIES
         assert client.mock_calls == [
-            call.collect_md5_hashes__(source, cache={}, timeout=10 * 60),
+            call.collect_md5_hashes__(source, cache={}, timeout=10 * 60, metrics=ANY),
             call.get_md5(dst_url=destination),
             call.copy(source, destination),
-            call.collect_md5_hashes__(source, cache=hashes, timeout=10 * 60),
+            call.collect_md5_hashes__(
+                source, cache=hashes, timeout=10 * 60, metrics=ANY
+            ),
             call.get_md5(dst_url=destination),
         ]
 
@@ -621,7 +802,7 @@ def test_checked_copy__matching_files__diff_filenames(client, source, destinatio
         copy = CheckedCopy(source, destination)
         assert copy.execute(client) == TRIES
         assert client.mock_calls == [
-            call.collect_md5_hashes__(source, cache={}, timeout=10 * 60),
+            call.collect_md5_hashes__(source, cache={}, timeout=10 * 60, metrics=ANY),
             call.get_md5(dst_url=destination),
         ]
 
@@ -640,10 +821,12 @@ def test_checked_copy__mismatching_file_size_on_remote(client, source, destinati
         copy = CheckedCopy(source, destination)
         assert copy.execute(client) == TRIES
         assert client.mock_calls == [
-            call.collect_md5_hashes__(source, cache={}, timeout=10 * 60),
+            call.collect_md5_hashes__(source, cache={}, timeout=10 * 60, metrics=ANY),
             call.get_md5(dst_url=destination),
             call.copy(source, destination),
-            call.collect_md5_hashes__(source, cache=mock.return_value, timeout=10 * 60),
+            call.collect_md5_hashes__(
+                source, cache=mock.return_value, timeout=10 * 60, metrics=ANY
+            ),
             call.get_md5(dst_url=destination),
         ]
 
@@ -665,13 +848,17 @@ def test_checked_copy__mismatching_file_size_on_remote__after_copy(
         copy = CheckedCopy(source, destination)
         assert copy.execute(client) == TRIES - 1
         assert client.mock_calls == [
-            call.collect_md5_hashes__(source, cache={}, timeout=10 * 60),
+            call.collect_md5_hashes__(source, cache={}, timeout=10 * 60, metrics=ANY),
             call.get_md5(dst_url=destination),
             call.copy(source, destination),
-            call.collect_md5_hashes__(source, cache=mock.return_value, timeout=10 * 60),
+            call.collect_md5_hashes__(
+                source, cache=mock.return_value, timeout=10 * 60, metrics=ANY
+            ),
             call.get_md5(dst_url=destination),
             call.copy(source, destination),
-            call.collect_md5_hashes__(source, cache=mock.return_value, timeout=10 * 60),
+            call.collect_md5_hashes__(
+                source, cache=mock.return_value, timeout=10 * 60, metrics=ANY
+            ),
             call.get_md5(dst_url=destination),
         ]
 
@@ -690,10 +877,12 @@ def test_checked_copy__mismatching_file_hash_on_remote(client, source, destinati
         copy = CheckedCopy(source, destination)
         assert copy.execute(client) == TRIES
         assert client.mock_calls == [
-            call.collect_md5_hashes__(source, cache={}, timeout=10 * 60),
+            call.collect_md5_hashes__(source, cache={}, timeout=10 * 60, metrics=ANY),
             call.get_md5(dst_url=destination),
             call.copy(source, destination),
-            call.collect_md5_hashes__(source, cache=mock.return_value, timeout=10 * 60),
+            call.collect_md5_hashes__(
+                source, cache=mock.return_value, timeout=10 * 60, metrics=ANY
+            ),
             call.get_md5(dst_url=destination),
         ]
 
@@ -715,13 +904,17 @@ def test_checked_copy__mismatching_file_hash_on_remote__after_copy(
         copy = CheckedCopy(source, destination)
         assert copy.execute(client) == TRIES - 1
         assert client.mock_calls == [
-            call.collect_md5_hashes__(source, cache={}, timeout=10 * 60),
+            call.collect_md5_hashes__(source, cache={}, timeout=10 * 60, metrics=ANY),
             call.get_md5(dst_url=destination),
             call.copy(source, destination),
-            call.collect_md5_hashes__(source, cache=mock.return_value, timeout=10 * 60),
+            call.collect_md5_hashes__(
+                source, cache=mock.return_value, timeout=10 * 60, metrics=ANY
+            ),
             call.get_md5(dst_url=destination),
             call.copy(source, destination),
-            call.collect_md5_hashes__(source, cache=mock.return_value, timeout=10 * 60),
+            call.collect_md5_hashes__(
+                source, cache=mock.return_value, timeout=10 * 60, metrics=ANY
+            ),
             call.get_md5(dst_url=destination),
         ]
 
@@ -744,13 +937,17 @@ def test_checked_copy__local_file_changed_after_copy(client, source, destination
         copy = CheckedCopy(source, destination)
         assert copy.execute(client) == TRIES - 1
         assert client.mock_calls == [
-            call.collect_md5_hashes__(source, cache={}, timeout=10 * 60),
+            call.collect_md5_hashes__(source, cache={}, timeout=10 * 60, metrics=ANY),
             call.get_md5(dst_url=destination),
             call.copy(source, destination),
-            call.collect_md5_hashes__(source, cache=local_files_1, timeout=10 * 60),
+            call.collect_md5_hashes__(
+                source, cache=local_files_1, timeout=10 * 60, metrics=ANY
+            ),
             call.get_md5(dst_url=destination),
             call.copy(source, destination),
-            call.collect_md5_hashes__(source, cache=local_files_2, timeout=10 * 60),
+            call.collect_md5_hashes__(
+                source, cache=local_files_2, timeout=10 * 60, metrics=ANY
+            ),
             call.get_md5(dst_url=destination),
         ]
 
@@ -801,6 +998,9 @@ def test_checked_multi_copy__terminates_if_collect_md5s_fails_1(
                 filepaths=[Path(source)],
                 timeout=10 * 60,
                 cache=None,
+                workers=1,
+                hash_cache=None,
+                metrics=ANY,
             ),
         ]
 
@@ -823,6 +1023,9 @@ def test_checked_multi_copy__terminates_if_collect_md5s_fails_2(
                 filepaths=[Path(source)],
                 timeout=10 * 60,
                 cache=None,
+                workers=1,
+                hash_cache=None,
+                metrics=ANY,
             ),
             call.list_md5s(destination),
         ]
@@ -845,6 +1048,9 @@ def test_checked_multi_copy__terminates_if_list_md5s_fails(client, source, desti
                 filepaths=[Path(source)],
                 timeout=10 * 60,
                 cache=None,
+                workers=1,
+                hash_cache=None,
+                metrics=ANY,
             ),
             call.list_md5s(destination),
         ]
@@ -855,7 +1061,7 @@ def test_checked_multi_copy__terminates_if_copy_fails(client, source, destinatio
         # Attaching the mock ensures that it shows up in 'mock_calls'
         client.attach_mock(mock, "calculate_md5_hashes__")
         client.list_md5s.return_value = {}
-        client.copy.side_effect = AZError("xyz")
+        client.copy_many.side_effect = AZError("xyz")
 
         mock.return_value = {Path(source): Untouchable()}
 
@@ -868,9 +1074,12 @@ def test_checked_multi_copy__terminates_if_copy_fails(client, source, destinatio
                 filepaths=[Path(source)],
                 timeout=10 * 60,
                 cache=None,
+                workers=1,
+                hash_cache=None,
+                metrics=ANY,
             ),
             call.list_md5s(destination),
-            call.copy(Path(source), urljoin(destination, "foo")),
+            call.copy_many({Path("foo"): Path(source)}, destination),
         ]
 
 
@@ -889,6 +1098,9 @@ def test_checked_multi_copy__empty_file_lists(client, source, destination):
                 filepaths=[],
                 timeout=10 * 60,
                 cache=None,
+                workers=1,
+                hash_cache=None,
+                metrics=ANY,
             ),
             call.list_md5s(destination),
         ]
@@ -911,6 +1123,9 @@ def test_checked_multi_copy__matching_files_on_server(client, source, destinatio
                 filepaths=[Path(source)],
                 timeout=10 * 60,
                 cache=None,
+                workers=1,
+                hash_cache=None,
+                metrics=ANY,
             ),
             call.list_md5s(destination),
         ]
@@ -945,14 +1160,25 @@ def test_checked_multi_copy__no_files_on_server(client, destination):
                 filepaths=[Path("/foo/bar"), Path("/test/other")],
                 timeout=10 * 60,
                 cache=None,
+                workers=1,
+                hash_cache=None,
+                metrics=ANY,
             ),
             call.list_md5s(destination),
-            call.copy(Path("/test/other"), urljoin(destination, "dir/file_2")),
-            call.copy(Path("/foo/bar"), urljoin(destination, "file_1")),
+            call.copy_many(
+                {
+                    Path("dir/file_2"): Path("/test/other"),
+                    Path("file_1"): Path("/foo/bar"),
+                },
+                destination,
+            ),
             call.calculate_md5_hashes__(
                 filepaths=[Path("/foo/bar"), Path("/test/other")],
                 timeout=10 * 60,
                 cache=local_files,
+                workers=1,
+                hash_cache=None,
+                metrics=ANY,
             ),
             call.list_md5s(destination),
         ]
@@ -992,14 +1218,25 @@ def test_checked_multi_copy__other_files_on_server(client, destination):
                 filepaths=[Path("/foo/bar"), Path("/test/other")],
                 timeout=10 * 60,
                 cache=None,
+                workers=1,
+                hash_cache=None,
+                metrics=ANY,
             ),
             call.list_md5s(destination),
-            call.copy(Path("/test/other"), urljoin(destination, "dir/file_2")),
-            call.copy(Path("/foo/bar"), urljoin(destination, "file_1")),
+            call.copy_many(
+                {
+                    Path("dir/file_2"): Path("/test/other"),
+                    Path("file_1"): Path("/foo/bar"),
+                },
+                destination,
+            ),
             call.calculate_md5_hashes__(
                 filepaths=[Path("/foo/bar"), Path("/test/other")],
                 timeout=10 * 60,
                 cache=local_files,
+                workers=1,
+                hash_cache=None,
+                metrics=ANY,
             ),
             call.list_md5s(destination),
         ]
@@ -1037,13 +1274,19 @@ def test_checked_multi_copy__mismatching_file_on_server(client, destination):
                 filepaths=[Path("/foo/bar"), Path("/test/other")],
                 timeout=10 * 60,
                 cache=None,
+                workers=1,
+                hash_cache=None,
+                metrics=ANY,
             ),
             call.list_md5s(destination),
-            call.copy(Path("/test/other"), urljoin(destination, "dir/file_2")),
+            call.copy_many({Path("dir/file_2"): Path("/test/other")}, destination),
             call.calculate_md5_hashes__(
                 filepaths=[Path("/foo/bar"), Path("/test/other")],
                 timeout=10 * 60,
                 cache=local_files,
+                workers=1,
+                hash_cache=None,
+                metrics=ANY,
             ),
             call.list_md5s(destination),
         ]
@@ -1082,21 +1325,35 @@ def test_checked_multi_copy__mismatching_remote_file_after_copy(client, destinat
                 filepaths=[Path("/foo/bar"), Path("/test/other")],
                 timeout=10 * 60,
                 cache=None,
+                workers=1,
+                hash_cache=None,
+                metrics=ANY,
             ),
             call.list_md5s(destination),
-            call.copy(Path("/test/other"), urljoin(destination, "dir/file_2")),
-            call.copy(Path("/foo/bar"), urljoin(destination, "file_1")),
+            call.copy_many(
+                {
+                    Path("dir/file_2"): Path("/test/other"),
+                    Path("file_1"): Path("/foo/bar"),
+                },
+                destination,
+            ),
             call.calculate_md5_hashes__(
                 filepaths=[Path("/foo/bar"), Path("/test/other")],
                 timeout=10 * 60,
                 cache=local_files,
+                workers=1,
+                hash_cache=None,
+                metrics=ANY,
             ),
             call.list_md5s(destination),
-            call.copy(Path("/foo/bar"), urljoin(destination, "file_1")),
+            call.copy_many({Path("file_1"): Path("/foo/bar")}, destination),
             call.calculate_md5_hashes__(
                 filepaths=[Path("/foo/bar"), Path("/test/other")],
                 timeout=10 * 60,
                 cache=local_files,
+                workers=1,
+                hash_cache=None,
+                metrics=ANY,
             ),
             call.list_md5s(destination),
         ]
@@ -1140,21 +1397,35 @@ def test_checked_multi_copy__mismatching_local_file_after_copy(client, destinati
                 filepaths=[Path("/foo/bar"), Path("/test/other")],
                 timeout=10 * 60,
                 cache=None,
+                workers=1,
+                hash_cache=None,
+                metrics=ANY,
             ),
             call.list_md5s(destination),
-            call.copy(Path("/test/other"), urljoin(destination, "dir/file_2")),
-            call.copy(Path("/foo/bar"), urljoin(destination, "file_1")),
+            call.copy_many(
+                {
+                    Path("dir/file_2"): Path("/test/other"),
+                    Path("file_1"): Path("/foo/bar"),
+                },
+                destination,
+            ),
             call.calculate_md5_hashes__(
                 filepaths=[Path("/foo/bar"), Path("/test/other")],
                 timeout=10 * 60,
                 cache=local_files_1,
+                workers=1,
+                hash_cache=None,
+                metrics=ANY,
             ),
             call.list_md5s(destination),
-            call.copy(Path("/foo/bar"), urljoin(destination, "file_1")),
+            call.copy_many({Path("file_1"): Path("/foo/bar")}, destination),
             call.calculate_md5_hashes__(
                 filepaths=[Path("/foo/bar"), Path("/test/other")],
                 timeout=10 * 60,
                 cache=local_files_2,
+                workers=1,
+                hash_cache=None,
+                metrics=ANY,
             ),
             call.list_md5s(destination),
         ]
@@ -1189,14 +1460,25 @@ def test_checked_multi_copy__abort_if_out_of_tries_after_copy(client, destinatio
                 filepaths=[Path("/foo/bar"), Path("/test/other")],
                 timeout=10 * 60,
                 cache=None,
+                workers=1,
+                hash_cache=None,
+                metrics=ANY,
             ),
             call.list_md5s(destination),
-            call.copy(Path("/test/other"), urljoin(destination, "dir/file_2")),
-            call.copy(Path("/foo/bar"), urljoin(destination, "file_1")),
+            call.copy_many(
+                {
+                    Path("dir/file_2"): Path("/test/other"),
+                    Path("file_1"): Path("/foo/bar"),
+                },
+                destination,
+            ),
             call.calculate_md5_hashes__(
                 filepaths=[Path("/foo/bar"), Path("/test/other")],
                 timeout=10 * 60,
                 cache=local_files,
+                workers=1,
+                hash_cache=None,
+                metrics=ANY,
             ),
             call.list_md5s(destination),
         ]
@@ -1231,14 +1513,25 @@ def test_checked_multi_copy__escape_characters_in_filenames(client, destination)
                 filepaths=[Path("/foo/bar"), Path("/test/other")],
                 timeout=10 * 60,
                 cache=None,
+                workers=1,
+                hash_cache=None,
+                metrics=ANY,
             ),
             call.list_md5s(destination),
-            call.copy(Path("/test/other"), urljoin(destination, "dir/file%3A2")),
-            call.copy(Path("/foo/bar"), urljoin(destination, "file_1%3F")),
+            call.copy_many(
+                {
+                    Path("dir/file:2"): Path("/test/other"),
+                    Path("file_1?"): Path("/foo/bar"),
+                },
+                destination,
+            ),
             call.calculate_md5_hashes__(
                 filepaths=[Path("/foo/bar"), Path("/test/other")],
                 timeout=10 * 60,
                 cache=local_files,
+                workers=1,
+                hash_cache=None,
+                metrics=ANY,
             ),
             call.list_md5s(destination),
         ]
@@ -1348,6 +1641,29 @@ def test_write__execute__binary_data(tmp_path, client, destination):
                 assert tmp_file.read_bytes() == data.encode("utf-8")
 
 
+def test_write__verifies_uploads(destination):
+    client = create_autospec(AZBlobClient, instance=True)
+    client.verifies_uploads = True
+    client.write.return_value = PartialStats(hash="1234", size=4)
+
+    write = Write(destination, "data")
+    assert write.execute(client) == TRIES
+    # The data is written using a single request
+    assert client.mock_calls == [call.write(b"data", destination)]
+    assert write.metrics.files_uploaded == 1
+    assert write.metrics.bytes_uploaded == 4
+
+
+def test_write__verifies_uploads__mismatch(destination):
+    client = create_autospec(AZBlobClient, instance=True)
+    client.verifies_uploads = True
+    client.write.side_effect = [None, PartialStats(hash="1234", size=4)]
+
+    write = Write(destination, "data")
+    assert write.execute(client) == TRIES - 1
+    assert client.mock_calls == [call.write(b"data", destination)] * 2
+
+
 def test_write__execute__no_tries_left(client, source, destination):
     write = Write(destination, str(uuid.uuid4()))
 
@@ -1367,6 +1683,21 @@ def test_execute__empty_list(client):
     assert client.mock_calls == []
 
 
+def test_execute__adds_metrics_to_report(client, source, destination):
+    client.get_md5.return_value = PartialStats(hash="4321", size=17)
+    report = MetricsReport("test")
+
+    with patch("azsync.sync.collect_md5_hashes", autospec=True) as mock:
+        mock.return_value = {Path(source): PartialStats(hash="4321", size=17)}
+
+        task = CheckedCopy(source, destination)
+        assert execute(client, [task, RemoveRemote(destination)], report=report)
+
+    assert report.tasks == [task.metrics]
+    assert task.metrics.listings == 1
+    assert task.metrics.retries == 0
+
+
 def test_execute__execute_all_1(client):
     mock = Mock()
     mock.task1.execute.return_value = 5
@@ -1422,3 +1753,190 @@ def test_execute__execute_all_4(client):
         call.task2.execute(client, 4),
         call.task3.execute(client, 1),
     ]
+
+
+def test_checked_multi_copy__only_failed_files_are_retried(client, destination):
+    local_files = {
+        Path("/foo/bar"): PartialStats(hash="4321", size=17, mtime=1234),
+        Path("/test/other"): PartialStats(hash="sdfa", size=145, mtime=23456),
+    }
+
+    with patch("azsync.sync.calculate_md5_hashes", autospec=True) as mock:
+        client.list_md5s = mock_list_md5s(
+            {},
+            {Path("file_1"): PartialStats(hash="4321", size=17)},
+            {
+                Path("file_1"): PartialStats(hash="4321", size=17),
+                Path("dir/file_2"): PartialStats(hash="sdfa", size=145),
+            },
+        )
+        client.copy_many.side_effect = [{Path("dir/file_2")}, set()]
+
+        mock.return_value = deepcopy(local_files)
+
+        copy = CheckedMultiCopy(
+            {"file_1": "/foo/bar", "dir/file_2": "/test/other"}, destination
+        )
+
+        assert copy.execute(client) == TRIES - 1
+        assert client.copy_many.call_args_list == [
+            call(
+                {
+                    Path("file_1"): Path("/foo/bar"),
+                    Path("dir/file_2"): Path("/test/other"),
+                },
+                destination,
+            ),
+            call({Path("dir/file_2"): Path("/test/other")}, destination),
+        ]
+
+
+def test_checked_multi_copy__metrics(client, destination):
+    local_files = {
+        Path("/foo/bar"): PartialStats(hash="4321", size=17, mtime=1234),
+        Path("/test/other"): PartialStats(hash="sdfa", size=145, mtime=23456),
+    }
+
+    with patch("azsync.sync.calculate_md5_hashes", autospec=True) as mock:
+        client.list_md5s = mock_list_md5s(
+            {Path("file_1"): PartialStats(hash="4321", size=17)},
+            {Path("file_1"): PartialStats(hash="4321", size=17)},
+            {
+                Path("file_1"): PartialStats(hash="4321", size=17),
+                Path("dir/file_2"): PartialStats(hash="sdfa", size=145),
+            },
+        )
+
+        client.copy_many.side_effect = [{Path("dir/file_2")}, set()]
+        mock.return_value = deepcopy(local_files)
+
+        copy = CheckedMultiCopy(
+            {"file_1": "/foo/bar", "dir/file_2": "/test/other"}, destination
+        )
+
+        assert copy.execute(client) == TRIES - 1
+
+    # The failed upload is not counted, but does consume a try
+    assert copy.metrics.files_uploaded == 1
+    assert copy.metrics.bytes_uploaded == 145
+    assert copy.metrics.listings == 3
+    assert copy.metrics.retries == 1
+    assert set(copy.metrics.seconds) == {"hash", "list", "upload", "total"}
+
+
+def test_checked_copy__hashes_uploads__missing_file(client, source, destination):
+    stats = PartialStats(hash="4321", size=17, mtime=123)
+
+    with patch("azsync.sync.collect_md5_hashes", autospec=True) as mock:
+        # Attaching the mock ensures that it shows up in 'mock_calls'
+        client.attach_mock(mock, "collect_md5_hashes__")
+        client.hashes_uploads = True
+        client.get_md5.side_effect = [
+            AZFileNotFoundError("BlobNotFound"),
+            PartialStats(hash="4321", size=17),
+        ]
+        client.copy.return_value = stats
+
+        mock.return_value = {Path(source): stats}
+
+        copy = CheckedCopy(source, destination)
+        assert copy.execute(client) == TRIES
+        # The file is not hashed before it is uploaded
+        assert client.mock_calls == [
+            call.get_md5(dst_url=destination),
+            call.copy(source, destination),
+            call.collect_md5_hashes__(
+                source, cache={Path(source): stats}, timeout=10 * 60,
+                metrics=ANY,
+            ),
+            call.get_md5(dst_url=destination),
+        ]
+
+
+def test_checked_copy__verifies_uploads(client, source, destination):
+    stats = PartialStats(hash="4321", size=17, mtime=123)
+
+    with patch("azsync.sync.collect_md5_hashes", autospec=True) as mock:
+        # Attaching the mock ensures that it shows up in 'mock_calls'
+        client.attach_mock(mock, "collect_md5_hashes__")
+        client.verifies_uploads = True
+        client.get_md5.side_effect = [AZFileNotFoundError("BlobNotFound")]
+        client.copy.return_value = stats
+
+        mock.return_value = {Path(source): stats}
+
+        copy = CheckedCopy(source, destination)
+        assert copy.execute(client) == TRIES
+        # The MD5 is not looked up after the file has been uploaded
+        assert client.mock_calls == [
+            call.collect_md5_hashes__(source, cache={}, timeout=10 * 60, metrics=ANY),
+            call.get_md5(dst_url=destination),
+            call.copy(source, destination),
+            call.collect_md5_hashes__(
+                source, cache={Path(source): stats}, timeout=10 * 60, metrics=ANY
+            ),
+        ]
+        assert copy.filestats == stats
+        assert copy.metrics.listings == 1
+
+
+def test_checked_copy__verifies_uploads__file_changed(client, source, destination):
+    stats = PartialStats(hash="4321", size=17, mtime=123)
+
+    with patch("azsync.sync.collect_md5_hashes", autospec=True) as mock:
+        client.attach_mock(mock, "collect_md5_hashes__")
+        client.verifies_uploads = True
+        client.get_md5.side_effect = [
+            AZFileNotFoundError("BlobNotFound"),
+            PartialStats(hash="4321", size=17),
+        ]
+        # The file was modified after being hashed, but before being uploaded
+        client.copy.return_value = PartialStats(hash="1234", size=17, mtime=456)
+
+        mock.return_value = {Path(source): stats}
+
+        copy = CheckedCopy(source, destination)
+        assert copy.execute(client) == TRIES
+        assert client.mock_calls[-1] == call.get_md5(dst_url=destination)
+        assert copy.metrics.listings == 2
+
+
+def test_checked_multi_copy__hashes_uploads(client, destination):
+    local_files = {
+        Path("/foo/bar"): PartialStats(hash="4321", size=17, mtime=1234),
+        Path("/test/other"): PartialStats(hash="sdfa", size=145, mtime=23456),
+    }
+
+    with patch("azsync.sync.calculate_md5_hashes", autospec=True) as mock:
+        # Attaching the mock ensures that it shows up in 'mock_calls'
+        client.attach_mock(mock, "calculate_md5_hashes__")
+        client.hashes_uploads = True
+        client.list_md5s = mock_list_md5s(
+            {Path("file_1"): PartialStats(hash="4321", size=17)},
+            {
+                Path("file_1"): PartialStats(hash="4321", size=17),
+                Path("dir/file_2"): PartialStats(hash="sdfa", size=145),
+            },
+        )
+
+        mock.return_value = deepcopy(local_files)
+
+        copy = CheckedMultiCopy(
+            {"file_1": "/foo/bar", "dir/file_2": "/test/other"}, destination
+        )
+
+        assert copy.execute(client) == TRIES
+        # Files missing on Azure are uploaded before files are hashed
+        assert client.mock_calls == [
+            call.list_md5s(destination),
+            call.copy_many({Path("dir/file_2"): Path("/test/other")}, destination),
+            call.calculate_md5_hashes__(
+                filepaths=[Path("/foo/bar"), Path("/test/other")],
+                timeout=10 * 60,
+                cache=None,
+                workers=1,
+                hash_cache=None,
+                metrics=ANY,
+            ),
+            call.list_md5s(destination),
+        ]
@@ -33,12 +33,17 @@ class PopenMock:
     def __init__(self, returncode=0, stdout=()):
         self._returncode = returncode
         self.returncode = None
+        self.killed = False
         self.stdout = io.BytesIO("\n".join(stdout).encode("utf-8"))
 
     def wait(self):
         self.returncode = self._returncode
         return self.returncode
 
+    def kill(self):
+        self._returncode = -9
+        self.killed = True
+
     @staticmethod
     def patch(autospec=False):
         return patch(
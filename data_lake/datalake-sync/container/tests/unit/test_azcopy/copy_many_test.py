@@ -0,0 +1,247 @@
+import json
+import os
+import uuid
+
+from pathlib import Path
+from unittest.mock import ANY, call
+
+import pytest
+
+from azsync.azcopy import AZCopy, AZError, AZLoginError, AZUnknownError
+from azsync.utilities import urlquote
+
+from .common import (
+    PopenMock,
+    default_login_call,
+    default_logout_call,
+    EXECUTABLE,
+    APP_ID,
+    TENANT_ID,
+    SECRET,
+)
+
+
+@pytest.fixture
+def client():
+    return AZCopy(tenant_id=TENANT_ID, app_id=APP_ID, secret=SECRET)
+
+
+def _copy_many_call(dst_url):
+    return call(
+        [
+            EXECUTABLE,
+            "copy",
+            "--put-md5",
+            "--recursive",
+            "--follow-symlinks",
+            "--output-type",
+            "json",
+            ANY,
+            dst_url,
+        ]
+    )
+
+
+def _record_staging(staged):
+    """Returns Popen side-effect recording the staged files for the copy command."""
+    returns = iter([PopenMock(), PopenMock(), PopenMock()])
+
+    def _popen(command, **kwargs):
+        if command[1] != "copy":
+            return next(returns)
+
+        src_dir = command[-2]
+        assert src_dir.endswith(os.path.join("", "*"))
+        src_dir = Path(src_dir[:-1])
+
+        for root, _, filenames in os.walk(src_dir):
+            for filename in filenames:
+                filepath = Path(root) / filename
+                assert filepath.is_symlink()
+                staged[filepath.relative_to(src_dir)] = Path(os.readlink(filepath))
+
+        return next(returns)
+
+    return _popen
+
+
+def test_copy_many__single_job(client, tmp_path):
+    staged = {}
+    with PopenMock.patch() as mock:
+        mock.side_effect = _record_staging(staged)
+
+        dst_url = str(uuid.uuid4())
+
+        with client:
+            client.copy_many(
+                {
+                    "foo": tmp_path / "file_1",
+                    Path("bar/zod?.txt"): tmp_path / "file_2",
+                },
+                dst_url,
+            )
+
+        assert mock.mock_calls == [
+            default_login_call(),
+            _copy_many_call(dst_url),
+            default_logout_call(),
+        ]
+
+    assert staged == {
+        Path("foo"): tmp_path / "file_1",
+        Path("bar/zod?.txt"): tmp_path / "file_2",
+    }
+
+
+def test_copy_many__staging_dir_is_removed(client, tmp_path):
+    with PopenMock.patch() as mock:
+        mock.side_effect = [PopenMock(), PopenMock(), PopenMock()]
+
+        with client:
+            client.copy_many({"foo": tmp_path / "file_1"}, "destination")
+
+        _, (command,), _ = mock.mock_calls[1]
+        assert not os.path.exists(command[-2][:-1])
+
+
+def test_copy_many__relative_source_files(client, tmp_path):
+    staged = {}
+    with PopenMock.patch() as mock:
+        mock.side_effect = _record_staging(staged)
+
+        with client:
+            client.copy_many({"foo": Path("file_1")}, "destination")
+
+    assert staged == {Path("foo"): Path("file_1").absolute()}
+
+
+@pytest.mark.parametrize(
+    "keys",
+    [
+        ("/foo",),
+        ("../foo",),
+        ("foo/../../bar",),
+        ("",),
+        ("foo", Path("foo")),
+        ("foo", "foo/bar"),
+        ("foo/bar/zod", "foo"),
+    ],
+)
+def test_copy_many__invalid_destination(client, keys):
+    with PopenMock.patch() as mock:
+        mock.side_effect = [PopenMock(), PopenMock()]
+
+        with client:
+            with pytest.raises(ValueError):
+                client.copy_many({key: "/foo/bar" for key in keys}, "destination")
+
+        assert mock.mock_calls == [default_login_call(), default_logout_call()]
+
+
+def test_copy_many__login_failed(client):
+    with PopenMock.patch() as mock:
+        mock.side_effect = [PopenMock(returncode=1)]
+
+        with client:
+            with pytest.raises(AZLoginError):
+                client.copy_many({"foo": "/foo/bar"}, "destination")
+
+        assert mock.mock_calls == [default_login_call()]
+
+
+def test_copy_many__failure(client):
+    with PopenMock.patch() as mock:
+        mock.side_effect = [PopenMock(), PopenMock(returncode=1), PopenMock()]
+
+        with client:
+            with pytest.raises(AZUnknownError):
+                client.copy_many({"foo": "/foo/bar"}, "destination")
+
+        assert mock.mock_calls == [
+            default_login_call(),
+            _copy_many_call("destination"),
+            default_logout_call(),
+        ]
+
+
+def _end_of_job(failed_transfers=()):
+    summary = {"JobStatus": "Completed", "FailedTransfers": list(failed_transfers)}
+
+    return json.dumps(
+        {
+            "TimeStamp": "2020-01-01T00:00:00Z",
+            "MessageType": "EndOfJob",
+            "MessageContent": json.dumps(summary),
+        }
+    )
+
+
+def _job_with_failures(failed_keys, use_src=True):
+    """Returns Popen side-effect reporting failed transfers for the copy command."""
+    returns = iter([PopenMock(), None, PopenMock()])
+
+    def _popen(command, **kwargs):
+        if command[1] != "copy":
+            return next(returns)
+
+        next(returns)
+        staging_dir = command[-2][:-1]
+        transfers = []
+        for key in failed_keys:
+            if use_src:
+                transfer = {"Src": os.path.join(staging_dir, key)}
+            else:
+                transfer = {"Dst": f"{command[-1]}/{urlquote(key)}?sas-token"}
+
+            transfers.append(dict(transfer, TransferStatus="Failed"))
+
+        return PopenMock(returncode=1, stdout=["junk", _end_of_job(transfers)])
+
+    return _popen
+
+
+def test_copy_many__no_failures(client):
+    with PopenMock.patch() as mock:
+        mock.side_effect = [
+            PopenMock(),
+            PopenMock(stdout=[_end_of_job()]),
+            PopenMock(),
+        ]
+
+        with client:
+            assert client.copy_many({"foo": "/foo/bar"}, "destination") == set()
+
+
+@pytest.mark.parametrize("use_src", [True, False])
+def test_copy_many__per_file_failures(client, use_src):
+    file_map = {"foo": "/foo/1", Path("bar/zod?.txt"): "/foo/2", "other": "/foo/3"}
+
+    with PopenMock.patch() as mock:
+        mock.side_effect = _job_with_failures(["bar/zod?.txt", "foo"], use_src)
+
+        with client:
+            failed = client.copy_many(file_map, "https://example.com/destination")
+
+    assert failed == {"foo", Path("bar/zod?.txt")}
+
+
+def test_copy_many__unexpected_failed_transfer(client):
+    with PopenMock.patch() as mock:
+        mock.side_effect = _job_with_failures(["unknown"])
+
+        with client:
+            with pytest.raises(AZError):
+                client.copy_many({"foo": "/foo/1"}, "destination")
+
+
+def test_copy_many__failure_without_failed_transfers(client):
+    with PopenMock.patch() as mock:
+        mock.side_effect = [
+            PopenMock(),
+            PopenMock(returncode=1, stdout=[_end_of_job()]),
+            PopenMock(),
+        ]
+
+        with client:
+            with pytest.raises(AZUnknownError):
+                client.copy_many({"foo": "/foo/bar"}, "destination")
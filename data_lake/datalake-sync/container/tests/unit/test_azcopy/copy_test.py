@@ -112,3 +112,64 @@ def test_copy__failure(client):
             call([EXECUTABLE, "copy", "--put-md5", src_file, dst_url]),
             default_logout_call(),
         ]
+
+
+@pytest.mark.parametrize("cap_mbps", [-1, "10"])
+def test_copy__invalid_bandwidth_cap(client, cap_mbps):
+    with pytest.raises(ValueError):
+        client.set_bandwidth_cap(cap_mbps)
+
+
+def test_copy__bandwidth_cap(client):
+    with PopenMock.patch() as mock:
+        mock.side_effect = [PopenMock()] * 3
+
+        src_file = str(uuid.uuid4())
+        dst_url = str(uuid.uuid4())
+
+        client.set_bandwidth_cap(12.5)
+        with client:
+            client.copy(src_file=src_file, dst_url=dst_url)
+
+        assert mock.mock_calls == [
+            default_login_call(),
+            call(
+                [
+                    EXECUTABLE,
+                    "copy",
+                    "--cap-mbps",
+                    "12.5",
+                    "--put-md5",
+                    src_file,
+                    dst_url,
+                ]
+            ),
+            default_logout_call(),
+        ]
+
+
+def test_copy__bandwidth_cap__function(client):
+    caps = [50, None]
+
+    with PopenMock.patch() as mock:
+        mock.side_effect = [PopenMock()] * 4
+
+        client.set_bandwidth_cap(lambda: caps.pop(0))
+        with client:
+            client.copy(src_file="src_1", dst_url="dst_1")
+            client.copy(src_file="src_2", dst_url="dst_2")
+
+        assert mock.mock_calls == [
+            default_login_call(),
+            call(
+                [EXECUTABLE, "copy", "--cap-mbps", "50", "--put-md5", "src_1", "dst_1"]
+            ),
+            call([EXECUTABLE, "copy", "--put-md5", "src_2", "dst_2"]),
+            default_logout_call(),
+        ]
+
+
+def test_copy__bandwidth_cap__invalid_function_value(client):
+    client.set_bandwidth_cap(lambda: -1)
+    with pytest.raises(ValueError):
+        client.bandwidth_cap()
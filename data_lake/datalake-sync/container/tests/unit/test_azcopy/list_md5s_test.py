@@ -154,3 +154,90 @@ def test_list_md5s__failure(client):
             call([EXECUTABLE, "list_md5s", dst_url]),
             default_logout_call(),
         ]
+
+
+def test_list_md5s__paths__looked_up(client):
+    with PopenMock.patch() as mock:
+        mock.side_effect = [
+            PopenMock(),
+            PopenMock(stdout=["MD5: ABC\t123\tfoo/bar?"]),
+            PopenMock(returncode=1, stdout=["X-Ms-Error-Code: [BlobNotFound]"]),
+            PopenMock(),
+        ]
+
+        with client:
+            assert client.list_md5s(
+                dst_url="destination", paths={Path("foo/bar?"), Path("foo/baz")}
+            ) == {Path("foo/bar?"): PartialStats(size=123, hash="ABC")}
+
+        assert mock.mock_calls == [
+            default_login_call(),
+            call([EXECUTABLE, "get_md5", "destination/foo/bar%3F"]),
+            call([EXECUTABLE, "get_md5", "destination/foo/baz"]),
+            default_logout_call(),
+        ]
+
+
+def test_list_md5s__paths__listed_if_too_many(client):
+    with PopenMock.patch() as mock:
+        mock.side_effect = [PopenMock(), PopenMock(stdout=_TEST_STDOUT), PopenMock()]
+
+        paths = [Path(str(path)) for (_, _, path) in _TEST_FILES[:2]]
+        client.max_md5_lookups = 1
+
+        with client:
+            assert client.list_md5s(dst_url="destination", paths=paths) == {
+                path: _TEST_OUT[path] for path in paths
+            }
+
+        assert mock.mock_calls == [
+            default_login_call(),
+            call([EXECUTABLE, "list_md5s", "destination"]),
+            default_logout_call(),
+        ]
+
+
+def test_iter_md5s__yields_files(client):
+    with PopenMock.patch() as mock:
+        mock.side_effect = [PopenMock(), PopenMock(stdout=_TEST_STDOUT), PopenMock()]
+
+        with client:
+            result = client.iter_md5s(dst_url="destination")
+            assert not isinstance(result, dict)
+            assert list(result) == list(_TEST_OUT.items())
+
+        assert mock.mock_calls == [
+            default_login_call(),
+            call([EXECUTABLE, "list_md5s", "destination"]),
+            default_logout_call(),
+        ]
+
+
+def test_iter_md5s__failure_raised_after_files(client):
+    with PopenMock.patch() as mock:
+        mock.side_effect = [
+            PopenMock(),
+            PopenMock(returncode=1, stdout=_TEST_STDOUT_ALT),
+            PopenMock(),
+        ]
+
+        with client:
+            result = client.iter_md5s(dst_url="destination")
+            key, _ = next(result)
+            assert key == Path(str(_TEST_FILES_ALT[0][2]))
+
+            with pytest.raises(AZUnknownError):
+                next(result)
+
+
+def test_iter_md5s__closing_kills_azcopy(client):
+    proc = PopenMock(stdout=_TEST_STDOUT)
+    with PopenMock.patch() as mock:
+        mock.side_effect = [PopenMock(), proc, PopenMock()]
+
+        with client:
+            result = client.iter_md5s(dst_url="destination")
+            next(result)
+            result.close()
+
+        assert proc.killed
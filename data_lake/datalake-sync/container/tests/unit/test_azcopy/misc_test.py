@@ -1,3 +1,5 @@
+import logging
+
 from unittest.mock import patch, call
 
 import pytest
@@ -8,6 +10,7 @@ import azsync.azcopy
 from azsync.azcopy import AZCopy
 
 from .common import (
+    PopenMock,
     APP_ID,
     TENANT_ID,
     SECRET,
@@ -50,3 +53,22 @@ def test_popen__with_without_env(env):
                 env=env,
             )
         ]
+
+
+def test_run_command__log_lines_are_bounded(caplog):
+    stdout = [f"line {idx}" for idx in range(10)] + ["MD5: foo"]
+
+    with PopenMock.patch() as mock, patch("azsync.azcopy.MAX_LOG_LINES", 3):
+        mock.return_value = PopenMock(stdout=stdout)
+
+        with caplog.at_level(logging.DEBUG):
+            log = logging.getLogger("test")
+            result = AZCopy._run_command(["cmd"], log=log, response_prefix="MD5: ")
+
+    assert result == ["MD5: foo"]
+    assert [record.getMessage() for record in caplog.records][-4:] == [
+        "[7 earlier lines not logged]",
+        "line 7",
+        "line 8",
+        "line 9",
+    ]
@@ -0,0 +1,195 @@
+import os
+import time
+
+from unittest.mock import patch
+
+import pytest
+
+from azsync.watcher import PendingRuns, RunWatcher, run_daemon
+
+_BACKENDS = ("inotify", "poll")
+
+
+def _poll_until(watcher, expected, timeout=5.0):
+    """Polls until 'expected' runs were reported; returns all runs reported."""
+    changed = set()
+    deadline = time.monotonic() + timeout
+    while not expected <= changed and time.monotonic() < deadline:
+        changed |= watcher.poll(0.1)
+
+    return changed
+
+
+def _set_mtime(filepath, mtime):
+    os.utime(filepath, (mtime, mtime))
+
+
+def test_run_watcher__invalid_arguments(tmp_path):
+    with pytest.raises(ValueError):
+        RunWatcher(tmp_path, backend="foo")
+    with pytest.raises(ValueError):
+        RunWatcher(tmp_path, backend="poll", interval=0)
+
+
+@pytest.mark.parametrize("backend", _BACKENDS)
+def test_run_watcher__new_run(tmp_path, backend):
+    with RunWatcher(tmp_path, "done.txt", interval=0.01, backend=backend) as watcher:
+        assert watcher.backend == backend
+        assert watcher.poll(0) == set()
+
+        (tmp_path / "run_1").mkdir()
+        assert _poll_until(watcher, {"run_1"}) == {"run_1"}
+
+
+@pytest.mark.parametrize("backend", _BACKENDS)
+def test_run_watcher__flag_created(tmp_path, backend):
+    (tmp_path / "run_1").mkdir()
+    (tmp_path / "run_2").mkdir()
+
+    with RunWatcher(tmp_path, "done.txt", interval=0.01, backend=backend) as watcher:
+        (tmp_path / "run_1" / "data.txt").write_text("data")
+        _set_mtime(tmp_path / "run_1", 1)
+        (tmp_path / "run_2" / "done.txt").write_text("")
+
+        assert _poll_until(watcher, {"run_2"}) == {"run_2"}
+
+
+@pytest.mark.parametrize("backend", _BACKENDS)
+def test_run_watcher__any_file(tmp_path, backend):
+    (tmp_path / "run_1").mkdir()
+    (tmp_path / "run_2").mkdir()
+
+    with RunWatcher(tmp_path, interval=0.01, backend=backend) as watcher:
+        (tmp_path / "run_1" / "data.txt").write_text("data")
+        _set_mtime(tmp_path / "run_1", 1)
+
+        assert _poll_until(watcher, {"run_1"}) == {"run_1"}
+
+
+@pytest.mark.parametrize("backend", _BACKENDS)
+def test_run_watcher__ignored_runs(tmp_path, backend):
+    (tmp_path / "run_1").mkdir()
+    (tmp_path / "run_2").mkdir()
+
+    with RunWatcher(tmp_path, "done.txt", interval=0.01, backend=backend) as watcher:
+        watcher.ignore("run_1")
+
+        (tmp_path / "run_1" / "done.txt").write_text("")
+        (tmp_path / "run_2" / "done.txt").write_text("")
+
+        assert _poll_until(watcher, {"run_2"}) == {"run_2"}
+
+
+def test_run_watcher__missing_root(tmp_path):
+    with RunWatcher(tmp_path / "missing", backend="poll", interval=0.01) as watcher:
+        assert watcher.poll(0.05) == set()
+
+
+def test_run_watcher__auto__polls_network_filesystems(tmp_path):
+    with patch("azsync.watcher._get_filesystem_type", return_value="cifs"):
+        with RunWatcher(tmp_path) as watcher:
+            assert watcher.backend == "poll"
+
+
+def test_run_watcher__auto__falls_back_to_polling(tmp_path):
+    with patch("azsync.watcher._Inotify", side_effect=OSError("not supported")):
+        with RunWatcher(tmp_path) as watcher:
+            assert watcher.backend == "poll"
+
+
+def test_pending_runs():
+    pending = PendingRuns()
+    assert pending.next_due() is None
+
+    pending.touch("run_1", 10)
+    pending.touch("run_2", 20)
+    # Further events postpone a run
+    pending.touch("run_1", 30)
+    # Runs found while rescanning do not postpone runs
+    pending.add("run_2", 40)
+    pending.add("run_3", 25)
+
+    assert len(pending) == 3
+    assert pending.next_due() == 20
+    assert pending.pop_due(25) == ["run_2", "run_3"]
+    assert pending.pop_due(25) == []
+    assert pending.pop_due(30) == ["run_1"]
+    assert len(pending) == 0
+
+
+class _FakeWatcher:
+    root = "root"
+
+    def __init__(self, events):
+        self.events = list(events)
+        self.ignored = []
+
+    def poll(self, timeout):
+        if self.events:
+            return self.events.pop(0)
+
+        raise KeyboardInterrupt()
+
+    def ignore(self, name):
+        self.ignored.append(name)
+
+
+def test_run_daemon():
+    watcher = _FakeWatcher([set(), {"run_2"}])
+    batches = []
+
+    def _sync(names):
+        batches.append(names)
+        return names[:1]
+
+    run_daemon(
+        watcher=watcher,
+        collect=lambda: ["run_1", "run_3"],
+        sync=_sync,
+        debounce=0,
+        rescan=3600,
+    )
+
+    assert batches == [["run_1", "run_3"], ["run_2"]]
+    assert watcher.ignored == ["run_1", "run_2"]
+
+
+def test_run_daemon__cycles():
+    watcher = _FakeWatcher([])
+    batches = []
+
+    def _sync(names):
+        batches.append(names)
+        return ()
+
+    run_daemon(
+        watcher=watcher,
+        collect=lambda: ["run_1"],
+        sync=_sync,
+        debounce=0,
+        rescan=0,
+        cycles=2,
+    )
+
+    # Runs are collected again on every rescan
+    assert batches == [["run_1"], ["run_1"]]
+
+
+def test_run_daemon__exceptions_are_logged(caplog):
+    watcher = _FakeWatcher([{"run_1"}])
+    calls = []
+
+    def _sync(names):
+        raise RuntimeError("sync failed")
+
+    run_daemon(
+        watcher=watcher,
+        collect=lambda: ["run_1"],
+        sync=_sync,
+        debounce=0,
+        rescan=3600,
+        after_sync=lambda: calls.append("after_sync"),
+    )
+
+    assert calls == ["after_sync", "after_sync"]
+    assert "RuntimeError('sync failed')" in caplog.text
@@ -118,13 +118,21 @@ def download_file(url, destination):
     return proc.returncode == 0
 
 
-def calculate_md5(filepath, block_size=64 * 1024):
+def calculate_md5(filepath, block_size=1024 * 1024):
     with filepath.open("rb") as handle:
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(handle.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+
+        # A single buffer is re-used for every block, to avoid allocations per read
         md5 = hashlib.new("md5")
-        block = handle.read(block_size)
-        while block:
-            md5.update(block)
-            block = handle.read(block_size)
+        buf = bytearray(block_size)
+        with memoryview(buf) as view:
+            nbytes = handle.readinto(view)
+            while nbytes:
+                with view[:nbytes] as block:
+                    md5.update(block)
+
+                nbytes = handle.readinto(view)
 
         return md5.hexdigest()
 
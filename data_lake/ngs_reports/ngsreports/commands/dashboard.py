@@ -10,6 +10,9 @@ from ngsreports.xmlsheet import IlluminaXMLParser, IlluminaXML
 
 _LOG_NAME = "dashboard"
 
+# InterOp metrics required to collect statistics; see interop.load
+REQUIRED_METRICS = ("summary",)
+
 
 ########################################################################################
 # Collecting stats from existing NGS runs
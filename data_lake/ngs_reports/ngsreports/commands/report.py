@@ -35,6 +35,7 @@ from ngsreports.report.tables import (
     RunSummaryTable,
 )
 from ngsreports.report.interop import iterop
+from ngsreports.report.rendering import PendingPlot, PlotPool
 from ngsreports.report.utils import split_into_blocks
 from ngsreports.xmlsheet import IlluminaXML
 
@@ -70,16 +71,25 @@ class DocTemplateWithTOS(BaseDocTemplate):
                 self.notify("TOCEntry", (1, text, self.page))
 
 
-def add_charts(log, cls, title, data, metrics):
+def submit_charts(log, plots, cls, data, metrics):
+    """Starts rendering a plot for each metric; returns a list of (metric, plot)."""
+    charts = []
+    for _, metric in sorted(metrics.items()):
+        log.info("plotting [%s]: %s", metric.name, metric.description)
+        charts.append((metric, plots.submit(cls, data=data, metric=metric.name)))
+
+    return charts
+
+
+def add_charts(log, title, plots):
     yield Paragraph(title, style=STYLES["H1"])
 
     nth_plot = 0
-    for _, metric in sorted(metrics.items()):
+    for metric, pending in plots:
         name = metric.description
 
         try:
-            log.info("plotting [%s]: %s", metric.name, metric.description)
-            plot = cls(data=data, metric=metric.name)
+            plot = pending.result()
         except NoMetricDataToPlot:
             log.warning("Not data for cycle metric %r; skipping plots", name)
         else:
@@ -123,12 +133,53 @@ def instrument_type(metrics, fallback=None):
     return instrument.description
 
 
-def build_full_pdf(args, metrics, summary, index):
+def build_full_pdf(args, metrics, summary, index, plots):
     log = logging.getLogger(_LOG_NAME)
 
     destination = args.output / "report.pdf"
     log.info("Building full NGS report at '%s'", destination)
 
+    items = _build_full_pdf_items(log, args, plots, metrics, summary, index)
+
+    doc = DocTemplateWithTOS(str(destination))
+    doc.addPageTemplates(
+        PageTemplate(
+            id="First",
+            frames=Frame(
+                doc.leftMargin, doc.bottomMargin, doc.width, doc.height, id="normal"
+            ),
+            onPage=NumberedPage(),
+            pagesize=doc.pagesize,
+        )
+    )
+
+    log.info("building document")
+    doc.multiBuild(items)
+    log.info("done")
+
+    return {"RunMetrics": destination}
+
+
+def _build_full_pdf_items(log, args, plots, metrics, summary, index):
+    # All plots are submitted up front, so that they can be rendered concurrently
+    log.info("plotting indexing QC")
+    indexing_plot = plots.submit(LaneIndexingPlot, data=index)
+    log.info("plotting quality score histogram")
+    histogram_plot = plots.submit(PlotQScoreHistogram, data=metrics)
+    log.info("plotting quality score heatmaps")
+    heatmap_plot = plots.submit(PlotQScoreHeatmap, data=metrics)
+
+    metric_plots = [
+        ["cycle", PlotByCycle, consts.CYCLE_METRICS],
+        ["lane", PlotByLane, consts.LANE_METRICS],
+        ["flowcell", PlotByFlowCell, consts.FLOWCELL_METRICS],
+    ]
+
+    charts = []
+    for name, cls, enums in metric_plots:
+        log.info("plotting by %s", name)
+        charts.append((name, submit_charts(log, plots, cls, metrics, enums)))
+
     toc = TableOfContents()
     toc.levelStyles = [STYLES["TOC1"], STYLES["TOC2"]]
 
@@ -157,8 +208,7 @@ def build_full_pdf(args, metrics, summary, index):
     ]
 
     try:
-        plot = LaneIndexingPlot(data=index)
-        items.extend((plot, PageBreak()))
+        items.extend((indexing_plot.result(), PageBreak()))
     except NoMetricDataToPlot:
         pass
 
@@ -175,60 +225,29 @@ def build_full_pdf(args, metrics, summary, index):
 
     items.append(Paragraph("Quality Scores", style=STYLES["H1"]))
 
-    log.info("plotting quality score histogram")
     try:
-        plot = PlotQScoreHistogram(data=metrics)
+        plot = histogram_plot.result()
         items.append(Paragraph("Histogram", style=STYLES["H2"]))
         items.append(plot)
     except NoMetricDataToPlot:
         log.warning("no data to plot quality score histogram")
 
-    log.info("plotting quality score heatmaps")
     try:
-        plot = PlotQScoreHeatmap(data=metrics)
+        plot = heatmap_plot.result()
         items.append(Paragraph("Heatmap", style=STYLES["H2"]))
         items.append(plot)
     except NoMetricDataToPlot:
         log.warning("no data to plot quality score heatmap")
 
-    metric_plots = [
-        ["cycle", PlotByCycle, consts.CYCLE_METRICS],
-        ["lane", PlotByLane, consts.LANE_METRICS],
-        ["flowcell", PlotByFlowCell, consts.FLOWCELL_METRICS],
-    ]
-
-    for name, cls, enums in metric_plots:
-        log.info("plotting by cycle")
+    for name, plots in charts:
         items.extend(
-            add_charts(
-                cls=cls,
-                log=log,
-                title=f"Charts by {name.title()}",
-                data=metrics,
-                metrics=enums,
-            )
-        )
-
-    doc = DocTemplateWithTOS(str(destination))
-    doc.addPageTemplates(
-        PageTemplate(
-            id="First",
-            frames=Frame(
-                doc.leftMargin, doc.bottomMargin, doc.width, doc.height, id="normal"
-            ),
-            onPage=NumberedPage(),
-            pagesize=doc.pagesize,
+            add_charts(log=log, title=f"Charts by {name.title()}", plots=plots)
         )
-    )
 
-    log.info("building document")
-    doc.multiBuild(items)
-    log.info("done")
-
-    return {"RunMetrics": destination}
+    return items
 
 
-def build_one_page_pdf(args, metrics, summary, index):
+def build_one_page_pdf(args, metrics, summary, index, plots):
     log = logging.getLogger(_LOG_NAME)
 
     destination = args.output / "1page.pdf"
@@ -283,15 +302,22 @@ def build_one_page_pdf(args, metrics, summary, index):
         _frame(x1=5 / 8, y1=0 / 17, width=3 / 8, height=5 / 17),
     ]
 
-    def _image(cls, *args, **kwargs):
+    def _image(cls, **kwargs):
         kwargs.setdefault("width", regular_image_width)
         kwargs.setdefault("height", regular_image_height)
 
+        return plots.submit(cls, **kwargs)
+
+    def _resolve(item):
+        if not isinstance(item, PendingPlot):
+            return item
+
         try:
-            return cls(*args, **kwargs)
+            return item.result()
         except NoMetricDataToPlot:
-            return report.NoData(width=kwargs["width"], height=kwargs["height"])
+            return report.NoData(width=item.width, height=item.height)
 
+    # Plots are rendered concurrently and then placed in document order
     items = [
         Paragraph(experiment_name(args.run), style=STYLES["H1"]),
         RunSummaryTable(
@@ -338,6 +364,7 @@ def build_one_page_pdf(args, metrics, summary, index):
         Paragraph("Indexing QC", style=STYLES["H1"]),
         _image(LaneIndexingPlot, data=index),
     ]
+    items = [_resolve(item) for item in items]
 
     doc.addPageTemplates([PageTemplate(frames=frames)])
 
@@ -375,7 +402,7 @@ class CSVWriter:
         self._handle.close()
 
 
-def build_csv(args, metrics, summary, index):
+def build_csv(args, metrics, summary, index, plots):
     log = logging.getLogger(_LOG_NAME)
     log.info("Building CVS tables for '%s'", args.output)
 
@@ -426,6 +453,23 @@ COMMANDS = {
     "full": [build_full_pdf],
 }
 
+# InterOp metrics required by each command; see interop.load
+REQUIRED_METRICS = {
+    build_one_page_pdf: ("summary", "plots"),
+    build_csv: ("summary", "intensity"),
+    build_full_pdf: ("summary", "plots"),
+}
+
+
+def required_metrics(args):
+    """Returns the InterOp metrics required by the reports selected by 'args'."""
+    requires = set()
+    for name in args.reports or ["all"]:
+        for func in COMMANDS.get(name, ()):
+            requires.update(REQUIRED_METRICS[func])
+
+    return requires
+
 
 def main(args, data):
     log = logging.getLogger(_LOG_NAME)
@@ -447,17 +491,20 @@ def main(args, data):
     args.output.mkdir(parents=True, exist_ok=True)
 
     output_files = {}
-    for command in commands:
-        files = command(
-            args=args,
-            metrics=data.metrics,
-            summary=data.summary,
-            index=data.index,
-        )
+    # Plots are shared between reports, so that each plot is only rendered once
+    with PlotPool(args.plot_workers, metrics=data.metrics, index=data.index) as plots:
+        for command in commands:
+            files = command(
+                args=args,
+                metrics=data.metrics,
+                summary=data.summary,
+                index=data.index,
+                plots=plots,
+            )
 
-        if files is None:
-            return None
+            if files is None:
+                return None
 
-        output_files.update(files)
+            output_files.update(files)
 
     return output_files
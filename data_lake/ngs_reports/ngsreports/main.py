@@ -3,6 +3,7 @@
 import datetime
 import io
 import logging
+import os
 import sys
 import zipfile
 
@@ -23,8 +24,8 @@ _LOG_FORMAT = "%(asctime)s %(name)s %(levelname)s %(message)s"
 
 
 class InterOpData:
-    def __init__(self, dirpath, instrument):
-        self.metrics = interop.load(dirpath, instrument)
+    def __init__(self, dirpath, instrument, requires=interop.REQUIREMENTS):
+        self.metrics = interop.load(dirpath, instrument, requires=requires)
         self.summary, self.index = interop.summarize(self.metrics)
 
     def run_date(self):
@@ -125,6 +126,16 @@ def add_instruments(parser):
     )
 
 
+def add_plot_workers(parser):
+    parser.add_argument(
+        "--plot-workers",
+        type=int,
+        default=min(4, os.cpu_count() or 1),
+        help="Number of processes used to render plots for PDF reports; plots are "
+        "rendered in the main process if 1 or less [%(default)s]",
+    )
+
+
 def add_email_notification(parser):
     group = parser.add_argument_group("email notification")
     group.add_argument("--smtp-host", help="Hostname of SMTP server")
@@ -171,6 +182,7 @@ def add_args_report(parser):
     )
 
     add_instruments(parser)
+    add_plot_workers(parser)
     add_email_notification(parser)
 
 
@@ -183,6 +195,7 @@ def add_args_all(parser):
     add_path(parser, "--output", "Output folder for PDFs/CSVs", required=True)
 
     add_instruments(parser)
+    add_plot_workers(parser)
     add_email_notification(parser)
 
 
@@ -201,6 +214,20 @@ def build_parser():
     return parser
 
 
+def required_metrics(args):
+    """Returns the InterOp metrics required by the selected command; see
+    interop.load.
+    """
+    requires = set()
+    if args.main in (report.main, main_all):
+        requires.update(report.required_metrics(args))
+
+    if args.main in (dashboard.main, main_all):
+        requires.update(dashboard.REQUIRED_METRICS)
+
+    return requires
+
+
 def main_all(args, data):
     report_output = report.main(args, data)
     if report_output is None:
@@ -234,7 +261,11 @@ def main(argv):
     data = None
     if args.run is not None:
         log.info("collecting statistics from '%s'", args.run)
-        data = InterOpData(dirpath=args.run, instrument=args.instrument)
+        data = InterOpData(
+            dirpath=args.run,
+            instrument=args.instrument,
+            requires=required_metrics(args),
+        )
 
     output_files = args.main(args, data)
     if output_files is None:
@@ -1,5 +1,10 @@
+import functools
 import logging
 
+from pathlib import Path
+
+import numpy
+
 from interop import (
     py_interop_plot,
     py_interop_run_metrics,
@@ -12,6 +17,16 @@ import ngsreports.report.constants as consts
 
 _LOG_NAME = "interop"
 
+# Sets of metrics that may be requested when loading a run; see 'load'
+REQUIREMENTS = ("summary", "intensity", "plots")
+
+# Metric groups needed by summaries, excluding q-metrics and extraction metrics
+_SUMMARY_METRICS = (py_interop_run.Error, py_interop_run.Tile)
+
+# Filenames of collapsed q-metrics (Q20/Q30 counts); InterOp also accepts these
+# without the "Out" suffix
+_COLLAPSED_Q_METRICS = ("QMetrics2030Out.bin", "QMetrics2030.bin")
+
 
 def iterop(obj, size=None):
     """Helper function designed to simplify iteration over interop collections; these
@@ -31,19 +46,140 @@ def iterop(obj, size=None):
         raise TypeError(obj)
 
 
-def load(root, instrument="MiSeq"):
+class FlowcellArray:
+    """Flowcell map as an array of shape (lanes, tiles, swaths). The InterOp plot
+    data is kept alongside the array, as it may refer to the memory of the array.
+    """
+
+    def __init__(self, data, values):
+        self.data = data
+        self.values = numpy.empty((0, 0, 0), dtype=values.dtype)
+        if not data.empty():
+            self.values = values.reshape(
+                data.lane_count(), data.swath_count(), data.tile_count()
+            ).transpose(0, 2, 1)
+
+    def empty(self):
+        return self.data.empty()
+
+
+class HeatmapArray:
+    """Heatmap as an array of shape (columns, rows), i.e. with a row per q-score
+    and a column per cycle for q-score heatmaps. The InterOp plot data is kept
+    alongside the array, as it may refer to the memory of the array.
+    """
+
+    def __init__(self, data, values):
+        self.data = data
+        self.values = numpy.empty((0, 0), dtype=values.dtype)
+        if not data.empty():
+            self.values = values.reshape(data.row_count(), data.column_count()).T
+
+    def empty(self):
+        return self.data.empty()
+
+    def x_axis(self):
+        return self.data.x_axis()
+
+    def y_axis(self):
+        return self.data.y_axis()
+
+
+def candle_stick_arrays(series):
+    """Returns the x-coordinates of the points in a candle-stick series and an
+    array of shape (5, points) containing the lower, p25, p50, p75, and upper value
+    of each point. The values are read in a single pass over the points.
+    """
+    values = numpy.array(
+        [
+            (it.x(), it.lower(), it.p25(), it.p50(), it.p75(), it.upper())
+            for it in iterop(series)
+        ],
+        dtype=numpy.float64,
+    ).reshape(-1, 6)
+
+    return values[:, 0], values[:, 1:].T
+
+
+def line_arrays(series):
+    """Returns the x and y coordinates of the points in a line series."""
+    values = numpy.array(
+        [(it.x(), it.y()) for it in iterop(series)], dtype=numpy.float64
+    ).reshape(-1, 2)
+
+    return values[:, 0], values[:, 1]
+
+
+def _to_array(data):
+    """Copies the values of flowcell or heatmap data one by one; used only if
+    InterOp cannot write plot data directly into a NumPy array.
+    """
+    size = data.length()
+
+    return numpy.fromiter(iterop(data, size=size), dtype=numpy.float32, count=size)
+
+
+def _cached_plot_data(func):
+    """Caches the plot data returned by 'func(metrics, ...)', as the same plots are
+    drawn by several reports. The returned objects are shared and must therefore not
+    be modified by callers.
+    """
+    cache = {}
+
+    @functools.wraps(func)
+    def _wrapper(metrics, *args, **kwargs):
+        key = (id(metrics), args, tuple(sorted(kwargs.items())))
+        value = cache.get(key)
+        # The metrics are kept to ensure that the id is not re-used
+        if value is None or value[0] is not metrics:
+            value = cache[key] = (metrics, func(metrics, *args, **kwargs))
+
+        return value[1]
+
+    return _wrapper
+
+
+def load(root, instrument="MiSeq", requires=REQUIREMENTS):
+    """Loads the InterOp metrics of a run; 'requires' is one or more of
+    REQUIREMENTS, and only the metrics needed for those are loaded:
+
+      - "summary": The run, lane, and index summaries returned by 'summarize',
+        except for the intensities of the first cycle of each read.
+      - "intensity": The intensities of the first cycle of each read.
+      - "plots": All metrics needed for summaries and for plots.
+    """
     if instrument not in consts.INSTRUMENTS_BY_NAME:
         raise ValueError(instrument)
 
+    requires = frozenset(requires)
+    if not requires or not requires.issubset(REQUIREMENTS):
+        raise ValueError(requires)
+
     log = logging.getLogger(_LOG_NAME)
     log.info("reading %s run from %s", instrument, str(root))
 
     run_metrics = py_interop_run_metrics.run_metrics()
     valid_to_load = py_interop_run.uchar_vector(py_interop_run.MetricCount, 0)
-    # Load summary metrics
-    py_interop_run_metrics.list_summary_metrics_to_load(
-        valid_to_load, consts.INSTRUMENTS_BY_NAME[instrument].enum
-    )
+    if "plots" in requires:
+        # Load summary metrics
+        py_interop_run_metrics.list_summary_metrics_to_load(
+            valid_to_load, consts.INSTRUMENTS_BY_NAME[instrument].enum
+        )
+    else:
+        log.info("loading %s metrics only", " and ".join(sorted(requires)))
+        for group in _SUMMARY_METRICS:
+            valid_to_load[group] = 1
+
+        # Percentages >= Q30 and yields can be calculated from the much smaller
+        # collapsed q-metrics, but these are not written by all instruments
+        if _has_collapsed_q_metrics(root):
+            valid_to_load[py_interop_run.QCollapsed] = 1
+        else:
+            valid_to_load[py_interop_run.Q] = 1
+
+        if "intensity" in requires:
+            valid_to_load[py_interop_run.Extraction] = 1
+
     # Load indexing metrics
     py_interop_run_metrics.list_index_metrics_to_load(valid_to_load)
 
@@ -61,6 +197,7 @@ def summarize(run_metrics):
     return summary, idx
 
 
+@_cached_plot_data
 def plot_by_cycle(metrics, metric):
     if metric not in consts.CYCLE_METRICS_BY_NAME:
         raise ValueError(metric)
@@ -73,6 +210,7 @@ def plot_by_cycle(metrics, metric):
     return data
 
 
+@_cached_plot_data
 def plot_by_lane(metrics, metric, read=None):
     if metric not in consts.LANE_METRICS_BY_NAME:
         raise ValueError(metric)
@@ -87,6 +225,7 @@ def plot_by_lane(metrics, metric, read=None):
     return data
 
 
+@_cached_plot_data
 def plot_by_flowcell(metrics, metric):
     if metric not in consts.FLOWCELL_METRICS_BY_NAME:
         raise ValueError(metric)
@@ -94,11 +233,23 @@ def plot_by_flowcell(metrics, metric):
     data = py_interop_plot.flowcell_data()
     options = _new_options(metrics)
 
-    py_interop_plot.plot_flowcell_map(metrics, metric, options, data)
+    if hasattr(py_interop_plot, "plot_flowcell_map2"):
+        # InterOp writes the values directly into the (flat) numpy buffers
+        size = py_interop_plot.calculate_flowcell_buffer_size(metrics, options)
+        values = numpy.zeros(size, dtype=numpy.float32)
+        tile_ids = numpy.zeros(size, dtype=numpy.uint32)
 
-    return data
+        py_interop_plot.plot_flowcell_map2(
+            metrics, metric, options, data, values, tile_ids
+        )
+    else:
+        py_interop_plot.plot_flowcell_map(metrics, metric, options, data)
+        values = _to_array(data)
 
+    return FlowcellArray(data, values[: data.length()])
 
+
+@_cached_plot_data
 def plot_qscore_histogram(metrics, read=0, acceptable_q=30):
     data = py_interop_plot.bar_plot_data()
     options = _new_options(metrics)
@@ -109,14 +260,31 @@ def plot_qscore_histogram(metrics, read=0, acceptable_q=30):
     return data
 
 
+@_cached_plot_data
 def plot_qscore_heatmap(metrics, lane=0):
     data = py_interop_plot.heatmap_data()
     options = _new_options(metrics)
     options.lane(lane)
 
-    py_interop_plot.plot_qscore_heatmap(metrics, options, data)
+    rows = py_interop_plot.count_rows_for_heatmap(metrics)
+    columns = py_interop_plot.count_columns_for_heatmap(metrics)
+    values = numpy.zeros(rows * columns, dtype=numpy.float32)
 
-    return data
+    try:
+        # InterOp writes the values directly into the numpy buffer
+        py_interop_plot.plot_qscore_heatmap(metrics, options, data, values)
+    except (TypeError, NotImplementedError):
+        # SWIG raises one of these if the overload is not supported
+        py_interop_plot.plot_qscore_heatmap(metrics, options, data)
+        values = _to_array(data)
+
+    return HeatmapArray(data, values[: data.length()])
+
+
+def _has_collapsed_q_metrics(root):
+    interop_dir = Path(root) / "InterOp"
+
+    return any((interop_dir / filename).is_file() for filename in _COLLAPSED_Q_METRICS)
 
 
 def _new_options(metrics):
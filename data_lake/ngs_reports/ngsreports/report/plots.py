@@ -10,8 +10,7 @@ import ngsreports.report.report as report
 
 
 from .constants import PLOT_LINE_WIDTH
-from .interop import iterop
-from .utils import split_into_blocks
+from .interop import candle_stick_arrays, iterop, line_arrays
 
 
 class NoMetricDataToPlot(Exception):
@@ -80,13 +79,11 @@ class PlotByCycle(InteropImage):
         for series in iterop(data):
             if series.series_type() == series.Candlestick:
                 colorprop = {"color": series.color()}
+                positions, values = candle_stick_arrays(series)
 
                 boxplot = ax.boxplot(
-                    [
-                        [it.lower(), it.p25(), it.p50(), it.p75(), it.upper()]
-                        for it in iterop(series)
-                    ],
-                    positions=[point.x() for point in iterop(series)],
+                    values,
+                    positions=positions,
                     manage_ticks=False,
                     whiskerprops=colorprop,
                     capprops=colorprop,
@@ -96,9 +93,10 @@ class PlotByCycle(InteropImage):
                 legend_labels.append(series.title())
                 legend_objects.extend(boxplot["boxes"])
             elif series.series_type() == series.Line:
+                x, y = line_arrays(series)
                 lines = ax.plot(
-                    [point.x() for point in iterop(series)],
-                    [point.y() for point in iterop(series)],
+                    x,
+                    y,
                     label=series.title(),
                     color=series.color(),
                     linewidth=PLOT_LINE_WIDTH,
@@ -125,16 +123,14 @@ class PlotByLane(InteropImage):
         colors = []
         for series in iterop(data):
             colorprop = {"color": series.color()}
-            if not any(iterop(series)):
+            positions, values = candle_stick_arrays(series)
+            if not len(positions):
                 raise NoMetricDataToPlot()
 
             result = ax.boxplot(
-                [
-                    [it.lower(), it.p25(), it.p50(), it.p75(), it.upper()]
-                    for it in iterop(series)
-                ],
-                positions=[point.x() for point in iterop(series)],
-                labels=[int(point.x()) for point in iterop(series)],
+                values,
+                positions=positions,
+                labels=positions.astype(int).tolist(),
                 whiskerprops=colorprop,
                 capprops=colorprop,
                 boxprops=colorprop,
@@ -150,11 +146,13 @@ class PlotByLane(InteropImage):
 
 
 class PlotByFlowCell(InteropImage):
+    render_mode = "raster"
+
     def _do_prepare_data(self, data, metric):
         return interop.plot_by_flowcell(data, metric)
 
     def _layout_subplots(self, data):
-        return (1, data.lane_count())
+        return (1, data.data.lane_count())
 
     def _do_draw_plot(self, fig, axs, data):
         # matplotlib will reduce dimensions by default
@@ -165,16 +163,11 @@ class PlotByFlowCell(InteropImage):
             "flowcell", ["#0000FF", "#00FFFE", "#FFFE00", "#FFA500"], N=1000
         )
 
-        nrows = data.tile_count()
-        values = list(iterop(data, size=data.length()))
-        columns = split_into_blocks(values, size=nrows)
-        lanes = split_into_blocks(columns, size=data.swath_count())
-
-        norm = matplotlib.colors.Normalize(vmin=min(values), vmax=max(values))
-
-        for ax, lane in zip(axs, lanes):
-            rows = list(zip(*lane))
+        # Array of (lanes, tiles, swaths)
+        lanes = data.values
+        norm = matplotlib.colors.Normalize(vmin=lanes.min(), vmax=lanes.max())
 
+        for ax, rows in zip(axs, lanes):
             im = ax.imshow(rows, interpolation="none", aspect="auto", cmap=cmap)
             im.set_norm(norm)
 
@@ -185,8 +178,8 @@ class PlotByFlowCell(InteropImage):
             ax.grid(which="major", color="black", linestyle="-", linewidth=0.5)
 
             # Center grid-lines between cells
-            ax.set_xticks([idx - 0.5 for idx in range(1, data.swath_count())])
-            ax.set_yticks([idx - 0.5 for idx in range(1, len(rows))])
+            ax.set_xticks([idx - 0.5 for idx in range(1, rows.shape[1])])
+            ax.set_yticks([idx - 0.5 for idx in range(1, rows.shape[0])])
 
             # Hide tickmarks and labels
             ax.set_xticklabels([])
@@ -222,6 +215,8 @@ class PlotQScoreHistogram(InteropImage):
 
 
 class PlotQScoreHeatmap(InteropImage):
+    render_mode = "raster"
+
     def _do_prepare_data(self, data, lane=0):
         return interop.plot_qscore_heatmap(data, lane=lane)
 
@@ -230,12 +225,8 @@ class PlotQScoreHeatmap(InteropImage):
             "wgyr", ["white", "green", "yellow", "red"], N=1000
         )
 
-        columns = data.column_count()
-        values = list(iterop(data, size=data.length()))
-        rows = list(zip(*split_into_blocks(values, size=columns)))
-
         im = ax.imshow(
-            rows,
+            data.values,
             interpolation="none",
             aspect="auto",
             cmap=cmap,
@@ -0,0 +1,174 @@
+import copy
+import logging
+import multiprocessing
+import os
+
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from .report import IMAGE_HEIGHT, IMAGE_WIDTH
+
+
+_LOG_NAME = "rendering"
+
+# InterOp objects shared with worker processes; these cannot be pickled, and are
+# instead inherited by workers when these are forked
+_SHARED = {}
+
+# Max relative difference in aspect ratios for a plot to be re-used when rescaled
+_MAX_ASPECT_DIFFERENCE = 0.01
+
+
+class PendingPlot:
+    """Plot that is being rendered; 'result' returns the finished DynamicImage or
+    raises the exception raised while rendering the plot (e.g. NoMetricDataToPlot).
+    A new copy of the plot, scaled to 'width' x 'height', is returned on each call,
+    so that the same plot may be added to multiple documents.
+    """
+
+    def __init__(self, future, width, height):
+        self.width = width
+        self.height = height
+        self._future = future
+
+    def result(self):
+        plot = copy.copy(self._future.result())
+        plot.drawWidth = self.width
+        plot.drawHeight = self.height
+
+        return plot
+
+
+class PlotPool:
+    """Renders DynamicImages in worker processes, allowing plots to be rendered
+    concurrently. InterOp objects passed to plots must be registered as 'shared'
+    keyword arguments, as they are inherited by the workers rather than pickled.
+    Plots are rendered in the calling process if 'workers' is 1 or less, or if
+    worker processes cannot be forked on this platform.
+
+    Plots are cached, so that identical plots requested by multiple reports are
+    only rendered once, and re-used if they only differ in size but not in aspect
+    ratio. Plots of the same data (i.e. the same type, metric, read, lane, etc.)
+    are always rendered by the same worker, so that the InterOp plot data cached by
+    'interop' is calculated once, even if the plot has to be drawn in several sizes.
+    """
+
+    def __init__(self, workers=None, **shared):
+        log = logging.getLogger(_LOG_NAME)
+
+        self._shared = shared
+        # Rendered plots by data key; each a list of (width, height, future)
+        self._plots = {}
+        # Index of the worker used for each data key
+        self._assigned = {}
+        self._executors = []
+        self._submitted = []
+
+        workers = os.cpu_count() if workers is None else workers
+        if workers > 1:
+            try:
+                context = multiprocessing.get_context("fork")
+            except ValueError:
+                log.warning("cannot fork; plots will be rendered sequentially")
+            else:
+                # Must be set before the workers are forked
+                _SHARED.clear()
+                _SHARED.update(shared)
+
+                for _ in range(workers):
+                    self._executors.append(ProcessPoolExecutor(1, mp_context=context))
+                    self._submitted.append(0)
+
+    def submit(self, cls, **kwargs):
+        """Starts rendering cls(**kwargs), unless an identical plot was already
+        requested; returns a PendingPlot.
+        """
+        width = kwargs.setdefault("width", IMAGE_WIDTH)
+        height = kwargs.setdefault("height", IMAGE_HEIGHT)
+
+        # Shared objects are replaced with their names
+        for key, value in kwargs.items():
+            for name, obj in self._shared.items():
+                if value is obj:
+                    kwargs[key] = _SharedObject(name)
+
+        data_key = _data_key(cls, kwargs)
+        plots = self._plots.setdefault(data_key, [])
+        for plot_width, plot_height, future in plots:
+            if _same_aspect_ratio(width / height, plot_width / plot_height):
+                return PendingPlot(future, width=width, height=height)
+
+        if self._executors:
+            idx = self._assigned.get(data_key)
+            if idx is None:
+                # New plot data is assigned to the least busy worker
+                idx = self._submitted.index(min(self._submitted))
+                self._assigned[data_key] = idx
+
+            self._submitted[idx] += 1
+            future = self._executors[idx].submit(_render_plot, cls, kwargs)
+        else:
+            future = Future()
+            try:
+                future.set_result(_render_plot(cls, kwargs, self._shared))
+            except Exception as error:
+                future.set_exception(error)
+
+        plots.append((width, height, future))
+
+        return PendingPlot(future, width=width, height=height)
+
+    def shutdown(self):
+        # Plots that have yet to be rendered are cancelled; 'cancel_futures' is not
+        # used, as it requires Python 3.9+
+        for plots in self._plots.values():
+            for _, _, future in plots:
+                future.cancel()
+
+        for executor in self._executors:
+            executor.shutdown()
+
+        if self._executors:
+            self._executors = []
+            _SHARED.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.shutdown()
+
+
+class _SharedObject:
+    def __init__(self, name):
+        self.name = name
+
+    def __eq__(self, other):
+        return isinstance(other, _SharedObject) and self.name == other.name
+
+    def __hash__(self):
+        return hash(self.name)
+
+
+def _data_key(cls, kwargs):
+    """Returns a key identifying the data plotted, i.e. ignoring the size of plots."""
+    options = []
+    for key, value in sorted(kwargs.items()):
+        if key not in ("width", "height"):
+            options.append((key, value))
+
+    return (cls, tuple(options))
+
+
+def _same_aspect_ratio(ratio_a, ratio_b):
+    return abs(ratio_a - ratio_b) <= _MAX_ASPECT_DIFFERENCE * max(ratio_a, ratio_b)
+
+
+def _render_plot(cls, kwargs, shared=None):
+    shared = _SHARED if shared is None else shared
+
+    kwargs = dict(kwargs)
+    for key, value in kwargs.items():
+        if isinstance(value, _SharedObject):
+            kwargs[key] = shared[value.name]
+
+    return cls(**kwargs)
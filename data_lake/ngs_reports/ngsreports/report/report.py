@@ -26,7 +26,17 @@ FONT_BOLD = tt2ps(FONT, 1, 0)
 FONT_ITALICS = tt2ps(FONT, 0, 1)
 
 
+# Default resolution of plots rendered as raster images
+RASTER_DPI = 150
+
+
 class DynamicImage(Image):
+    # Plots are embedded as vector drawings ("vector") or as PNGs ("raster") with a
+    # resolution of 'raster_dpi'; the latter avoids the slow SVG round-trip for
+    # plots that consist of images or many patches
+    render_mode = "vector"
+    raster_dpi = RASTER_DPI
+
     def __init__(self, width=IMAGE_WIDTH, height=IMAGE_HEIGHT, sharex=False, **kwargs):
         data = self._prepare_data(**kwargs)
         nrows, ncols = self._layout_subplots(data)
@@ -51,12 +61,24 @@ class DynamicImage(Image):
         raise NotImplementedError()
 
     def _render_to_rlg(self, figure):
+        if self.render_mode == "raster":
+            return self._render_to_png(figure)
+        elif self.render_mode != "vector":
+            raise ValueError(f"unknown render mode {self.render_mode!r}")
+
         data = io.BytesIO()
         figure.savefig(data, format="svg")
         data.seek(0)
 
         return svg2rlg(data)
 
+    def _render_to_png(self, figure):
+        data = io.BytesIO()
+        figure.savefig(data, format="png", dpi=self.raster_dpi)
+        data.seek(0)
+
+        return data
+
 
 class DocumentTitle(Flowable):
     def __init__(self, text, width=PAGE_WIDTH - 2 * inch):